@@ -42,6 +42,7 @@ class BrewingStats(models.Model):
         """Recalculate all statistics"""
         from brewing.models import BrewSession
         from recipes.models import Recipe
+        from recipes.costing import refresh_recipe_costs
         
         # Get all completed brew sessions
         sessions = BrewSession.objects.filter(
@@ -85,7 +86,10 @@ class BrewingStats(models.Model):
         # Cost stats (from recipes)
         user_recipes = Recipe.objects.filter(created_by=self.user)
         if user_recipes.exists():
-            total_recipe_cost = sum(recipe.total_cost() for recipe in user_recipes)
+            uncosted = user_recipes.filter(calculated_cost__isnull=True)
+            if uncosted.exists():
+                refresh_recipe_costs(uncosted)
+            total_recipe_cost = user_recipes.aggregate(total=Sum('calculated_cost'))['total'] or 0
             self.total_cost = total_recipe_cost
             
             if self.total_batches_liters > 0:
@@ -4,8 +4,10 @@ from django.db.models import Count, Avg, Sum, Q
 from django.http import JsonResponse
 from django.utils import timezone
 from datetime import timedelta
-from brewing.models import BrewSession, TemperatureReading, GravityReading
+from brewing.models import BrewSession
+from brewing.timeseries import fermentation_series, parse_max_points, temperature_points, gravity_points
 from recipes.models import Recipe
+from recipes.costing import refresh_recipe_costs
 from inventory.models import InventoryItem
 from core.models import BeerStyle
 from .models import BrewingStats
@@ -160,17 +162,25 @@ def cost_analysis(request):
     # Recipe costs
     recipes = Recipe.objects.filter(created_by=request.user)
     
-    cost_data = []
-    for recipe in recipes:
-        total_cost = recipe.total_cost()
-        cost_per_liter = total_cost / recipe.batch_size if recipe.batch_size > 0 else 0
-        cost_data.append({
-            'name': recipe.name,
-            'total_cost': float(total_cost),
-            'cost_per_liter': float(cost_per_liter),
-            'batch_size': recipe.batch_size,
-            'style': recipe.style.name
-        })
+    # Fill in stored costs for recipes that were never priced
+    uncosted = recipes.filter(calculated_cost__isnull=True)
+    if uncosted.exists():
+        refresh_recipe_costs(uncosted)
+    
+    recipe_costs = list(recipes.values(
+        'name', 'calculated_cost', 'calculated_cost_per_liter', 'batch_size', 'style__name'
+    ))
+    
+    cost_data = [
+        {
+            'name': recipe['name'],
+            'total_cost': recipe['calculated_cost'],
+            'cost_per_liter': recipe['calculated_cost_per_liter'],
+            'batch_size': recipe['batch_size'],
+            'style': recipe['style__name']
+        }
+        for recipe in recipe_costs
+    ]
     
     # Inventory value
     inventory_items = InventoryItem.objects.filter(user=request.user)
@@ -189,13 +199,12 @@ def cost_analysis(request):
     
     # Average costs by style
     style_costs = {}
-    for recipe in recipes:
-        style = recipe.style.name
-        cost_per_liter = recipe.total_cost() / recipe.batch_size if recipe.batch_size > 0 else 0
+    for recipe in recipe_costs:
+        style = recipe['style__name']
         
         if style not in style_costs:
             style_costs[style] = []
-        style_costs[style].append(float(cost_per_liter))
+        style_costs[style].append(recipe['calculated_cost_per_liter'])
     
     # Calculate averages
     avg_style_costs = {
@@ -209,7 +218,7 @@ def cost_analysis(request):
         'total_inventory_value': total_inventory_value,
         'ingredient_costs': json.dumps(ingredient_costs),
         'avg_style_costs': json.dumps(avg_style_costs),
-        'recipes_count': recipes.count(),
+        'recipes_count': len(recipe_costs),
     }
     
     return render(request, 'analytics/cost_analysis.html', context)
@@ -223,40 +232,19 @@ def fermentation_tracking(request):
         status='fermenting'
     )
     
-    # Temperature data for active fermentations
+    max_points = parse_max_points(request.GET.get('max_points'))
+    
+    # Temperature and gravity progression for active fermentations, downsampled (LTTB)
     temp_data = {}
+    gravity_data = {}
     for session in active_fermentations:
-        readings = TemperatureReading.objects.filter(
-            brew_session=session,
-            reading_type='fermentation'
-        ).order_by('timestamp')[:50]
+        temperatures, gravities = fermentation_series(session, max_points)
         
         temp_data[session.id] = {
             'batch_name': session.batch_name,
-            'readings': [
-                {
-                    'timestamp': reading.timestamp.isoformat(),
-                    'temperature': float(reading.temperature)
-                }
-                for reading in readings
-            ]
+            'readings': temperature_points(temperatures)
         }
-    
-    # Gravity progression for active fermentations
-    gravity_data = {}
-    for session in active_fermentations:
-        readings = GravityReading.objects.filter(
-            brew_session=session
-        ).order_by('timestamp')
-        
-        gravity_data[session.id] = [
-            {
-                'timestamp': reading.timestamp.isoformat(),
-                'gravity': float(reading.gravity),
-                'type': reading.reading_type
-            }
-            for reading in readings
-        ]
+        gravity_data[session.id] = gravity_points(gravities)
     
     # Fermentation statistics
     completed_fermentations = BrewSession.objects.filter(
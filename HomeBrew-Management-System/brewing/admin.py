@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BrewSession, BrewStepLog, TemperatureReading, GravityReading, BrewTimer
+from .models import BrewSession, BrewStepLog, TemperatureReading, GravityReading, BrewTimer, SensorDevice, ReadingChunk
 
 @admin.register(BrewSession)
 class BrewSessionAdmin(admin.ModelAdmin):
@@ -24,4 +24,18 @@ class TemperatureReadingAdmin(admin.ModelAdmin):
 class GravityReadingAdmin(admin.ModelAdmin):
     list_display = ['brew_session', 'gravity', 'reading_type', 'timestamp']
     list_filter = ['reading_type', 'timestamp']
-    search_fields = ['brew_session__batch_name']
\ No newline at end of file
+    search_fields = ['brew_session__batch_name']
+
+@admin.register(SensorDevice)
+class SensorDeviceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'owner', 'brew_session', 'is_active', 'last_seen_at']
+    list_filter = ['is_active', 'owner']
+    search_fields = ['name', 'owner__username']
+    readonly_fields = ['last_seen_at']
+
+@admin.register(ReadingChunk)
+class ReadingChunkAdmin(admin.ModelAdmin):
+    list_display = ['brew_session', 'kind', 'reading_type', 'day', 'count', 'start', 'end']
+    list_filter = ['kind', 'reading_type', 'day']
+    search_fields = ['brew_session__batch_name']
+    readonly_fields = ['data']
\ No newline at end of file
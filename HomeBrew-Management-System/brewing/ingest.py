@@ -0,0 +1,246 @@
+"""
+Bulk ingestion of sensor readings.
+
+Devices post many temperature and gravity readings, for one or several of
+their owner's brew sessions, in a single request. Readings are parsed and
+validated in memory (one query loads the sessions), then every valid
+reading is written with one bulk_create() per model in a single
+transaction (or packed into daily chunks for sessions with compact
+storage, see brewing.timeseries). Invalid readings are skipped and
+reported by their position, so one bad sample does not make a device
+resend the whole batch.
+
+A reading is a JSON object:
+
+    {"session": 12, "temperature": 19.5, "timestamp": "2024-05-01T10:00:00Z"}
+    {"session": 12, "gravity": 1.012, "temperature": 19.5, "reading_type": "progress"}
+
+Objects with a gravity are gravity readings (temperature is then the
+sample temperature), the others temperature readings. session defaults to
+the device's session, timestamp (ISO 8601 or Unix seconds) to the time of
+the request.
+"""
+import json
+import math
+from datetime import datetime, timezone as dt_timezone
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core.models import BrewingCalculator
+from core.utils import RecipeValidator
+from .models import BrewSession, TemperatureReading, GravityReading, SensorDevice
+from .timeseries import append_readings
+
+# Most readings accepted in one request
+MAX_READINGS = 10000
+
+# Largest primary key (BigAutoField)
+MAX_SESSION_ID = 2 ** 63 - 1
+
+TEMPERATURE_TYPES = {value for value, _ in TemperatureReading._meta.get_field('reading_type').choices}
+GRAVITY_TYPES = {value for value, _ in GravityReading._meta.get_field('reading_type').choices}
+NOTES_LENGTH = TemperatureReading._meta.get_field('notes').max_length
+
+# Placeholder for NDJSON lines that are not valid JSON
+INVALID_LINE = object()
+
+
+class ReadingParseError(ValueError):
+    """The request body is neither JSON readings nor NDJSON"""
+
+
+def parse_readings(body):
+    """
+    Reading objects from a request body: a JSON array, {"readings": [...]}
+    or NDJSON (one object per line). NDJSON lines that are not valid JSON
+    are returned as INVALID_LINE, so they are rejected on their own.
+    """
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ReadingParseError('Body must be UTF-8')
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        lines = [line for line in text.splitlines() if line.strip()]
+        if len(lines) < 2:
+            raise ReadingParseError('Invalid JSON data')
+        readings = []
+        for line in lines:
+            try:
+                readings.append(json.loads(line))
+            except json.JSONDecodeError:
+                readings.append(INVALID_LINE)
+        return readings
+
+    if isinstance(data, dict):
+        # {"readings": [...]} or a single reading
+        data = data['readings'] if 'readings' in data else [data]
+    if not isinstance(data, list):
+        raise ReadingParseError('Expected a list of readings')
+    return data
+
+
+def _number(value, field_name):
+    """value as a finite float"""
+    if isinstance(value, bool):
+        raise ValidationError(f"{field_name} must be a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{field_name} must be a number")
+    if not math.isfinite(number):
+        raise ValidationError(f"{field_name} must be a number")
+    return number
+
+
+def _timestamp(value, now):
+    """Reading time from ISO 8601 or Unix seconds; now when missing"""
+    if value is None:
+        return now
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValidationError("Invalid timestamp")
+    try:
+        timestamp = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise ValidationError("Invalid timestamp")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def _session_id(item, device):
+    """
+    Session id of a reading object (the device's session by default), or
+    None unless it is a whole number in the primary key range
+    """
+    value = item.get('session', device.brew_session_id)
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        session_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return session_id if 0 < session_id <= MAX_SESSION_ID else None
+
+
+def _reading(item, device, session_ids, now):
+    """Unsaved TemperatureReading or GravityReading for one object; ValidationError if invalid"""
+    if not isinstance(item, dict):
+        raise ValidationError("Expected a reading object")
+
+    session_id = _session_id(item, device)
+    if session_id not in session_ids:
+        raise ValidationError("Unknown brew session")
+    timestamp = _timestamp(item.get('timestamp'), now)
+    notes = str(item.get('notes') or '')[:NOTES_LENGTH]
+    temperature = item.get('temperature')
+    if temperature is not None:
+        temperature = RecipeValidator.validate_temperature(_number(temperature, "Temperature"))
+
+    if item.get('gravity') is not None:
+        reading_type = item.get('reading_type', 'progress')
+        if reading_type not in GRAVITY_TYPES:
+            raise ValidationError(f"Invalid gravity reading type: {reading_type}")
+        return GravityReading(
+            brew_session_id=session_id, timestamp=timestamp, reading_type=reading_type, notes=notes,
+            gravity=RecipeValidator.validate_gravity(_number(item['gravity'], "Gravity"), "Gravity"),
+            temperature=temperature
+        )
+
+    if temperature is None:
+        raise ValidationError("Expected a temperature or gravity value")
+    reading_type = item.get('reading_type', 'fermentation')
+    if reading_type not in TEMPERATURE_TYPES:
+        raise ValidationError(f"Invalid temperature reading type: {reading_type}")
+    return TemperatureReading(
+        brew_session_id=session_id, timestamp=timestamp, reading_type=reading_type, notes=notes,
+        temperature=temperature
+    )
+
+
+def _update_session_gravities(gravity_readings):
+    """
+    Apply the latest original and final gravity reading of each session to
+    the session, like add_gravity_reading does for single readings
+    """
+    latest = {}
+    for reading in gravity_readings:
+        if reading.reading_type in ('original', 'final'):
+            key = (reading.brew_session_id, reading.reading_type)
+            if key not in latest or reading.timestamp >= latest[key].timestamp:
+                latest[key] = reading
+    if not latest:
+        return
+
+    sessions = BrewSession.objects.in_bulk({session_id for session_id, _ in latest})
+    for session in sessions.values():
+        original = latest.get((session.pk, 'original'))
+        final = latest.get((session.pk, 'final'))
+        if original:
+            session.actual_og = original.gravity
+        if final:
+            session.actual_fg = final.gravity
+            if session.actual_og:
+                session.actual_abv = BrewingCalculator.calculate_abv(session.actual_og, final.gravity)
+    BrewSession.objects.bulk_update(sessions.values(), ['actual_og', 'actual_fg', 'actual_abv'])
+
+
+def ingest_readings(device, items, now=None):
+    """
+    Validate and save readings posted by device.
+
+    Readings may only target sessions of the device's owner. Returns
+    (saved, rejected): the number of saved readings per kind
+    ({'temperature': n, 'gravity': n}) and [{'index', 'error'}] for the
+    readings that were skipped.
+    """
+    now = now or timezone.now()
+    session_ids = {_session_id(item, device) for item in items if isinstance(item, dict)}
+    session_ids.discard(None)
+    # Sessions of the owner that the readings refer to, with their reading storage
+    storage = dict(
+        BrewSession.objects.filter(pk__in=session_ids, brewer_id=device.owner_id)
+        .values_list('pk', 'reading_storage')
+    ) if session_ids else {}
+
+    temperature_readings = []
+    gravity_readings = []
+    rejected = []
+    for index, item in enumerate(items):
+        if item is INVALID_LINE:
+            rejected.append({'index': index, 'error': 'Invalid JSON data'})
+            continue
+        try:
+            reading = _reading(item, device, storage, now)
+        except ValidationError as e:
+            rejected.append({'index': index, 'error': e.messages[0]})
+            continue
+        if isinstance(reading, GravityReading):
+            gravity_readings.append(reading)
+        else:
+            temperature_readings.append(reading)
+
+    with transaction.atomic():
+        # Sessions with compact storage get their readings packed into chunks
+        append_readings(
+            reading for reading in temperature_readings + gravity_readings
+            if storage[reading.brew_session_id] == 'chunks'
+        )
+        TemperatureReading.objects.bulk_create(
+            [reading for reading in temperature_readings if storage[reading.brew_session_id] == 'rows']
+        )
+        GravityReading.objects.bulk_create(
+            [reading for reading in gravity_readings if storage[reading.brew_session_id] == 'rows']
+        )
+        _update_session_gravities(gravity_readings)
+        SensorDevice.objects.filter(pk=device.pk).update(last_seen_at=now)
+
+    return {'temperature': len(temperature_readings), 'gravity': len(gravity_readings)}, rejected
@@ -0,0 +1,72 @@
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from brewing.timeseries import (
+    columnar_series, downsample, gravity_points, temperature_points, COLUMNAR_DECIMALS, DEFAULT_CHART_POINTS
+)
+
+
+def synthetic_series(minutes, rng):
+    """A fermentation's temperature and gravity series, one reading a minute"""
+    start = np.datetime64('2024-05-01T08:00:00', 'us')
+    timestamps = start + np.arange(minutes) * np.timedelta64(60, 's') + rng.integers(0, 10 ** 6, minutes).astype('timedelta64[us]')
+    types = np.full(minutes, 'progress', dtype='<U8')
+    types[0] = 'original'
+    temperatures = {
+        'timestamp': timestamps,
+        'value': 19 + rng.normal(0, 0.3, minutes),
+        'reading_type': np.full(minutes, 'fermentation'),
+    }
+    gravities = {
+        'timestamp': timestamps,
+        'value': 1.012 + 0.040 * np.exp(-np.arange(minutes) / (3 * 24 * 60)),
+        'reading_type': types,
+        'temperature': temperatures['value'],
+    }
+    return temperatures, gravities
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and serialization time of the point and columnar chart payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=21, help='Days of readings, one a minute')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported)')
+
+    def handle(self, *args, **options):
+        minutes = max(1, options['days']) * 24 * 60
+        temperatures, gravities = synthetic_series(minutes, np.random.default_rng(0))
+        self.stdout.write(f'{options["days"]} days, {minutes} readings per series')
+        self.stdout.write(f'{"Payload":28} {"Bytes":>10} {"Serialize (ms)":>15}')
+
+        for label, max_points in (('all readings', None), (f'downsampled to {DEFAULT_CHART_POINTS}', DEFAULT_CHART_POINTS)):
+            series = (temperatures, gravities)
+            if max_points:
+                series = (downsample(temperatures, max_points), downsample(gravities, max_points))
+            results = {}
+            for name, build in (
+                ('points', lambda: {
+                    'temperature_data': temperature_points(series[0]),
+                    'gravity_data': gravity_points(series[1]),
+                }),
+                ('columnar', lambda: {
+                    'format': 'columnar',
+                    'temperature_data': columnar_series(series[0], COLUMNAR_DECIMALS['temperature']),
+                    'gravity_data': columnar_series(series[1], COLUMNAR_DECIMALS['gravity']),
+                }),
+            ):
+                best = float('inf')
+                for _ in range(max(1, options['repeat'])):
+                    start = time.perf_counter()
+                    # JsonResponse serializes with DjangoJSONEncoder
+                    payload = json.dumps(build(), cls=DjangoJSONEncoder).encode()
+                    best = min(best, time.perf_counter() - start)
+                results[name] = (len(payload), best)
+                self.stdout.write(f'{label + ", " + name:28} {len(payload):10d} {best * 1000:15.1f}')
+
+            points, columnar = results['points'], results['columnar']
+            self.stdout.write(
+                f'{"":28} {points[0] / columnar[0]:9.1f}x {points[1] / max(columnar[1], 1e-9):14.1f}x'
+            )
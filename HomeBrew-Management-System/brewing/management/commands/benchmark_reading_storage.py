@@ -0,0 +1,114 @@
+import time
+from datetime import timedelta
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from brewing.models import BrewSession, TemperatureReading, GravityReading, ReadingChunk
+from brewing.timeseries import append_readings, read_series
+
+
+def table_bytes(table):
+    """Bytes used by a table and its indexes (None without SQLite's dbstat)"""
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                [table, table]
+            )
+        except Exception:
+            return None
+        return cursor.fetchone()[0] or 0
+
+
+class Command(BaseCommand):
+    help = 'Compare row-based and chunked storage of fermentation readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, help='Brew session used for the benchmark (default: the latest)')
+        parser.add_argument('--days', type=int, default=21, help='Days of readings, one temperature and gravity a minute')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Readings written per batch')
+
+    def handle(self, *args, **options):
+        sessions = BrewSession.objects.order_by('-pk')
+        session = sessions.filter(pk=options['session']).first() if options['session'] else sessions.first()
+        if session is None:
+            raise CommandError('No brew session to benchmark with')
+
+        minutes = max(1, options['days']) * 24 * 60
+        end = timezone.now().replace(second=0, microsecond=0)
+        start = end - timedelta(minutes=minutes - 1)
+        timestamps = [start + timedelta(minutes=minute) for minute in range(minutes)]
+        rng = np.random.default_rng(0)
+        temperatures = 19 + rng.normal(0, 0.2, minutes)
+        gravities = 1.012 + 0.038 * np.exp(-np.arange(minutes) / (3 * 24 * 60))
+
+        def readings():
+            for timestamp, temperature, gravity in zip(timestamps, temperatures.tolist(), gravities.tolist()):
+                yield TemperatureReading(brew_session=session, timestamp=timestamp, temperature=temperature,
+                                         reading_type='fermentation')
+                yield GravityReading(brew_session=session, timestamp=timestamp, gravity=gravity,
+                                     temperature=temperature, reading_type='progress')
+
+        last_temperature = TemperatureReading.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        last_gravity = GravityReading.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        last_chunk = ReadingChunk.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        def clean_up():
+            """Remove the benchmark readings"""
+            TemperatureReading.objects.filter(pk__gt=last_temperature, brew_session=session).delete()
+            GravityReading.objects.filter(pk__gt=last_gravity, brew_session=session).delete()
+            ReadingChunk.objects.filter(pk__gt=last_chunk, brew_session=session).delete()
+
+        self.stdout.write(f'{minutes * 2} readings ({options["days"]} days of temperature and gravity each minute)')
+        self.stdout.write(f'{"Storage":8} {"Write/s":>10} {"Bytes/reading":>14} {"Read 1 day (ms)":>16} {"Read all (ms)":>14}')
+
+        try:
+            for storage, tables in (
+                ('rows', ['brewing_temperaturereading', 'brewing_gravityreading']),
+                ('chunks', ['brewing_readingchunk']),
+            ):
+                sizes_before = [table_bytes(table) for table in tables]
+                start_time = time.perf_counter()
+                batch = []
+                for reading in readings():
+                    batch.append(reading)
+                    if len(batch) >= options['batch_size']:
+                        self.write(storage, batch)
+                        batch = []
+                self.write(storage, batch)
+                write_time = time.perf_counter() - start_time
+
+                sizes = [table_bytes(table) for table in tables]
+                if None in sizes + sizes_before:
+                    per_reading = 'n/a'
+                else:
+                    per_reading = f'{(sum(sizes) - sum(sizes_before)) / (minutes * 2):.1f}'
+
+                day_time = self.read_time(session, end - timedelta(days=1), end)
+                all_time = self.read_time(session, None, None)
+                self.stdout.write(
+                    f'{storage:8} {minutes * 2 / write_time:10.0f} {per_reading:>14} '
+                    f'{day_time * 1000:16.1f} {all_time * 1000:14.1f}'
+                )
+                clean_up()
+        finally:
+            # Leave the database as it was
+            clean_up()
+
+    def write(self, storage, batch):
+        if storage == 'chunks':
+            append_readings(batch)
+            return
+        TemperatureReading.objects.bulk_create([reading for reading in batch if isinstance(reading, TemperatureReading)])
+        GravityReading.objects.bulk_create([reading for reading in batch if isinstance(reading, GravityReading)])
+
+    def read_time(self, session, start, end):
+        """Time to read the temperature and gravity series of a range"""
+        start_time = time.perf_counter()
+        read_series(session, 'temperature', start, end)
+        read_series(session, 'gravity', start, end)
+        return time.perf_counter() - start_time
@@ -0,0 +1,73 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+from brewing.models import BrewSession, TemperatureReading, GravityReading, SensorDevice
+from brewing.ingest import ingest_readings, parse_readings
+
+
+class Command(BaseCommand):
+    help = 'Compare one insert per reading with the bulk sensor ingestion path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, help='Brew session that receives the readings (default: the latest)')
+        parser.add_argument('--readings', type=int, default=10000, help='Number of readings to ingest in bulk')
+        parser.add_argument('--loop-readings', type=int, default=500,
+                            help='Number of readings inserted one at a time')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Readings per bulk request')
+
+    def handle(self, *args, **options):
+        sessions = BrewSession.objects.order_by('-pk')
+        session = sessions.filter(pk=options['session']).first() if options['session'] else sessions.first()
+        if session is None:
+            raise CommandError('No brew session to benchmark with')
+
+        device, _ = SensorDevice.create_with_token(session.brewer, 'Benchmark device', brew_session=session)
+        first_temperature = TemperatureReading.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        first_gravity = GravityReading.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        try:
+            self.run(session, device, options)
+        finally:
+            # Leave the database as it was
+            TemperatureReading.objects.filter(pk__gt=first_temperature, brew_session=session).delete()
+            GravityReading.objects.filter(pk__gt=first_gravity, brew_session=session).delete()
+            device.delete()
+
+    def run(self, session, device, options):
+        count = max(1, options['readings'])
+        loop_count = max(1, min(options['loop_readings'], count))
+        batch_size = max(1, options['batch_size'])
+        start_time = timezone.now() - timedelta(minutes=count)
+
+        # One autocommitted insert per reading, like add_temperature_reading
+        start = time.perf_counter()
+        for minute in range(loop_count):
+            TemperatureReading.objects.create(
+                brew_session=session, timestamp=start_time + timedelta(minutes=minute),
+                temperature=18 + minute % 10 / 10, reading_type='fermentation'
+            )
+        loop_time = time.perf_counter() - start
+
+        # NDJSON batches through the parser, validation and bulk insert
+        lines = [
+            json.dumps({'temperature': 18 + minute % 10 / 10, 'timestamp': (start_time + timedelta(minutes=minute)).isoformat()})
+            if minute % 2 else
+            json.dumps({'gravity': 1.050 - minute % 40 / 1000, 'temperature': 19.0, 'timestamp': (start_time + timedelta(minutes=minute)).isoformat()})
+            for minute in range(count)
+        ]
+        bodies = ['\n'.join(lines[index:index + batch_size]).encode() for index in range(0, count, batch_size)]
+        saved = 0
+        start = time.perf_counter()
+        for body in bodies:
+            result, rejected = ingest_readings(device, parse_readings(body))
+            saved += sum(result.values())
+        bulk_time = time.perf_counter() - start
+
+        self.stdout.write(f'One insert per reading: {loop_count / loop_time:10.0f} readings/s ({loop_count} readings)')
+        self.stdout.write(
+            f'Bulk ingestion:         {saved / bulk_time:10.0f} readings/s '
+            f'({saved} readings in {len(bodies)} requests of {batch_size})'
+        )
+        if saved != count:
+            self.stdout.write(self.style.ERROR(f'{count - saved} readings were rejected'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from brewing.models import BrewSession, ReadingChunk
+from brewing.timeseries import compact_session
+
+
+class Command(BaseCommand):
+    help = 'Switch brew sessions to compact chunked reading storage and pack their existing readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, action='append', help='Brew session id (repeatable)')
+        parser.add_argument('--fermenting', action='store_true', help='All sessions that are fermenting')
+
+    def handle(self, *args, **options):
+        sessions = BrewSession.objects.none()
+        if options['session']:
+            sessions = BrewSession.objects.filter(pk__in=options['session'])
+        if options['fermenting']:
+            sessions = sessions | BrewSession.objects.filter(status='fermenting')
+        if not options['session'] and not options['fermenting']:
+            raise CommandError('Pass --session or --fermenting')
+
+        for session in sessions.order_by('pk'):
+            packed = compact_session(session)
+            chunks = ReadingChunk.objects.filter(brew_session=session).count()
+            self.stdout.write(f'{session.batch_name}: packed {packed} readings, {chunks} chunks')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from brewing.models import BrewSession, SensorDevice
+
+
+class Command(BaseCommand):
+    help = 'Register a fermentation sensor and print its token for the bulk readings API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username of the device owner')
+        parser.add_argument('--name', required=True, help='Device name')
+        parser.add_argument('--session', type=int, help='Brew session of readings posted without a session')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('User does not exist')
+
+        session = None
+        if options['session']:
+            try:
+                session = BrewSession.objects.get(pk=options['session'], brewer=owner)
+            except BrewSession.DoesNotExist:
+                raise CommandError('Brew session does not exist or belongs to another user')
+
+        device, token = SensorDevice.create_with_token(owner, options['name'], brew_session=session)
+        self.stdout.write(self.style.SUCCESS(f'Created sensor device "{device.name}" (id {device.pk})'))
+        self.stdout.write(f'Token (shown only once): {token}')
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-17 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brewing', '0003_sensor_devices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brewsession',
+            name='reading_storage',
+            field=models.CharField(choices=[('rows', 'One row per reading'), ('chunks', 'Compact daily chunks')], default='rows', help_text='How readings from sensor devices are stored', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ReadingChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('temperature', 'Temperature'), ('gravity', 'Gravity')], max_length=20)),
+                ('reading_type', models.CharField(max_length=20)),
+                ('day', models.DateField(help_text='UTC day of the readings')),
+                ('start', models.DateTimeField(help_text='First reading')),
+                ('end', models.DateTimeField(help_text='Last reading')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('brew_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='brewing.brewsession')),
+            ],
+            options={
+                'ordering': ['start'],
+                'indexes': [models.Index(fields=['brew_session', 'kind', 'end'], name='brewing_rea_brew_se_651e9e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('brew_session', 'kind', 'reading_type', 'day'), name='brewing_reading_chunk_day')],
+            },
+        ),
+    ]
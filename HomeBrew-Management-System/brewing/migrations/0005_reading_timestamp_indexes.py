@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-17 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brewing', '0004_reading_chunks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gravityreading',
+            index=models.Index(fields=['brew_session', 'timestamp'], name='brewing_gra_brew_se_747938_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='temperaturereading',
+            index=models.Index(fields=['brew_session', 'timestamp'], name='brewing_tem_brew_se_72dfdf_idx'),
+        ),
+    ]
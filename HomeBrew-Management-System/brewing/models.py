@@ -3,6 +3,8 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+import hashlib
+import secrets
 from core.models import TimeStampedModel
 from recipes.models import Recipe
 
@@ -32,6 +34,11 @@ class BrewSession(TimeStampedModel):
         ('completed', 'Completed'),
     ]
     
+    READING_STORAGES = [
+        ('rows', 'One row per reading'),
+        ('chunks', 'Compact daily chunks'),
+    ]
+    
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     brewer = models.ForeignKey(User, on_delete=models.CASCADE)
     
@@ -62,6 +69,12 @@ class BrewSession(TimeStampedModel):
     # Files
     photo = models.ImageField(upload_to='brew_sessions/', blank=True)
     
+    # Sensor readings
+    reading_storage = models.CharField(
+        max_length=10, choices=READING_STORAGES, default='rows',
+        help_text="How readings from sensor devices are stored"
+    )
+    
     class Meta:
         ordering = ['-brew_date']
     
@@ -104,12 +117,14 @@ class BrewSession(TimeStampedModel):
         return None
     
     def get_current_temperature_reading(self):
-        """Get latest temperature reading"""
-        return self.temperaturereading_set.order_by('-timestamp').first()
+        """Get latest temperature reading (from rows or compact chunks)"""
+        from .timeseries import latest_reading
+        return latest_reading(self, 'temperature')
     
     def get_current_gravity_reading(self):
-        """Get latest gravity reading"""
-        return self.gravityreading_set.order_by('-timestamp').first()
+        """Get latest gravity reading (from rows or compact chunks)"""
+        from .timeseries import latest_reading
+        return latest_reading(self, 'gravity')
     
     def get_fermentation_progress(self):
         """Calculate fermentation progress percentage"""
@@ -184,6 +199,7 @@ class TemperatureReading(TimeStampedModel):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [models.Index(fields=['brew_session', 'timestamp'])]
     
     def __str__(self):
         return f"{self.brew_session.batch_name} - {self.temperature}°C"
@@ -205,6 +221,7 @@ class GravityReading(TimeStampedModel):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [models.Index(fields=['brew_session', 'timestamp'])]
     
     def __str__(self):
         return f"{self.brew_session.batch_name} - SG {self.gravity}"
@@ -218,6 +235,41 @@ class GravityReading(TimeStampedModel):
             return self.gravity + correction
         return self.gravity
 
+class ReadingChunk(TimeStampedModel):
+    """
+    One day of sensor readings of a session, packed into a binary column
+    (see brewing.timeseries): millisecond timestamp deltas and float32
+    values, plus the sample temperatures of gravity readings. Used by
+    sessions with compact reading storage instead of one row per reading.
+    """
+    KINDS = [
+        ('temperature', 'Temperature'),
+        ('gravity', 'Gravity'),
+    ]
+    
+    brew_session = models.ForeignKey(BrewSession, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KINDS)
+    reading_type = models.CharField(max_length=20)
+    day = models.DateField(help_text="UTC day of the readings")
+    start = models.DateTimeField(help_text="First reading")
+    end = models.DateTimeField(help_text="Last reading")
+    count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+    
+    class Meta:
+        ordering = ['start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['brew_session', 'kind', 'reading_type', 'day'], name='brewing_reading_chunk_day'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['brew_session', 'kind', 'end']),
+        ]
+    
+    def __str__(self):
+        return f"{self.brew_session.batch_name} - {self.kind} {self.day} ({self.count})"
+
 class BrewTimer(TimeStampedModel):
     """
     Active timers for brewing steps
@@ -332,4 +384,47 @@ class FermentationAlert(TimeStampedModel):
     @property
     def is_due(self):
         """Check if alert is due"""
-        return timezone.now() >= self.alert_date and not self.is_dismissed
\ No newline at end of file
+        return timezone.now() >= self.alert_date and not self.is_dismissed
+
+class SensorDevice(TimeStampedModel):
+    """
+    Fermentation sensor (probe, digital hydrometer) that posts readings to
+    the bulk ingestion API with its own token. Only a hash of the token is
+    stored; the token itself is shown once, when the device is created.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+    token_hash = models.CharField(max_length=64, unique=True, editable=False)
+    brew_session = models.ForeignKey(
+        BrewSession, on_delete=models.SET_NULL, null=True, blank=True,
+        help_text="Session of readings posted without a session"
+    )
+    is_active = models.BooleanField(default=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.owner.username})"
+    
+    @staticmethod
+    def hash_token(token):
+        """SHA-256 hex digest of a device token"""
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    @classmethod
+    def create_with_token(cls, owner, name, brew_session=None):
+        """Create a device with a new random token; returns (device, token)"""
+        token = secrets.token_urlsafe(32)
+        device = cls.objects.create(
+            owner=owner, name=name, brew_session=brew_session, token_hash=cls.hash_token(token)
+        )
+        return device, token
+    
+    @classmethod
+    def authenticate(cls, token):
+        """The active device with this token, or None"""
+        if not token:
+            return None
+        return cls.objects.filter(token_hash=cls.hash_token(token), is_active=True).select_related('owner').first()
\ No newline at end of file
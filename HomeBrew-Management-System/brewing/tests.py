@@ -1,3 +1,353 @@
+import base64
+import json
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from core.models import BeerStyle
+from recipes.models import Recipe
+from .ingest import MAX_SESSION_ID, ingest_readings
+from .models import BrewSession, BrewTimer, SensorDevice, TemperatureReading, GravityReading, ReadingChunk
+from .timeseries import (append_readings, compact_session, decode_chunk, encode_chunk, lttb_indices, parse_max_points,
+                         read_series, recent_readings, MAX_CHART_POINTS)
 
-# Create your tests here.
+
+class BrewingTestData:
+    """A brewer with one brew session and a sensor device for it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('brewer', password='secret')
+        cls.other_user = User.objects.create_user('other', password='secret')
+        style = BeerStyle.objects.create(
+            name='American Pale Ale', style_code='18B', description='Hoppy pale ale',
+            og_min=1.045, og_max=1.060, fg_min=1.010, fg_max=1.015, ibu_min=30, ibu_max=50,
+            srm_min=5, srm_max=10, abv_min=4.5, abv_max=6.2
+        )
+        cls.recipe = Recipe.objects.create(name='Pale Ale', style=style, created_by=cls.user, batch_size=20.0)
+        cls.session = BrewSession.objects.create(recipe=cls.recipe, brewer=cls.user, batch_name='Batch 1')
+        cls.other_session = BrewSession.objects.create(recipe=cls.recipe, brewer=cls.other_user, batch_name='Other')
+        cls.device, cls.token = SensorDevice.create_with_token(cls.user, 'Probe', cls.session)
+
+    def at(self, hour, day=1, minute=0):
+        return datetime(2024, 5, day, hour, minute, tzinfo=dt_timezone.utc)
+
+    def temperature(self, hour, value, day=1, **fields):
+        return TemperatureReading(
+            brew_session=self.session, timestamp=self.at(hour, day), temperature=value,
+            reading_type=fields.pop('reading_type', 'fermentation'), **fields
+        )
+
+    def gravity(self, hour, value, day=1, **fields):
+        return GravityReading(
+            brew_session=self.session, timestamp=self.at(hour, day), gravity=value,
+            reading_type=fields.pop('reading_type', 'progress'), **fields
+        )
+
+
+class IngestReadingsTests(BrewingTestData, TestCase):
+    def test_invalid_readings_are_rejected_by_index(self):
+        items = [
+            {'temperature': 19.5, 'timestamp': '2024-05-01T10:00:00Z'},
+            {'session': self.session.pk, 'gravity': 1.050, 'reading_type': 'original'},
+            {'session': 10 ** 30, 'temperature': 19.0},
+            {'session': MAX_SESSION_ID + 1, 'temperature': 19.0},
+            {'session': self.session.pk + 0.7, 'temperature': 19.0},
+            {'session': True, 'temperature': 19.0},
+            {'session': 0, 'temperature': 19.0},
+            {'session': -self.session.pk, 'temperature': 19.0},
+            {'session': self.other_session.pk, 'temperature': 19.0},
+            {'session': self.session.pk, 'temperature': 'warm'},
+            {'session': float(self.session.pk), 'temperature': 20.0},
+        ]
+        saved, rejected = ingest_readings(self.device, items)
+
+        self.assertEqual(saved, {'temperature': 2, 'gravity': 1})
+        self.assertEqual([entry['index'] for entry in rejected], list(range(2, 10)))
+        self.assertEqual(rejected[0]['error'], 'Unknown brew session')
+        self.assertEqual(TemperatureReading.objects.filter(brew_session=self.session).count(), 2)
+        self.assertEqual(GravityReading.objects.get(brew_session=self.session).gravity, 1.050)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.actual_og, 1.050)
+
+    def test_api_accepts_partly_valid_batches(self):
+        body = '\n'.join([
+            json.dumps({'temperature': 19.5}),
+            'not json',
+            json.dumps({'session': 10 ** 30, 'temperature': 19.0}),
+        ])
+        response = self.client.post(
+            reverse('ingest_sensor_readings'), body, content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=f'Bearer {self.token}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rejected'], [
+            {'index': 1, 'error': 'Invalid JSON data'},
+            {'index': 2, 'error': 'Unknown brew session'},
+        ])
+
+    def test_api_rejects_batches_without_valid_readings(self):
+        response = self.client.post(
+            reverse('ingest_sensor_readings'), json.dumps([{'session': 10 ** 30, 'temperature': 19.0}]),
+            content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.token}'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TemperatureReading.objects.count(), 0)
+
+
+class ReadingChunkTests(BrewingTestData, TestCase):
+    def test_encode_decode_round_trip(self):
+        day = self.at(0).date()
+        timestamps = [int(self.at(hour, minute=7).timestamp() * 1000) + 123 for hour in range(24)]
+        values = [1.050 - hour * 0.001 for hour in range(24)]
+        temperatures = [19.5] * 23 + [float('nan')]
+        chunk = ReadingChunk(kind='gravity', day=day, count=24,
+                             data=encode_chunk('gravity', day, timestamps, values, temperatures))
+
+        decoded_timestamps, decoded_values, decoded_temperatures = decode_chunk(chunk)
+        self.assertEqual(decoded_timestamps.tolist(), timestamps)
+        self.assertEqual(decoded_values.tolist(), [round(value, 3) for value in values])
+        self.assertEqual(decoded_temperatures[:23].tolist(), [19.5] * 23)
+        self.assertTrue(decoded_temperatures[23] != decoded_temperatures[23])
+
+    def test_appends_merge_into_daily_chunks(self):
+        append_readings([self.temperature(12, 20.0), self.temperature(2, 18.0, day=2)])
+        append_readings([self.temperature(8, 19.0), self.gravity(9, 1.040, temperature=19.0)])
+
+        self.assertEqual(ReadingChunk.objects.filter(kind='temperature').count(), 2)
+        series = read_series(self.session, 'temperature')
+        self.assertEqual(series['value'].tolist(), [19.0, 20.0, 18.0])
+        gravity = read_series(self.session, 'gravity')
+        self.assertEqual(gravity['value'].tolist(), [1.040])
+        self.assertEqual(gravity['temperature'].tolist(), [19.0])
+
+    def test_retries_when_a_concurrent_ingest_created_the_chunk(self):
+        append_readings([self.temperature(12, 20.0)])
+        select_for_update = ReadingChunk.objects.select_for_update
+        calls = []
+
+        def stale_read():
+            # The first attempt misses the chunk, like a concurrent ingest committing it meanwhile
+            calls.append(1)
+            return ReadingChunk.objects.none() if len(calls) == 1 else select_for_update()
+
+        with mock.patch.object(ReadingChunk.objects, 'select_for_update', side_effect=stale_read):
+            self.assertEqual(append_readings([self.temperature(8, 19.0)]), 1)
+
+        self.assertEqual(len(calls), 2)
+        chunk = ReadingChunk.objects.get()
+        self.assertEqual(chunk.count, 2)
+        self.assertEqual(decode_chunk(chunk)[1].tolist(), [19.0, 20.0])
+
+    def test_recent_readings_merge_rows_and_chunks(self):
+        TemperatureReading.objects.create(
+            brew_session=self.session, timestamp=self.at(10), temperature=21.0, reading_type='fermentation',
+            notes='Heater on'
+        )
+        append_readings([self.temperature(hour, 18.0 + hour / 10) for hour in (6, 8, 12)])
+        append_readings([self.temperature(3, 17.0, day=2, reading_type='mash')])
+
+        readings = recent_readings(self.session, 'temperature', 3)
+        self.assertEqual([reading.temperature for reading in readings], [17.0, 19.2, 21.0])
+        fermentation = recent_readings(self.session, 'temperature', 10, reading_type='fermentation')
+        self.assertEqual([reading.timestamp.hour for reading in fermentation], [12, 10, 8, 6])
+        self.assertEqual(self.session.get_current_temperature_reading().temperature, 17.0)
+
+
+class SessionReadingViewTests(BrewingTestData, TestCase):
+    def setUp(self):
+        self.client.login(username='brewer', password='secret')
+        TemperatureReading.objects.bulk_create([self.temperature(hour, 18.0 + hour / 10) for hour in range(12)])
+        GravityReading.objects.bulk_create([self.gravity(0, 1.050, reading_type='original'), self.gravity(11, 1.030)])
+        compact_session(self.session)
+
+    def test_compacted_session_shows_recent_readings(self):
+        self.assertFalse(TemperatureReading.objects.exists())
+        response = self.client.get(reverse('brew_session_detail', args=[self.session.pk]))
+        self.assertEqual([reading.temperature for reading in response.context['temp_readings']][:3], [19.1, 19.0, 18.9])
+        self.assertEqual([reading.gravity for reading in response.context['gravity_readings']], [1.030, 1.050])
+        self.assertContains(response, '19.1°C')
+
+    def test_fermentation_detail_shows_chunked_readings(self):
+        response = self.client.get(reverse('fermentation_detail', args=[self.session.pk]))
+        self.assertEqual(len(response.context['temp_readings']), 12)
+        self.assertEqual(response.context['gravity_readings'][0].gravity, 1.030)
+
+
+class ChartCursorTests(BrewingTestData, TestCase):
+    def setUp(self):
+        self.client.login(username='brewer', password='secret')
+
+    def chart(self, session, **params):
+        response = self.client.get(reverse('fermentation_chart_data', args=[session.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ingest(self, session, *times):
+        saved, rejected = ingest_readings(self.device, [
+            {'session': session.pk, 'temperature': 18.0 + hour, 'timestamp': self.at(hour, minute=minute).isoformat()}
+            for hour, minute in times
+        ])
+        self.assertEqual(rejected, [])
+
+    def times(self, data):
+        return [point['timestamp'][11:16] for point in data['temperature_data']]
+
+    def test_resume_returns_new_and_late_readings(self):
+        for storage in ('rows', 'chunks'):
+            session = BrewSession.objects.create(
+                recipe=self.recipe, brewer=self.user, batch_name=storage, reading_storage=storage
+            )
+            self.ingest(session, *((hour, 0) for hour in range(6)))
+            first = self.chart(session)
+            self.assertEqual(len(first['temperature_data']), 6)
+            self.assertEqual(first['replace_from'], {'temperature': None, 'gravity': None})
+
+            # A new reading, one that arrived late within the window and one before it
+            self.ingest(session, (6, 0), (4, 30), (1, 30))
+            second = self.chart(session, cursor=first['cursor'])
+            self.assertEqual(self.times(second), ['04:00', '04:30', '05:00', '06:00'])
+            self.assertEqual(second['replace_from']['temperature'], '2024-05-01T04:00:00+00:00')
+
+            third = self.chart(session, cursor=second['cursor'])
+            self.assertEqual(self.times(third), ['05:00', '06:00'])
+
+    def test_since_returns_later_readings(self):
+        self.ingest(self.session, *((hour, 0) for hour in range(6)))
+        data = self.chart(self.session, since='2024-05-01T04:30:00+00:00')
+        self.assertEqual(self.times(data), ['04:00', '05:00'])
+        self.assertEqual(data['replace_from']['temperature'], '2024-05-01T03:30:00+00:00')
+
+    def test_out_of_range_cursors_are_rejected(self):
+        positions = [
+            [1e300, None], [10 ** 20, None], [None, -10 ** 18], [1e20, None], [1.5, None], [True, None],
+            [float('inf'), None],
+        ]
+        for position in positions:
+            payload = json.dumps({str(self.session.pk): position})
+            response = self.client.get(
+                reverse('fermentation_chart_data', args=[self.session.pk]),
+                {'cursor': base64.urlsafe_b64encode(payload.encode()).decode()}
+            )
+            self.assertEqual(response.status_code, 400, position)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_multi_session_charts(self):
+        self.ingest(self.session, (1, 0), (2, 0))
+        url = reverse('fermentation_charts_data')
+        data = self.client.get(url, {'sessions': f'{self.session.pk},{self.other_session.pk}'}).json()
+        self.assertEqual(list(data['sessions']), [str(self.session.pk)])
+        resumed = self.client.get(url, {'sessions': str(self.session.pk), 'cursor': data['cursor']}).json()
+        self.assertEqual(len(resumed['sessions'][str(self.session.pk)]['temperature_data']), 2)
+        self.assertEqual(self.client.get(url, {'sessions': str(10 ** 30)}).status_code, 400)
+
+
+class DownsamplingTests(BrewingTestData, TestCase):
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        x = list(range(1000))
+        y = [20.0] * 1000
+        y[437] = 35.0
+        y[800] = 5.0
+        indices = lttb_indices(x, y, 50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(437, indices)
+        self.assertIn(800, indices)
+        self.assertTrue((indices[1:] > indices[:-1]).all())
+        self.assertEqual(lttb_indices(x[:10], y[:10], 50).tolist(), list(range(10)))
+
+    def test_parse_max_points(self):
+        self.assertEqual(parse_max_points('1'), 3)
+        self.assertEqual(parse_max_points('999999'), MAX_CHART_POINTS)
+        self.assertEqual(parse_max_points('many'), parse_max_points(None))
+
+    def test_chart_endpoint_keeps_endpoints_excursions_and_key_gravities(self):
+        start = self.at(0)
+        TemperatureReading.objects.bulk_create([
+            TemperatureReading(
+                brew_session=self.session, timestamp=start + timedelta(minutes=10 * i), reading_type='fermentation',
+                temperature=30.0 if i == 150 else 19.0 + (i % 3) / 10
+            )
+            for i in range(300)
+        ])
+        GravityReading.objects.bulk_create([
+            GravityReading(
+                brew_session=self.session, timestamp=start + timedelta(hours=i), gravity=1.050 - i * 0.0005,
+                reading_type='original' if i == 0 else 'final' if i == 30 else 'progress'
+            )
+            for i in range(40)
+        ])
+        self.client.login(username='brewer', password='secret')
+
+        data = self.client.get(reverse('fermentation_chart_data', args=[self.session.pk]), {'max_points': 20}).json()
+        temperatures = data['temperature_data']
+        self.assertEqual(len(temperatures), 20)
+        self.assertEqual(temperatures[0]['timestamp'], '2024-05-01T00:00:00.000+00:00')
+        self.assertEqual(temperatures[-1]['timestamp'], '2024-05-03T01:50:00.000+00:00')
+        self.assertIn(30.0, [point['temperature'] for point in temperatures])
+
+        gravities = data['gravity_data']
+        self.assertLessEqual(len(gravities), 22)
+        self.assertEqual([point['type'] for point in gravities if point['type'] != 'progress'], ['original', 'final'])
+
+
+class ColumnarFormatTests(BrewingTestData, TestCase):
+    def setUp(self):
+        self.client.login(username='brewer', password='secret')
+
+    def decode(self, series):
+        """(epoch seconds, value, reading type) of a columnar series"""
+        seconds, decoded = series['base'], []
+        for delta, value, type_code in zip(series['dt'], series['value'], series['type']):
+            seconds += delta
+            decoded.append((seconds, value, series['types'][type_code]))
+        return decoded
+
+    def test_columnar_series_decode_to_the_point_format(self):
+        GravityReading.objects.bulk_create([
+            GravityReading(
+                brew_session=self.session, reading_type='original' if i == 0 else 'progress',
+                timestamp=self.at(0) + timedelta(minutes=47 * i, milliseconds=250), gravity=1.0523 - i * 0.00071
+            )
+            for i in range(30)
+        ])
+        TemperatureReading.objects.bulk_create([
+            TemperatureReading(
+                brew_session=self.session, reading_type='fermentation',
+                timestamp=self.at(0) + timedelta(minutes=13 * i), temperature=18.0 + i / 7
+            )
+            for i in range(30)
+        ])
+        url = reverse('fermentation_chart_data', args=[self.session.pk])
+        points = self.client.get(url).json()
+        columnar = self.client.get(url, {'format': 'columnar'}).json()
+        self.assertEqual(columnar['format'], 'columnar')
+
+        expected = [
+            (int(datetime.fromisoformat(point['timestamp']).timestamp()), round(point['gravity'], 4), point['type'])
+            for point in points['gravity_data']
+        ]
+        self.assertEqual(self.decode(columnar['gravity_data']), expected)
+        temperatures = self.decode(columnar['temperature_data'])
+        self.assertEqual(
+            [value for _, value, _ in temperatures],
+            [round(point['temperature'], 2) for point in points['temperature_data']]
+        )
+        self.assertEqual(columnar['cursor'], points['cursor'])
+
+    def test_empty_series(self):
+        data = self.client.get(
+            reverse('fermentation_chart_data', args=[self.session.pk]), {'format': 'columnar'}
+        ).json()
+        self.assertEqual(data['temperature_data'], {'base': None, 'dt': [], 'value': [], 'types': [], 'type': []})
+
+    def test_columnar_timers(self):
+        BrewTimer.objects.create(brew_session=self.session, name='Boil', duration_minutes=60)
+        BrewTimer.objects.create(brew_session=self.session, name='Whirlpool', duration_minutes=20)
+        url = reverse('timer_status_api', args=[self.session.pk])
+        timers = self.client.get(url).json()['timers']
+        columnar = self.client.get(url, {'format': 'columnar'}).json()['timers']
+        self.assertEqual(columnar['name'], [timer['name'] for timer in timers])
+        self.assertEqual(columnar['duration_minutes'], [60, 20])
+        self.assertEqual(columnar['is_finished'], [False, False])
@@ -0,0 +1,590 @@
+"""
+Compact time-series storage for sensor readings.
+
+Sessions with reading_storage = 'chunks' keep their sensor readings in
+ReadingChunk rows, one per session, kind, reading type and UTC day,
+instead of one TemperatureReading/GravityReading row per sample. A chunk's
+data column holds, zlib compressed:
+
+- int32 timestamp deltas in milliseconds (the first from midnight UTC,
+  the others from the previous reading), so regular samples compress to
+  almost nothing
+- float32 values (temperature in °C or specific gravity)
+- for gravity chunks, float32 sample temperatures (NaN when unknown)
+
+read_series() returns the readings of a time range as NumPy arrays and
+merges the row-based readings in, so sessions can switch storage without
+losing history; recent_readings() does the same for the latest readings
+shown on session pages. Chunks keep timestamps to the millisecond and do not
+store notes. downsample() bounds the size of chart payloads with
+Largest-Triangle-Three-Buckets, chart cursors (encode_cursor) let
+charts fetch only the readings after the last one they have (plus a
+trailing window for late readings, see chart_data), and
+columnar_series() is the compact opt-in payload format.
+"""
+import base64
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import TemperatureReading, GravityReading, ReadingChunk
+
+CHUNK_FORMAT = 1
+COMPRESSION_LEVEL = 6
+FLOAT32_DIGITS = 7
+
+# Columnar chart payloads: format name and decimals kept per kind
+COLUMNAR = 'columnar'
+COLUMNAR_DECIMALS = {'temperature': 2, 'gravity': 4}
+
+# Readings per series in chart payloads (see downsample)
+DEFAULT_CHART_POINTS = 500
+MAX_CHART_POINTS = 5000
+
+# Seconds before a chart position that are read again, for late readings
+BACKFILL_WINDOW = 60 * 60
+
+# Kind -> (row model, value field)
+READING_MODELS = {
+    'temperature': (TemperatureReading, 'temperature'),
+    'gravity': (GravityReading, 'gravity'),
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Attempts to merge readings into chunks that concurrent ingests create
+MERGE_ATTEMPTS = 3
+
+
+def _epoch_ms(value):
+    """Milliseconds since the Unix epoch of an aware datetime"""
+    return int(round(value.timestamp() * 1000))
+
+
+def _epoch_us(value):
+    """Microseconds since the Unix epoch of an aware datetime (exact)"""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_epoch_us(us):
+    return EPOCH + timedelta(microseconds=int(us))
+
+
+# Chart positions: the times a datetime can hold
+MIN_POSITION = _epoch_us(datetime.min.replace(tzinfo=dt_timezone.utc))
+MAX_POSITION = _epoch_us(datetime.max.replace(tzinfo=dt_timezone.utc))
+
+
+def _datetime(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+def _day_start_ms(day):
+    return _epoch_ms(datetime.combine(day, time.min, tzinfo=dt_timezone.utc))
+
+
+def encode_chunk(kind, day, timestamps, values, temperatures=None):
+    """
+    Chunk data for readings of one UTC day; timestamps are sorted epoch
+    milliseconds within the day
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    deltas = np.diff(timestamps, prepend=_day_start_ms(day)).astype('<i4')
+    parts = [deltas.tobytes(), np.asarray(values, dtype='<f4').tobytes()]
+    if kind == 'gravity':
+        if temperatures is None:
+            temperatures = np.full(len(timestamps), np.nan)
+        parts.append(np.asarray(temperatures, dtype='<f4').tobytes())
+    return bytes([CHUNK_FORMAT]) + zlib.compress(b''.join(parts), COMPRESSION_LEVEL)
+
+
+def _float32_values(raw, count, offset):
+    """
+    float32 values as float64, rounded to the 7 significant digits float32
+    holds (so 1.055 reads back as 1.055, not 1.0549999)
+    """
+    values = np.frombuffer(raw, '<f4', count, offset=offset).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    scale = 10.0 ** np.where(np.isfinite(magnitude), FLOAT32_DIGITS - 1 - magnitude, 0)
+    return np.round(values * scale) / scale
+
+
+def decode_chunk(chunk):
+    """
+    (timestamps, values, temperatures) of a ReadingChunk: epoch
+    milliseconds (int64), values and sample temperatures (float64;
+    temperatures is None for temperature chunks)
+    """
+    data = bytes(chunk.data)
+    if data[0] != CHUNK_FORMAT:
+        raise ValueError(f"Unknown reading chunk format {data[0]}")
+    raw = zlib.decompress(data[1:])
+    count = chunk.count
+    timestamps = _day_start_ms(chunk.day) + np.cumsum(np.frombuffer(raw, '<i4', count), dtype=np.int64)
+    values = _float32_values(raw, count, 4 * count)
+    temperatures = None
+    if chunk.kind == 'gravity':
+        temperatures = _float32_values(raw, count, 8 * count)
+    return timestamps, values, temperatures
+
+
+def append_readings(readings):
+    """
+    Pack unsaved TemperatureReading/GravityReading instances into the
+    chunks of their sessions, merging them with the readings already
+    stored for the same days. Returns the number of readings packed.
+    """
+    groups = defaultdict(list)
+    for reading in readings:
+        if isinstance(reading, GravityReading):
+            kind, value, temperature = 'gravity', reading.gravity, reading.temperature
+        else:
+            kind, value, temperature = 'temperature', reading.temperature, None
+        timestamp = _epoch_ms(reading.timestamp)
+        key = (reading.brew_session_id, kind, reading.reading_type, _datetime(timestamp).date())
+        groups[key].append((timestamp, value, np.nan if temperature is None else temperature))
+    if not groups:
+        return 0
+
+    with transaction.atomic():
+        for attempt in range(MERGE_ATTEMPTS):
+            try:
+                # Savepoint, so a failed attempt can be retried in the transaction
+                with transaction.atomic():
+                    _merge_chunks(groups)
+                break
+            except IntegrityError:
+                # A concurrent ingest created one of the chunks first: merge into it
+                if attempt == MERGE_ATTEMPTS - 1:
+                    raise
+
+    return sum(len(samples) for samples in groups.values())
+
+
+def _merge_chunks(groups):
+    """
+    Merge grouped samples into their chunks. The existing chunks are locked
+    until the transaction ends, so concurrent ingests into the same day
+    merge one after the other instead of overwriting each other.
+    """
+    existing = {
+        (chunk.brew_session_id, chunk.kind, chunk.reading_type, chunk.day): chunk
+        for chunk in ReadingChunk.objects.select_for_update().filter(
+            brew_session_id__in={key[0] for key in groups},
+            day__in={key[3] for key in groups},
+        )
+    }
+
+    created, updated = [], []
+    for key, samples in groups.items():
+        session_id, kind, reading_type, day = key
+        timestamps, values, temperatures = (np.array(column) for column in zip(*samples))
+        chunk = existing.get(key)
+        if chunk is not None:
+            stored = decode_chunk(chunk)
+            timestamps = np.concatenate([stored[0], timestamps])
+            values = np.concatenate([stored[1], values])
+            if kind == 'gravity':
+                temperatures = np.concatenate([stored[2], temperatures])
+        else:
+            chunk = ReadingChunk(brew_session_id=session_id, kind=kind, reading_type=reading_type, day=day)
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+        temperatures = temperatures[order] if kind == 'gravity' else None
+
+        chunk.data = encode_chunk(kind, day, timestamps, values, temperatures)
+        chunk.count = len(timestamps)
+        chunk.start = _datetime(int(timestamps[0]))
+        chunk.end = _datetime(int(timestamps[-1]))
+        (updated if chunk.pk else created).append(chunk)
+
+    ReadingChunk.objects.bulk_create(created)
+    ReadingChunk.objects.bulk_update(updated, ['data', 'count', 'start', 'end', 'updated_at'])
+
+
+def _empty_series(kind):
+    series = {
+        'timestamp': np.array([], dtype='datetime64[us]'),
+        'value': np.array([], dtype=float),
+        'reading_type': np.array([], dtype=str),
+    }
+    if kind == 'gravity':
+        series['temperature'] = np.array([], dtype=float)
+    return series
+
+
+def read_series(session, kind, start=None, end=None, reading_type=None, after=None):
+    """
+    Readings of one kind ('temperature' or 'gravity') of a session between
+    start and end (inclusive, aware datetimes; open when None) and strictly
+    after `after`, as NumPy arrays sorted by time: timestamp
+    (datetime64[us], UTC), value, reading_type and, for gravity, the sample
+    temperature (NaN when unknown). Row-based and chunked readings are
+    merged.
+    """
+    model, value_field = READING_MODELS[kind]
+    parts = []
+
+    rows = model.objects.filter(brew_session=session)
+    chunks = ReadingChunk.objects.filter(brew_session=session, kind=kind)
+    if start is not None:
+        rows = rows.filter(timestamp__gte=start)
+        chunks = chunks.filter(end__gte=start)
+    if end is not None:
+        rows = rows.filter(timestamp__lte=end)
+        chunks = chunks.filter(start__lte=end)
+    if after is not None:
+        rows = rows.filter(timestamp__gt=after)
+        chunks = chunks.filter(end__gt=after)
+    if reading_type is not None:
+        rows = rows.filter(reading_type=reading_type)
+        chunks = chunks.filter(reading_type=reading_type)
+
+    fields = ['timestamp', value_field, 'reading_type'] + (['temperature'] if kind == 'gravity' else [])
+    row_values = list(rows.order_by().values_list(*fields))
+    if row_values:
+        columns = list(zip(*row_values))
+        parts.append({
+            'timestamp': np.array([_epoch_us(value) for value in columns[0]], dtype=np.int64),
+            'value': np.array(columns[1], dtype=float),
+            'reading_type': np.array(columns[2]),
+            **({'temperature': np.array(columns[3], dtype=float)} if kind == 'gravity' else {}),
+        })
+
+    for chunk in chunks.order_by():
+        timestamps, values, temperatures = decode_chunk(chunk)
+        timestamps = timestamps * 1000
+        part = {
+            'timestamp': timestamps,
+            'value': values,
+            'reading_type': np.full(len(timestamps), chunk.reading_type),
+        }
+        if kind == 'gravity':
+            part['temperature'] = temperatures
+        # Chunks overlapping the range boundaries hold readings outside it
+        in_range = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            in_range &= timestamps >= _epoch_us(start)
+        if end is not None:
+            in_range &= timestamps <= _epoch_us(end)
+        if after is not None:
+            in_range &= timestamps > _epoch_us(after)
+        parts.append({name: column[in_range] for name, column in part.items()})
+
+    if not parts:
+        return _empty_series(kind)
+    series = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    order = np.argsort(series['timestamp'], kind='stable')
+    series = {name: column[order] for name, column in series.items()}
+    series['timestamp'] = series['timestamp'].astype('datetime64[us]')
+    return series
+
+
+def iso_timestamps(timestamps):
+    """ISO 8601 strings (UTC, millisecond precision) of datetime64 timestamps"""
+    return [f"{value}+00:00" for value in np.datetime_as_string(timestamps, unit='ms')]
+
+
+def parse_max_points(value):
+    """max_points query parameter of the chart endpoints (3-MAX_CHART_POINTS, default DEFAULT_CHART_POINTS)"""
+    try:
+        return max(3, min(int(value), MAX_CHART_POINTS))
+    except (TypeError, ValueError):
+        return DEFAULT_CHART_POINTS
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Indices of the points that Largest-Triangle-Three-Buckets keeps when
+    downsampling the series (x sorted ascending) to max_points points.
+
+    The first and last point are always kept; the points between them are
+    split into max_points - 2 buckets, and each bucket keeps the point that
+    forms the largest triangle with the point kept in the previous bucket
+    and the average of the next bucket, which preserves peaks and dips.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    count = len(x)
+    if count <= max_points:
+        return np.arange(count)
+    if max_points < 3:
+        return np.array([0, count - 1])[:max(max_points, 0)]
+
+    # Bucket b holds the points edges[b]:edges[b + 1]
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    average_x = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+    average_y = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+    # The last bucket looks ahead at the last point
+    average_x = np.append(average_x[1:], x[-1])
+    average_y = np.append(average_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        previous_x, previous_y = x[previous], y[previous]
+        # Twice the triangle areas, up to sign
+        areas = np.abs(
+            (previous_x - average_x[bucket]) * (y[start:end] - previous_y)
+            - (previous_x - x[start:end]) * (average_y[bucket] - previous_y)
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample(series, max_points, keep=None):
+    """
+    A series from read_series() reduced to about max_points readings with
+    LTTB on (timestamp, value); readings where keep is True are kept as
+    well (e.g. original and final gravity)
+    """
+    indices = lttb_indices(series['timestamp'].astype(np.int64), series['value'], max_points)
+    if keep is not None:
+        indices = np.union1d(indices, np.flatnonzero(keep))
+    return {name: column[indices] for name, column in series.items()}
+
+
+def fermentation_series(session, max_points=DEFAULT_CHART_POINTS, position=(None, None)):
+    """
+    (temperature, gravity) series of a session for fermentation charts:
+    fermentation temperatures and all gravity readings after position
+    (the times of the last temperature and gravity reading already sent,
+    in epoch microseconds; None for all), downsampled to about max_points
+    readings each, keeping original and final gravity
+    """
+    temperature_after, gravity_after = (None if us is None else _from_epoch_us(us) for us in position)
+    temperatures = downsample(
+        read_series(session, 'temperature', reading_type='fermentation', after=temperature_after), max_points
+    )
+    gravities = read_series(session, 'gravity', after=gravity_after)
+    gravities = downsample(gravities, max_points, keep=gravities['reading_type'] != 'progress')
+    return temperatures, gravities
+
+
+def series_position(series, previous=None):
+    """Time of the last reading of a series (epoch microseconds), or previous when it is empty"""
+    if not len(series['timestamp']):
+        return previous
+    return int(series['timestamp'][-1].astype(np.int64))
+
+
+def rewind(position):
+    """
+    Position to resume a series from: BACKFILL_WINDOW seconds before
+    position, so the readings from that whole second on are sent again
+    (None stays None)
+    """
+    if position is None:
+        return None
+    second = position // 1000000 - BACKFILL_WINDOW
+    return max(second * 1000000 - 1, MIN_POSITION)
+
+
+def chart_data(session, max_points=DEFAULT_CHART_POINTS, position=(None, None), columnar=False):
+    """
+    Chart payload of a session (temperature_data, gravity_data) with the
+    readings after position (see fermentation_series), and the position
+    after them. columnar selects the columnar format (see columnar_series)
+    instead of a list of points per series.
+
+    Readings can arrive late (a device uploading what it buffered while
+    offline), with times before a position already sent. So a series is
+    read again from BACKFILL_WINDOW seconds before its position, and
+    replace_from gives, per series, the time (ISO 8601, a whole second;
+    None without a position) from which the client replaces the readings
+    it has. Readings that arrive later than that are only in a full reload.
+    """
+    after = tuple(rewind(us) for us in position)
+    temperatures, gravities = fermentation_series(session, max_points, after)
+    if columnar:
+        data = {
+            'format': COLUMNAR,
+            'temperature_data': columnar_series(temperatures, COLUMNAR_DECIMALS['temperature']),
+            'gravity_data': columnar_series(gravities, COLUMNAR_DECIMALS['gravity']),
+        }
+    else:
+        data = {
+            'temperature_data': temperature_points(temperatures),
+            'gravity_data': gravity_points(gravities),
+        }
+    data['replace_from'] = {
+        kind: None if us is None else _from_epoch_us(us + 1).isoformat()
+        for kind, us in zip(('temperature', 'gravity'), after)
+    }
+    return data, (series_position(temperatures, position[0]), series_position(gravities, position[1]))
+
+
+class CursorError(ValueError):
+    """Invalid chart cursor or since parameter"""
+
+
+def encode_cursor(positions):
+    """
+    Opaque cursor for {session id: (temperature, gravity) position}, see
+    fermentation_series
+    """
+    payload = json.dumps({str(pk): list(position) for pk, position in positions.items()}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _cursor_position(us):
+    """A position of a cursor: None or whole epoch microseconds a datetime can hold"""
+    if us is None:
+        return None
+    if isinstance(us, bool) or not isinstance(us, int) or not MIN_POSITION <= us <= MAX_POSITION:
+        raise ValueError('Invalid cursor position')
+    return us
+
+
+def decode_cursor(cursor):
+    """{session id: (temperature, gravity) position} of an encode_cursor() cursor"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        positions = {}
+        for pk, position in data.items():
+            temperature, gravity = (_cursor_position(us) for us in position)
+            positions[int(pk)] = (temperature, gravity)
+        return positions
+    except (ValueError, TypeError, AttributeError):
+        raise CursorError('Invalid cursor')
+
+
+def chart_positions(cursor=None, since=None):
+    """
+    (positions, default) to resume charts from: the positions of the
+    sessions in a cursor, or a since timestamp (ISO 8601) as the default
+    position of every session and series. Without either, charts start
+    from the first reading.
+    """
+    if cursor:
+        return decode_cursor(cursor), (None, None)
+    if since:
+        try:
+            timestamp = parse_datetime(since)
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise CursorError('Invalid since timestamp')
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        return {}, (_epoch_us(timestamp),) * 2
+    return {}, (None, None)
+
+
+def temperature_points(series):
+    """Chart points ({timestamp, temperature}) of a temperature series"""
+    return [
+        {'timestamp': timestamp, 'temperature': temperature}
+        for timestamp, temperature in zip(iso_timestamps(series['timestamp']), series['value'].tolist())
+    ]
+
+
+def gravity_points(series):
+    """Chart points ({timestamp, gravity, type}) of a gravity series"""
+    return [
+        {'timestamp': timestamp, 'gravity': gravity, 'type': reading_type}
+        for timestamp, gravity, reading_type in zip(
+            iso_timestamps(series['timestamp']), series['value'].tolist(), series['reading_type'].tolist()
+        )
+    ]
+
+
+def columnar_series(series, decimals):
+    """
+    Columnar form of a series: base (epoch seconds of the first reading,
+    None when empty), dt (seconds since the previous reading, 0 for the
+    first) and value rounded to decimals, as parallel lists; reading types
+    as indexes (type) into their distinct names (types).
+    """
+    seconds = series['timestamp'].astype('datetime64[s]').astype(np.int64)
+    types, type_codes = np.unique(series['reading_type'], return_inverse=True)
+    return {
+        'base': int(seconds[0]) if len(seconds) else None,
+        'dt': np.diff(seconds, prepend=seconds[:1]).tolist(),
+        'value': np.round(series['value'], decimals).tolist(),
+        'types': types.tolist(),
+        'type': type_codes.tolist(),
+    }
+
+
+def _chunk_readings(session, chunk, count):
+    """The last count readings of a chunk as unsaved model instances, newest first"""
+    model, value_field = READING_MODELS[chunk.kind]
+    timestamps, values, temperatures = decode_chunk(chunk)
+    readings = []
+    for position in reversed(range(max(len(timestamps) - count, 0), len(timestamps))):
+        reading = model(
+            brew_session=session,
+            timestamp=_datetime(int(timestamps[position])),
+            reading_type=chunk.reading_type,
+            **{value_field: float(values[position])}
+        )
+        if chunk.kind == 'gravity' and not np.isnan(temperatures[position]):
+            reading.temperature = float(temperatures[position])
+        readings.append(reading)
+    return readings
+
+
+def recent_readings(session, kind, count, reading_type=None):
+    """
+    The count latest readings of one kind for a session, newest first, from
+    its rows and chunks; readings unpacked from chunks are unsaved model
+    instances. Chunks are decoded newest first until older than the
+    readings found.
+    """
+    model, _ = READING_MODELS[kind]
+    rows = model.objects.filter(brew_session=session)
+    chunks = ReadingChunk.objects.filter(brew_session=session, kind=kind)
+    if reading_type is not None:
+        rows = rows.filter(reading_type=reading_type)
+        chunks = chunks.filter(reading_type=reading_type)
+
+    readings = list(rows.order_by('-timestamp')[:count])
+    for chunk in chunks.order_by('-end').iterator():
+        if len(readings) >= count and chunk.end <= readings[-1].timestamp:
+            break
+        # Stable sort: rows stay ahead of chunk readings with the same time
+        readings = sorted(
+            readings + _chunk_readings(session, chunk, count), key=lambda reading: reading.timestamp, reverse=True
+        )[:count]
+    return readings
+
+
+def latest_reading(session, kind):
+    """
+    Latest reading of one kind for a session, from its rows or chunks; a
+    reading unpacked from a chunk is an unsaved model instance
+    """
+    readings = recent_readings(session, kind, 1)
+    return readings[0] if readings else None
+
+
+def compact_session(session, batch_size=2000):
+    """
+    Switch a session to chunked storage and pack its existing row-based
+    readings into chunks. Readings with notes stay rows, since chunks do
+    not keep notes. Returns the number of readings packed.
+    """
+    packed = 0
+    with transaction.atomic():
+        if session.reading_storage != 'chunks':
+            session.reading_storage = 'chunks'
+            session.save(update_fields=['reading_storage', 'updated_at'])
+        for model, _ in READING_MODELS.values():
+            rows = model.objects.filter(brew_session=session, notes='')
+            while True:
+                batch = list(rows.order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                packed += append_readings(batch)
+                model.objects.filter(pk__in=[reading.pk for reading in batch]).delete()
+    return packed
@@ -27,4 +27,6 @@ urlpatterns = [
     # API Endpoints
     path('api/session/<int:session_id>/timers/', views.timer_status_api, name='timer_status_api'),
     path('api/fermentation/<int:session_id>/chart-data/', views.fermentation_chart_data, name='fermentation_chart_data'),
+    path('api/fermentation/chart-data/', views.fermentation_charts_data, name='fermentation_charts_data'),
+    path('api/readings/', views.ingest_sensor_readings, name='ingest_sensor_readings'),
 ]
\ No newline at end of file
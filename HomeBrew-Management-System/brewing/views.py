@@ -2,11 +2,16 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.core.exceptions import RequestDataTooBig
+from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from django.db.models import Q, Avg, Count
 from datetime import timedelta
 from .models import (BrewSession, BrewStepLog, TemperatureReading, GravityReading, 
-                     BrewTimer, FermentationNote, FermentationPhoto, FermentationAlert)
+                     BrewTimer, FermentationNote, FermentationPhoto, FermentationAlert, SensorDevice)
+from .ingest import ingest_readings, parse_readings, ReadingParseError, MAX_READINGS, MAX_SESSION_ID
+from .timeseries import (chart_data, chart_positions, encode_cursor, parse_max_points, recent_readings,
+                         CursorError, COLUMNAR)
 from recipes.models import Recipe
 from core.models import BrewingCalculator
 import json
@@ -214,8 +219,8 @@ def brew_session_detail(request, pk):
     active_timers = BrewTimer.objects.filter(brew_session=session, is_active=True)
     
     # Get recent readings
-    temp_readings = TemperatureReading.objects.filter(brew_session=session)[:10]
-    gravity_readings = GravityReading.objects.filter(brew_session=session)[:10]
+    temp_readings = recent_readings(session, 'temperature', 10)
+    gravity_readings = recent_readings(session, 'gravity', 10)
     
     context = {
         'session': session,
@@ -275,11 +280,8 @@ def fermentation_detail(request, pk):
     # Get fermentation data
     notes = FermentationNote.objects.filter(brew_session=session).order_by('-note_date')
     photos = FermentationPhoto.objects.filter(brew_session=session).order_by('-photo_date')
-    temp_readings = TemperatureReading.objects.filter(
-        brew_session=session, 
-        reading_type='fermentation'
-    ).order_by('-timestamp')[:20]
-    gravity_readings = GravityReading.objects.filter(brew_session=session).order_by('-timestamp')
+    temp_readings = recent_readings(session, 'temperature', 20, reading_type='fermentation')
+    gravity_readings = recent_readings(session, 'gravity', 20)
     
     # Calculate fermentation stats
     fermentation_progress = session.get_fermentation_progress()
@@ -355,7 +357,7 @@ def add_temperature_reading(request, session_id):
         messages.success(request, f'Added temperature reading: {temperature}°C')
         
         if request.headers.get('HX-Request'):
-            readings = TemperatureReading.objects.filter(brew_session=session)[:5]
+            readings = recent_readings(session, 'temperature', 5)
             return render(request, 'brewing/partials/temp_readings.html', {'readings': readings})
         
         return redirect('brew_session_detail', pk=session.pk)
@@ -394,13 +396,56 @@ def add_gravity_reading(request, session_id):
         messages.success(request, f'Added gravity reading: SG {gravity}')
         
         if request.headers.get('HX-Request'):
-            readings = GravityReading.objects.filter(brew_session=session)[:5]
+            readings = recent_readings(session, 'gravity', 5)
             return render(request, 'brewing/partials/gravity_readings.html', {'readings': readings})
         
         return redirect('fermentation_detail', pk=session.pk)
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+def device_token(request):
+    """Token from an "Authorization: Bearer <token>" header"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+@csrf_exempt
+def ingest_sensor_readings(request):
+    """
+    Bulk ingestion API for fermentation sensors. The device authenticates
+    with its token (Authorization: Bearer <token>) and posts a JSON array of
+    readings, {"readings": [...]} or NDJSON, for any of its owner's sessions
+    (see brewing.ingest). Valid readings are saved in one transaction and
+    invalid ones are reported by index.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Only POST method allowed'}, status=405)
+    
+    device = SensorDevice.authenticate(device_token(request))
+    if device is None:
+        return JsonResponse({'success': False, 'error': 'Invalid device token'}, status=401)
+    
+    try:
+        readings = parse_readings(request.body)
+    except RequestDataTooBig:
+        return JsonResponse({'success': False, 'error': 'Request body too large'}, status=413)
+    except ReadingParseError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    if len(readings) > MAX_READINGS:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {MAX_READINGS} readings per request'
+        }, status=413)
+    
+    saved, rejected = ingest_readings(device, readings)
+    saved_count = sum(saved.values())
+    
+    # Partly rejected batches succeed; only batches without a valid reading fail
+    return JsonResponse({
+        'success': saved_count > 0 or not rejected,
+        'saved': saved,
+        'rejected': rejected,
+    }, status=400 if rejected and not saved_count else 200)
+
 @login_required
 def start_fermentation(request, session_id):
     """Move brew session to fermentation stage"""
@@ -648,10 +693,26 @@ def create_custom_alert(request, session_id):
 # API endpoint for timer status
 @login_required
 def timer_status_api(request, session_id):
-    """API endpoint for timer status updates"""
+    """
+    API endpoint for timer status updates; ?format=columnar returns one
+    list per field instead of one object per timer
+    """
     session = get_object_or_404(BrewSession, pk=session_id, brewer=request.user)
     timers = BrewTimer.objects.filter(brew_session=session, is_active=True)
     
+    if request.GET.get('format') == COLUMNAR:
+        remaining = [timer.time_remaining for timer in timers]
+        return JsonResponse({
+            'format': COLUMNAR,
+            'timers': {
+                'id': [timer.id for timer in timers],
+                'name': [timer.name for timer in timers],
+                'time_remaining': [round(minutes, 2) for minutes in remaining],
+                'is_finished': [minutes <= 0 for minutes in remaining],
+                'duration_minutes': [timer.duration_minutes for timer in timers],
+            }
+        })
+    
     timer_data = []
     for timer in timers:
         timer_data.append({
@@ -664,41 +725,71 @@ def timer_status_api(request, session_id):
     
     return JsonResponse({'timers': timer_data})
 
+MAX_CHART_SESSIONS = 20
+
 @login_required
 def fermentation_chart_data(request, session_id):
-    """API endpoint for fermentation chart data"""
+    """
+    API endpoint for fermentation chart data. Each series is downsampled
+    (LTTB) to about max_points readings (query parameter, default 500);
+    original and final gravity readings are always included.
+    
+    Pass the returned cursor back as ?cursor= (or a ?since= timestamp) to
+    get only the readings that arrived after it, for live refreshes. The
+    last hour before it is sent again, for readings that arrive late;
+    replace_from says from when the client replaces its readings.
+    ?format=columnar returns each series as parallel arrays (see
+    brewing.timeseries.columnar_series), several times smaller.
+    """
     session = get_object_or_404(BrewSession, pk=session_id, brewer=request.user)
+    max_points = parse_max_points(request.GET.get('max_points'))
     
-    # Get temperature data
-    temp_readings = TemperatureReading.objects.filter(
-        brew_session=session,
-        reading_type='fermentation'
-    ).order_by('timestamp')
+    try:
+        positions, default = chart_positions(request.GET.get('cursor'), request.GET.get('since'))
+    except CursorError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    # Get gravity data
-    gravity_readings = GravityReading.objects.filter(
-        brew_session=session
-    ).order_by('timestamp')
+    # Row-based and chunked readings after the cursor
+    columnar = request.GET.get('format') == COLUMNAR
+    data, position = chart_data(session, max_points, positions.get(session.pk, default), columnar)
+    data['cursor'] = encode_cursor({session.pk: position})
     
-    temp_data = [
-        {
-            'timestamp': reading.timestamp.isoformat(),
-            'temperature': float(reading.temperature)
-        }
-        for reading in temp_readings
-    ]
+    return JsonResponse(data)
+
+@login_required
+def fermentation_charts_data(request):
+    """
+    Chart data of several sessions in one request (dashboards). sessions is
+    a comma-separated list of ids (default: the fermenting sessions);
+    cursor, since, max_points and format work like in
+    fermentation_chart_data, and the cursor covers every session.
+    """
+    sessions = BrewSession.objects.filter(brewer=request.user)
+    if request.GET.get('sessions'):
+        try:
+            session_ids = [int(pk) for pk in request.GET['sessions'].split(',') if pk.strip()]
+        except ValueError:
+            return JsonResponse({'error': 'Invalid sessions'}, status=400)
+        if not all(0 < pk <= MAX_SESSION_ID for pk in session_ids):
+            return JsonResponse({'error': 'Invalid sessions'}, status=400)
+        sessions = sessions.filter(pk__in=session_ids)
+    else:
+        sessions = sessions.filter(status='fermenting')
+    sessions = list(sessions.order_by('pk')[:MAX_CHART_SESSIONS])
+    max_points = parse_max_points(request.GET.get('max_points'))
     
-    gravity_data = [
-        {
-            'timestamp': reading.timestamp.isoformat(),
-            'gravity': float(reading.gravity),
-            'type': reading.reading_type
-        }
-        for reading in gravity_readings
-    ]
+    try:
+        positions, default = chart_positions(request.GET.get('cursor'), request.GET.get('since'))
+    except CursorError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    columnar = request.GET.get('format') == COLUMNAR
+    charts = {}
+    for session in sessions:
+        data, positions[session.pk] = chart_data(session, max_points, positions.get(session.pk, default), columnar)
+        charts[session.pk] = {'batch_name': session.batch_name, **data}
     
     return JsonResponse({
-        'temperature_data': temp_data,
-        'gravity_data': gravity_data
+        'sessions': charts,
+        'cursor': encode_cursor({session.pk: positions[session.pk] for session in sessions}),
     })
-    
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+Array-native brewing formulas.
+
+Every function accepts scalars, sequences or NumPy arrays and broadcasts
+its arguments against each other, so a whole column of recipes, additions
+or readings is computed in one call. Results are always NumPy values (0-d
+for scalar inputs); BrewingCalculator wraps these functions and returns
+plain floats for scalar arguments.
+"""
+import numpy as np
+
+# Metric conversion of extract potential: 1 kg = 2.2 lb, 1 L = 0.264 gal
+LB_PER_KG = 2.2
+GAL_PER_LITER = 0.264
+
+# Tinseth utilization constants
+BIGNESS_FACTOR = 1.65
+BIGNESS_BASE = 0.000125
+BOIL_TIME_RATE = 0.04
+BOIL_TIME_DIVISOR = 4.15
+
+# Morey: SRM = 1.4922 * MCU ** 0.6859
+MOREY_FACTOR = 1.4922
+MOREY_EXPONENT = 0.6859
+
+ABV_FACTOR = 131.25
+
+# Water absorbed by the grain in BIAB (L/kg)
+GRAIN_ABSORPTION = 0.96
+
+
+def _array(value):
+    return np.asarray(value, dtype=float)
+
+
+def sg_to_plato(sg):
+    """Specific gravity to degrees Plato"""
+    return (_array(sg) - 1) * 1000 / 4
+
+
+def plato_to_sg(plato):
+    """Degrees Plato to specific gravity"""
+    return _array(plato) * 4 / 1000 + 1
+
+
+def gravity_from_points(points, volume_liters):
+    """Specific gravity of `points` gravity points (see extract_points) in volume_liters"""
+    return 1 + _array(points) / _array(volume_liters) / 1000
+
+
+def abv(og, fg):
+    """Alcohol by volume (%) from original and final gravity"""
+    return (_array(og) - _array(fg)) * ABV_FACTOR
+
+
+def attenuation(og, fg):
+    """Apparent attenuation (%) from original and final gravity"""
+    og = _array(og)
+    return (og - _array(fg)) / (og - 1) * 100
+
+
+def strike_water_temp(grain_temp, mash_temp, water_ratio):
+    """
+    Strike water temperature (Celsius) for BIAB from the grain and target mash
+    temperatures (Celsius) and the water to grain ratio (L/kg)
+    """
+    mash_temp = _array(mash_temp)
+    return 0.2 / _array(water_ratio) * (mash_temp - _array(grain_temp)) + mash_temp
+
+
+def grain_absorption(grain_weight_kg):
+    """Water absorbed by the grain in BIAB (L)"""
+    return _array(grain_weight_kg) * GRAIN_ABSORPTION
+
+
+def boil_off(boil_time_minutes, boil_off_rate=4.0):
+    """Boil-off at boil_off_rate (% per hour)"""
+    return _array(boil_time_minutes) / 60 * _array(boil_off_rate)
+
+
+def tinseth_bigness_factor(og):
+    """Tinseth gravity ("bigness") factor of hop utilization"""
+    return BIGNESS_FACTOR * np.power(BIGNESS_BASE, _array(og) - 1)
+
+
+def tinseth_boil_time_factor(boil_time_minutes):
+    """Tinseth boil time factor of hop utilization"""
+    return -np.expm1(-BOIL_TIME_RATE * _array(boil_time_minutes)) / BOIL_TIME_DIVISOR
+
+
+def ibu_tinseth(alpha_acid, hop_weight_grams, boil_time_minutes, batch_size_liters, og):
+    """IBU of hop additions (alpha acid in %) with the Tinseth formula"""
+    utilization = tinseth_bigness_factor(og) * tinseth_boil_time_factor(boil_time_minutes)
+    return _array(alpha_acid) * _array(hop_weight_grams) * utilization * 1000 / (_array(batch_size_liters) * 100)
+
+
+def mcu(weights_kg, colors, axis=-1):
+    """Malt color units: the sum of weight (kg) x color over `axis`"""
+    return (_array(weights_kg) * _array(colors)).sum(axis=axis)
+
+
+def srm_morey(color_units):
+    """SRM color from malt color units (Morey); 0 for no color"""
+    color_units = _array(color_units)
+    return np.where(color_units > 0, MOREY_FACTOR * np.power(np.maximum(color_units, 0), MOREY_EXPONENT), 0.0)
+
+
+def extract_points(grain_weight_kg, extract_potential, efficiency):
+    """
+    Gravity points (per liter) of grain with extract_potential in PPG at
+    efficiency (a fraction, 0.75 for 75%)
+    """
+    return _array(grain_weight_kg) * LB_PER_KG * _array(extract_potential) * _array(efficiency) / GAL_PER_LITER
+
+
+def hop_weights_for_ibu(target_ibu, alpha_acid, boil_time_minutes, batch_size_liters, og,
+                        shares=None, fixed_grams=None, min_share=0.0):
+    """
+    Weights (g) of hop additions that together give target_ibu (Tinseth).
+
+    Additions run along the last axis of alpha_acid and boil_time_minutes;
+    target_ibu, batch_size_liters and og broadcast over the leading axes, so
+    many schedules are solved in one call. fixed_grams gives the weight of
+    additions that are already decided (NaN for the additions to solve):
+    their IBU is subtracted from the target, and the rest is split across the
+    solved additions by shares (equal by default). The solved additions get
+    at least min_share of the target. Solved additions without utilization
+    (flameout) get 0 g.
+    """
+    alpha_acid, boil_time_minutes = np.broadcast_arrays(_array(alpha_acid), _array(boil_time_minutes))
+    target_ibu = _array(target_ibu)[..., None]
+
+    # IBU per gram of each addition
+    ibu_per_gram = ibu_tinseth(
+        alpha_acid, 1.0, boil_time_minutes, _array(batch_size_liters)[..., None], _array(og)[..., None]
+    )
+
+    if fixed_grams is None:
+        fixed_grams = np.full(ibu_per_gram.shape, np.nan)
+    fixed_grams = np.broadcast_to(_array(fixed_grams), ibu_per_gram.shape)
+    solved = np.isnan(fixed_grams) & (ibu_per_gram > 0)
+    fixed_ibu = np.where(np.isnan(fixed_grams), 0.0, fixed_grams * ibu_per_gram).sum(axis=-1, keepdims=True)
+    remaining = np.maximum(target_ibu - fixed_ibu, _array(min_share) * target_ibu)
+
+    shares = np.ones(ibu_per_gram.shape) if shares is None else np.broadcast_to(_array(shares), ibu_per_gram.shape)
+    shares = np.where(solved, shares, 0.0)
+    total_share = shares.sum(axis=-1, keepdims=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        solved_grams = remaining * shares / total_share / ibu_per_gram
+    return np.where(solved, solved_grams, np.nan_to_num(fixed_grams))
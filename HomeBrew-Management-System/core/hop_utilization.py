@@ -0,0 +1,185 @@
+"""
+Hop utilization models.
+
+Every model splits IBU into two steps, both over NumPy arrays:
+
+- units(alpha_acid, grams, minutes): per-addition IBU units (alpha acid % x
+  grams x boil time utilization), which add up over a recipe's additions
+- ibu(units, og, batch_size_liters): IBU of a recipe's total units, with the
+  model's gravity (and for Garetz, hopping rate) correction
+
+Because the per-addition units add up, recipes keep storing one running
+total however many additions they have. Additions that are not boiled are
+mapped onto boil minutes first: whirlpool and flameout additions isomerize
+at a rate that falls with the wort temperature (hot_stand_minutes), and dry
+hops add no IBU.
+
+MODELS is the registry; register() adds a model.
+"""
+import numpy as np
+from . import calculations
+
+MODELS = {}
+
+# Hot stand: wort cools from its start temperature towards AMBIENT_TEMPERATURE
+# with time constant COOLING_MINUTES; alpha acid isomerization slows with the
+# temperature following Arrhenius (Malowicki), relative to the rate at boiling
+FLAMEOUT_TEMPERATURE = 100.0
+WHIRLPOOL_TEMPERATURE = 80.0
+AMBIENT_TEMPERATURE = 20.0
+COOLING_MINUTES = 80.0
+ISOMERIZATION_ACTIVATION = 11858.0  # Activation energy / R, in K
+BOILING_POINT = 100.0
+HOT_STAND_STEP = 0.5  # minutes
+
+# Use -> hot stand start temperature
+HOT_STAND_USES = {
+    'flameout': FLAMEOUT_TEMPERATURE,
+    'whirlpool': WHIRLPOOL_TEMPERATURE,
+}
+NO_IBU_USES = ('dry_hop',)
+
+
+def register(model):
+    """Add a model instance to the registry (also usable as a class decorator)"""
+    instance = model() if isinstance(model, type) else model
+    MODELS[instance.name] = instance
+    return model
+
+
+def get_model(name):
+    """The registered model called name; KeyError for unknown models"""
+    return MODELS[name]
+
+
+def model_choices():
+    """(name, label) pairs for form and model field choices"""
+    return [(model.name, model.label) for model in MODELS.values()]
+
+
+def relative_isomerization_rate(temperature):
+    """Isomerization rate at temperature (Celsius) relative to the boil"""
+    kelvin = np.asarray(temperature, dtype=float) + 273.15
+    return np.exp(-ISOMERIZATION_ACTIVATION * (1 / kelvin - 1 / (BOILING_POINT + 273.15)))
+
+
+def hot_stand_minutes(minutes, start_temperature):
+    """
+    Boil minutes equivalent to standing for `minutes` in wort that starts at
+    start_temperature (one temperature for all) and cools towards the
+    ambient temperature
+    """
+    minutes = np.maximum(np.asarray(minutes, dtype=float), 0)
+    # Integrate the relative rate once on a grid (trapezoidal rule), then interpolate
+    grid = np.arange(0.0, minutes.max(initial=0.0) + 2 * HOT_STAND_STEP, HOT_STAND_STEP)
+    temperature = AMBIENT_TEMPERATURE + (start_temperature - AMBIENT_TEMPERATURE) * np.exp(-grid / COOLING_MINUTES)
+    rate = relative_isomerization_rate(temperature)
+    cumulative = np.concatenate([[0.0], np.cumsum((rate[1:] + rate[:-1]) / 2 * HOT_STAND_STEP)])
+    return np.interp(minutes, grid, cumulative)
+
+
+def boil_minutes(minutes, use):
+    """Boil minutes equivalent to each addition; NaN for additions without IBU (dry hops)"""
+    minutes, use = np.broadcast_arrays(np.asarray(minutes, dtype=float), np.asarray(use))
+    equivalent = minutes.copy()
+    for hot_stand_use, temperature in HOT_STAND_USES.items():
+        hot_stand = use == hot_stand_use
+        if hot_stand.any():
+            equivalent[hot_stand] = hot_stand_minutes(minutes[hot_stand], temperature)
+    equivalent[np.isin(use, NO_IBU_USES)] = np.nan
+    return equivalent
+
+
+class UtilizationModel:
+    """Base class of the utilization models"""
+    name = None
+    label = None
+
+    def time_factor(self, minutes):
+        """Utilization (fraction) after boiling for minutes"""
+        raise NotImplementedError
+
+    def units(self, alpha_acid, grams, minutes, use='boil'):
+        """IBU units of additions: alpha acid % x grams x utilization"""
+        minutes = boil_minutes(minutes, use)
+        factor = np.where(np.isnan(minutes), 0.0, self.time_factor(np.nan_to_num(minutes)))
+        return np.asarray(alpha_acid, dtype=float) * np.asarray(grams, dtype=float) * factor
+
+    def ibu(self, units, og, batch_size_liters):
+        """IBU of total units at og in batch_size_liters"""
+        raise NotImplementedError
+
+
+@register
+class Tinseth(UtilizationModel):
+    """Tinseth: exponential boil time curve, gravity ("bigness") factor"""
+    name = 'tinseth'
+    label = 'Tinseth'
+
+    def time_factor(self, minutes):
+        return calculations.tinseth_boil_time_factor(minutes)
+
+    def ibu(self, units, og, batch_size_liters):
+        return calculations.tinseth_bigness_factor(og) * np.asarray(units, dtype=float) * 10 / np.asarray(batch_size_liters, dtype=float)
+
+
+@register
+class Rager(UtilizationModel):
+    """Rager: tanh boil time curve, correction for gravities above 1.050"""
+    name = 'rager'
+    label = 'Rager'
+
+    def time_factor(self, minutes):
+        return (18.11 + 13.86 * np.tanh((np.asarray(minutes, dtype=float) - 31.32) / 18.27)) / 100
+
+    def ibu(self, units, og, batch_size_liters):
+        gravity_adjustment = np.maximum(np.asarray(og, dtype=float) - 1.050, 0) / 0.2
+        return np.asarray(units, dtype=float) * 10 / (np.asarray(batch_size_liters, dtype=float) * (1 + gravity_adjustment))
+
+
+@register
+class Garetz(UtilizationModel):
+    """
+    Garetz: stepped boil time table, gravity factor and a hopping rate factor
+    that grows with the IBU itself (solved exactly; no elevation or boil
+    concentration corrections)
+    """
+    name = 'garetz'
+    label = 'Garetz'
+
+    # Utilization (%) for boil times up to each bound (minutes)
+    TIME_BOUNDS = np.array([5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 60, 70, 80])
+    UTILIZATION = np.array([0, 6, 8, 10, 12, 13, 15, 16, 18, 19, 21, 22, 23, 24]) / 100
+    HOPPING_RATE = 260.0
+
+    def time_factor(self, minutes):
+        minutes = np.ceil(np.asarray(minutes, dtype=float))
+        return self.UTILIZATION[np.searchsorted(self.TIME_BOUNDS, minutes, side='left')]
+
+    def ibu(self, units, og, batch_size_liters):
+        gravity_factor = 1 + np.maximum(np.asarray(og, dtype=float) - 1.050, 0) / 0.2
+        uncorrected = np.asarray(units, dtype=float) * 10 / (np.asarray(batch_size_liters, dtype=float) * gravity_factor)
+        # IBU = uncorrected / (1 + IBU / HOPPING_RATE)
+        return self.HOPPING_RATE / 2 * (np.sqrt(1 + 4 * uncorrected / self.HOPPING_RATE) - 1)
+
+
+def _by_model(model, shape, evaluate):
+    """Evaluate per model name (scalar or array broadcasting to shape)"""
+    names = np.broadcast_to(np.asarray(model), shape)
+    result = np.zeros(shape)
+    for name in np.unique(names):
+        mask = names == name
+        result = np.where(mask, evaluate(get_model(str(name))), result)
+    return result
+
+
+def ibu_units(alpha_acid, grams, minutes, use='boil', model='tinseth'):
+    """IBU units of hop additions; model is a registered name or an array of names"""
+    shape = np.broadcast_shapes(*(np.shape(value) for value in (alpha_acid, grams, minutes, use, model)))
+    return _by_model(model, shape, lambda utilization: utilization.units(alpha_acid, grams, minutes, use))
+
+
+def ibu_from_units(units, og, batch_size_liters, model='tinseth'):
+    """IBU of total units; model is a registered name or an array of names"""
+    shape = np.broadcast_shapes(*(np.shape(value) for value in (units, og, batch_size_liters, model)))
+    return _by_model(model, shape, lambda utilization: utilization.ibu(units, og, batch_size_liters))
@@ -0,0 +1,101 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from core import calculations
+from core.models import BrewingCalculator
+
+
+def _inputs(size, rng):
+    """Random but realistic inputs for every formula"""
+    og = rng.uniform(1.030, 1.110, size)
+    return {
+        'og': og,
+        'fg': og - (og - 1) * rng.uniform(0.6, 0.85, size),
+        'plato': rng.uniform(5, 25, size),
+        'grain_temp': rng.uniform(10, 25, size),
+        'mash_temp': rng.uniform(62, 70, size),
+        'water_ratio': rng.uniform(2, 5, size),
+        'weight_kg': rng.uniform(0.1, 8, size),
+        'ppg': rng.uniform(25, 38, size),
+        'efficiency': rng.uniform(0.6, 0.85, size),
+        'mcu': rng.uniform(0, 200, size),
+        'alpha_acid': rng.uniform(3, 16, size),
+        'hop_grams': rng.uniform(5, 100, size),
+        'boil_time': rng.choice([0, 5, 10, 15, 20, 30, 45, 60, 90], size).astype(float),
+        'batch_size': rng.uniform(5, 60, size),
+    }
+
+
+# (name, scalar method, array function, input names)
+FORMULAS = [
+    ('sg_to_plato', BrewingCalculator.sg_to_plato, calculations.sg_to_plato, ['og']),
+    ('plato_to_sg', BrewingCalculator.plato_to_sg, calculations.plato_to_sg, ['plato']),
+    ('abv', BrewingCalculator.calculate_abv, calculations.abv, ['og', 'fg']),
+    ('attenuation', BrewingCalculator.calculate_attenuation, calculations.attenuation, ['og', 'fg']),
+    ('strike_water_temp', BrewingCalculator.calculate_strike_water_temp, calculations.strike_water_temp,
+     ['grain_temp', 'mash_temp', 'water_ratio']),
+    ('extract_points', BrewingCalculator.calculate_extract_points, calculations.extract_points,
+     ['weight_kg', 'ppg', 'efficiency']),
+    ('srm_morey', lambda mcu: BrewingCalculator.calculate_srm_color([(mcu, 1.0)]), calculations.srm_morey, ['mcu']),
+    ('ibu_tinseth', BrewingCalculator.calculate_ibu_tinseth, calculations.ibu_tinseth,
+     ['alpha_acid', 'hop_grams', 'boil_time', 'batch_size', 'og']),
+]
+
+
+def _legacy_boil_time_factor(boil_time_minutes):
+    """The boil time factor before the formulas moved to core.calculations"""
+    return (1 - 2.718 ** (-0.04 * boil_time_minutes)) / 4.15
+
+
+class Command(BaseCommand):
+    help = 'Compare the scalar BrewingCalculator methods with the array formulas in core.calculations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100000, help='Number of inputs per formula')
+        parser.add_argument('--loop-size', type=int, default=10000,
+                            help='Number of inputs evaluated with the scalar methods')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        size = max(1, options['size'])
+        loop_size = max(1, min(options['loop_size'], size))
+        inputs = _inputs(size, np.random.default_rng(options['seed']))
+
+        self.stdout.write(f'{size} inputs per formula, {loop_size} through the scalar methods')
+        self.stdout.write(f'{"Formula":20} {"Scalar us/call":>15} {"Array ns/value":>15} {"Speedup":>9} {"Max rel diff":>13}')
+
+        worst = 0.0
+        for name, scalar, array, argument_names in FORMULAS:
+            arguments = [inputs[argument] for argument in argument_names]
+
+            start = time.perf_counter()
+            loop_values = np.array([scalar(*values) for values in zip(*(a[:loop_size].tolist() for a in arguments))])
+            loop_time = (time.perf_counter() - start) / loop_size
+
+            start = time.perf_counter()
+            array_values = array(*arguments)
+            array_time = (time.perf_counter() - start) / size
+
+            difference = self.relative_difference(loop_values, array_values[:loop_size])
+            worst = max(worst, difference)
+            self.stdout.write(
+                f'{name:20} {loop_time * 1e6:15.2f} {array_time * 1e9:15.1f} '
+                f'{loop_time / max(array_time, 1e-12):8.0f}x {difference:13.2e}'
+            )
+
+        legacy = self.relative_difference(
+            _legacy_boil_time_factor(inputs['boil_time']),
+            calculations.tinseth_boil_time_factor(inputs['boil_time'])
+        )
+        self.stdout.write(f'Tinseth boil time factor vs the former 2.718 ** x: max rel diff {legacy:.2e}')
+
+        if worst > 1e-12:
+            self.stdout.write(self.style.ERROR(f'Scalar and array results differ (max rel diff {worst:.2e})'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Scalar and array results are equivalent'))
+
+    def relative_difference(self, expected, actual):
+        """Largest relative difference, ignoring zeros in expected"""
+        expected, actual = np.asarray(expected, dtype=float), np.asarray(actual, dtype=float)
+        scale = np.where(expected != 0, np.abs(expected), 1.0)
+        return float(np.max(np.abs(actual - expected) / scale, initial=0.0))
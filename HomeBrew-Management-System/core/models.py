@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+import numpy as np
+from . import calculations
 
 class TimeStampedModel(models.Model):
     """
@@ -51,30 +53,37 @@ class BeerStyle(TimeStampedModel):
     def __str__(self):
         return f"{self.style_code} - {self.name}"
 
+def _scalar(value):
+    """A Python float for 0-d results, the array otherwise"""
+    return value.item() if np.ndim(value) == 0 else value
+
 class BrewingCalculator:
     """
     Utility class for brewing calculations
+
+    Thin wrappers around core.calculations: every method also accepts NumPy
+    arrays (broadcast against each other) and returns a float for scalars.
     """
     
     @staticmethod
     def sg_to_plato(sg):
         """Convert Specific Gravity to Plato"""
-        return ((sg - 1) * 1000) / 4
+        return _scalar(calculations.sg_to_plato(sg))
     
     @staticmethod
     def plato_to_sg(plato):
         """Convert Plato to Specific Gravity"""
-        return (plato * 4 / 1000) + 1
+        return _scalar(calculations.plato_to_sg(plato))
     
     @staticmethod
     def calculate_abv(og, fg):
         """Calculate ABV from Original and Final Gravity"""
-        return (og - fg) * 131.25
+        return _scalar(calculations.abv(og, fg))
     
     @staticmethod
     def calculate_attenuation(og, fg):
         """Calculate apparent attenuation"""
-        return ((og - fg) / (og - 1)) * 100
+        return _scalar(calculations.attenuation(og, fg))
     
     @staticmethod
     def calculate_strike_water_temp(grain_temp, mash_temp, water_ratio):
@@ -84,7 +93,7 @@ class BrewingCalculator:
         mash_temp: Target mash temperature in Celsius
         water_ratio: Water to grain ratio (L/kg)
         """
-        return ((0.2 / water_ratio) * (mash_temp - grain_temp)) + mash_temp
+        return _scalar(calculations.strike_water_temp(grain_temp, mash_temp, water_ratio))
     
     @staticmethod
     def calculate_grain_absorption(grain_weight_kg):
@@ -92,7 +101,7 @@ class BrewingCalculator:
         Calculate water absorbed by grain (BIAB specific)
         Returns absorption in liters
         """
-        return grain_weight_kg * 0.96  # 0.96L per kg of grain
+        return _scalar(calculations.grain_absorption(grain_weight_kg))
     
     @staticmethod
     def calculate_boil_off(boil_time_minutes, boil_off_rate=4.0):
@@ -100,7 +109,17 @@ class BrewingCalculator:
         Calculate boil-off volume
         boil_off_rate: % per hour (default 4%)
         """
-        return (boil_time_minutes / 60) * boil_off_rate
+        return _scalar(calculations.boil_off(boil_time_minutes, boil_off_rate))
+    
+    @staticmethod
+    def tinseth_bigness_factor(og):
+        """Tinseth gravity ("bigness") factor of hop utilization"""
+        return _scalar(calculations.tinseth_bigness_factor(og))
+    
+    @staticmethod
+    def tinseth_boil_time_factor(boil_time_minutes):
+        """Tinseth boil time factor of hop utilization"""
+        return _scalar(calculations.tinseth_boil_time_factor(boil_time_minutes))
     
     @staticmethod
     def calculate_ibu_tinseth(alpha_acid, hop_weight_grams, boil_time_minutes, 
@@ -108,13 +127,22 @@ class BrewingCalculator:
         """
         Calculate IBU using Tinseth formula
         """
-        utilization = (1.65 * (0.000125 ** (og - 1))) * \
-                     ((1 - 2.718 ** (-0.04 * boil_time_minutes)) / 4.15)
-        
-        ibu = (alpha_acid * hop_weight_grams * utilization * 1000) / \
-              (batch_size_liters * 100)
-        
-        return ibu
+        return _scalar(calculations.ibu_tinseth(
+            alpha_acid, hop_weight_grams, boil_time_minutes, batch_size_liters, og
+        ))
+    
+    @staticmethod
+    def calculate_hop_weight_for_ibu(target_ibu, alpha_acid, boil_time_minutes,
+                                     batch_size_liters, og):
+        """
+        Calculate hop weight (grams) for a target IBU with the Tinseth formula
+        (0 for additions without utilization)
+        """
+        grams = calculations.hop_weights_for_ibu(
+            target_ibu, np.asarray(alpha_acid, dtype=float)[..., None],
+            np.asarray(boil_time_minutes, dtype=float)[..., None], batch_size_liters, og
+        )
+        return _scalar(grams[..., 0])
     
     @staticmethod
     def calculate_srm_color(grain_weights_and_colors):
@@ -122,8 +150,8 @@ class BrewingCalculator:
         Calculate SRM color
         grain_weights_and_colors: list of tuples (weight_kg, color_srm)
         """
-        total_mcu = sum(weight * color for weight, color in grain_weights_and_colors)
-        return 1.4922 * (total_mcu ** 0.6859)
+        pairs = np.asarray(grain_weights_and_colors, dtype=float).reshape(-1, 2)
+        return _scalar(calculations.srm_morey(calculations.mcu(pairs[:, 0], pairs[:, 1])))
     
     @staticmethod
     def calculate_extract_points(grain_weight_kg, extract_potential, efficiency):
@@ -132,6 +160,4 @@ class BrewingCalculator:
         extract_potential: Points per pound per gallon (PPG)
         efficiency: Brewing efficiency as decimal (0.75 for 75%)
         """
-        # Convert to metric: 1 kg = 2.2 lbs, 1 liter = 0.264 gallons
-        points = (grain_weight_kg * 2.2 * extract_potential * efficiency) / 0.264
-        return points
\ No newline at end of file
+        return _scalar(calculations.extract_points(grain_weight_kg, extract_potential, efficiency))
\ No newline at end of file
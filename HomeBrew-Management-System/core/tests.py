@@ -1,3 +1,246 @@
-from django.test import TestCase
+import io
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from . import calculations, hop_utilization, water
+from .models import BrewingCalculator
+from .utils import WaterChemistry
 
-# Create your tests here.
+
+class BrewingCalculatorTests(SimpleTestCase):
+    def test_scalar_methods_return_floats(self):
+        self.assertIsInstance(BrewingCalculator.sg_to_plato(1.048), float)
+        self.assertAlmostEqual(BrewingCalculator.sg_to_plato(1.048), 12.0)
+        self.assertAlmostEqual(BrewingCalculator.plato_to_sg(12), 1.048)
+        self.assertAlmostEqual(BrewingCalculator.calculate_abv(1.050, 1.010), 5.25)
+        self.assertAlmostEqual(BrewingCalculator.calculate_attenuation(1.050, 1.010), 80.0)
+        self.assertAlmostEqual(BrewingCalculator.calculate_strike_water_temp(20, 67, 3), 67 + 0.2 / 3 * 47)
+        self.assertAlmostEqual(BrewingCalculator.calculate_grain_absorption(5), 4.8)
+        self.assertAlmostEqual(BrewingCalculator.calculate_boil_off(90), 6.0)
+        self.assertEqual(BrewingCalculator.calculate_srm_color([]), 0)
+
+    def test_arrays_match_the_scalar_methods(self):
+        og = np.array([1.040, 1.055, 1.080])
+        alpha = np.array([5.5, 12.0, 8.0])
+        grams = np.array([30.0, 20.0, 50.0])
+        minutes = np.array([10.0, 60.0, 0.0])
+
+        ibu = BrewingCalculator.calculate_ibu_tinseth(alpha, grams, minutes, 20, og)
+        self.assertEqual(ibu.shape, (3,))
+        for i in range(3):
+            self.assertEqual(ibu[i], BrewingCalculator.calculate_ibu_tinseth(alpha[i], grams[i], minutes[i], 20, og[i]))
+        self.assertEqual(ibu[2], 0)
+
+        abv = BrewingCalculator.calculate_abv(og[:, None], np.array([1.008, 1.012]))
+        self.assertEqual(abv.shape, (3, 2))
+        self.assertEqual(abv[1, 1], BrewingCalculator.calculate_abv(1.055, 1.012))
+
+    def test_tinseth_matches_the_published_formula(self):
+        # 28 g of 6% AA boiled for 60 minutes in 19 L at 1.050
+        utilization = 1.65 * 0.000125 ** 0.050 * (1 - np.exp(-0.04 * 60)) / 4.15
+        expected = 6 / 100 * 28 * 1000 / 19 * utilization
+        self.assertAlmostEqual(BrewingCalculator.calculate_ibu_tinseth(6, 28, 60, 19, 1.050), expected)
+
+    def test_srm_sums_the_grain_bill(self):
+        self.assertAlmostEqual(
+            BrewingCalculator.calculate_srm_color([(4.5, 3), (0.4, 40)]),
+            float(calculations.srm_morey(4.5 * 3 + 0.4 * 40))
+        )
+
+    def test_benchmark_reports_equivalent_results(self):
+        out = io.StringIO()
+        call_command('benchmark_calculations', size=200, loop_size=50, stdout=out)
+        self.assertIn('Scalar and array results are equivalent', out.getvalue())
+
+
+class HopWeightSolverTests(SimpleTestCase):
+    def ibu(self, grams, alpha, minutes, batch_size=20, og=1.050):
+        return calculations.ibu_tinseth(alpha, grams, minutes, batch_size, og).sum(axis=-1)
+
+    def test_solved_weights_hit_the_target(self):
+        alpha, minutes = [12.0, 5.5], [60, 15]
+        grams = calculations.hop_weights_for_ibu(40, alpha, minutes, 20, 1.050)
+        self.assertAlmostEqual(float(self.ibu(grams, alpha, minutes)), 40)
+        # Equal shares: both additions give half the IBU
+        contributions = calculations.ibu_tinseth(alpha, grams, minutes, 20, 1.050)
+        self.assertAlmostEqual(contributions[0], contributions[1])
+
+        grams = calculations.hop_weights_for_ibu(40, alpha, minutes, 20, 1.050, shares=[3, 1])
+        contributions = calculations.ibu_tinseth(alpha, grams, minutes, 20, 1.050)
+        self.assertAlmostEqual(contributions[0], 30)
+        self.assertAlmostEqual(contributions[1], 10)
+
+    def test_fixed_additions_count_towards_the_target(self):
+        alpha, minutes = [12.0, 5.5, 5.5], [60, 10, 0]
+        grams = calculations.hop_weights_for_ibu(
+            40, alpha, minutes, 20, 1.050, fixed_grams=[np.nan, 30, np.nan]
+        )
+        self.assertEqual(grams[1], 30)
+        # Flameout has no utilization and gets no weight
+        self.assertEqual(grams[2], 0)
+        self.assertAlmostEqual(float(self.ibu(grams, alpha, minutes)), 40)
+
+    def test_min_share_keeps_solved_additions(self):
+        alpha, minutes = [12.0, 5.5], [60, 10]
+        # The fixed addition alone already exceeds the target
+        grams = calculations.hop_weights_for_ibu(
+            10, alpha, minutes, 20, 1.050, fixed_grams=[np.nan, 200], min_share=0.5
+        )
+        self.assertAlmostEqual(float(calculations.ibu_tinseth(12.0, grams[0], 60, 20, 1.050)), 5)
+
+    def test_many_schedules_in_one_call(self):
+        targets = np.array([20.0, 40.0, 60.0])
+        og = np.array([1.040, 1.050, 1.070])
+        grams = calculations.hop_weights_for_ibu(targets, [[12.0, 5.5]], [[60, 20]], 20, og)
+        self.assertEqual(grams.shape, (3, 2))
+        np.testing.assert_allclose(self.ibu(grams, [12.0, 5.5], [60, 20], og=og[:, None]), targets)
+
+    def test_calculator_inverts_tinseth(self):
+        grams = BrewingCalculator.calculate_hop_weight_for_ibu(35, 12, 60, 20, 1.055)
+        self.assertAlmostEqual(BrewingCalculator.calculate_ibu_tinseth(12, grams, 60, 20, 1.055), 35)
+        self.assertEqual(BrewingCalculator.calculate_hop_weight_for_ibu(35, 12, 0, 20, 1.055), 0)
+
+
+class SaltSolverTests(SimpleTestCase):
+    soft = {'calcium': 10, 'magnesium': 2, 'sodium': 5, 'chloride': 10, 'sulfate': 10, 'bicarbonate': 30}
+
+    def objective(self, per_liter, source, target):
+        """Weighted squared error the solver minimizes"""
+        weights = 1.0 / np.maximum(target, water.MIN_ION_SCALE)
+        return float(np.sum((weights * (source + water.ION_CONTRIBUTIONS @ per_liter - target)) ** 2))
+
+    def test_reachable_target_is_matched(self):
+        per_liter = np.array([0.3, 0.2, 0.1, 0.0, 0.05])
+        source = water.profile_array(self.soft)
+        target = source + water.ION_CONTRIBUTIONS @ per_liter
+
+        result = water.solve_salts(source, target, volume_liters=20)
+        np.testing.assert_allclose(result['grams_per_liter'], per_liter, atol=1e-6)
+        np.testing.assert_allclose(result['grams'], per_liter * 20, atol=1e-5)
+        np.testing.assert_allclose(result['profile'], target, atol=1e-3)
+
+    def test_additions_stay_within_bounds(self):
+        rng = np.random.default_rng(0)
+        source = water.profile_array(self.soft)
+        targets = rng.uniform(0, 600, (50, len(water.IONS)))
+        upper = np.array([water.MAX_GRAMS_PER_LITER[salt] for salt in water.SALTS])
+
+        per_liter = water.solve_salts(source, targets)['grams_per_liter']
+        self.assertTrue(np.all(per_liter >= 0))
+        self.assertTrue(np.all(per_liter <= upper + 1e-12))
+        # No feasible step along a single salt improves the fit
+        for solution, target in zip(per_liter, targets):
+            best = self.objective(solution, source, target)
+            for salt in range(len(water.SALTS)):
+                for step in (-0.01, 0.01):
+                    moved = solution.copy()
+                    moved[salt] = np.clip(moved[salt] + step, 0, upper[salt])
+                    self.assertGreaterEqual(self.objective(moved, source, target), best - 1e-9)
+
+    def test_salts_are_not_removed(self):
+        hard = {'calcium': 150, 'magnesium': 20, 'sodium': 50, 'chloride': 100, 'sulfate': 300, 'bicarbonate': 200}
+        result = water.solve_salts(hard, self.soft)
+        np.testing.assert_array_equal(result['grams_per_liter'], np.zeros(len(water.SALTS)))
+
+    def test_ions_without_target_are_ignored(self):
+        per_liter = water.solve_salts(self.soft, {'sulfate': 300})['grams_per_liter']
+        # Gypsum and Epsom salt are the sulfate salts
+        self.assertEqual(per_liter[water.SALTS.index('baking_soda')], 0)
+        self.assertAlmostEqual(float(water.ION_CONTRIBUTIONS[4] @ per_liter) + 10, 300, places=3)
+
+    def test_batches_match_single_solves(self):
+        targets = [
+            {'calcium': 50, 'sulfate': 100, 'chloride': 50},
+            {'calcium': 100, 'sulfate': 300, 'chloride': 50, 'magnesium': 10},
+            {'calcium': 50, 'sulfate': 100, 'chloride': 50},
+        ]
+        volumes = np.array([10.0, 20.0, 30.0])
+        batch = water.solve_salts(self.soft, targets, volumes)
+        self.assertEqual(batch['grams'].shape, (3, len(water.SALTS)))
+        for target, volume, grams in zip(targets, volumes, batch['grams']):
+            np.testing.assert_allclose(grams, water.solve_salts(self.soft, target, volume)['grams'])
+
+        capped = water.solve_salts(self.soft, {'sulfate': 1000}, max_grams_per_liter={'gypsum': 0.2})
+        self.assertLessEqual(capped['grams_per_liter'][water.SALTS.index('gypsum')], 0.2)
+
+    def test_water_chemistry_wrappers(self):
+        target = {'calcium': 100, 'sulfate': 250}
+        additions = WaterChemistry.calculate_salt_additions(20, self.soft, target)
+        self.assertIn('gypsum', additions)
+        self.assertTrue(all(amount > 0 for amount in additions.values()))
+
+        batches = WaterChemistry.calculate_salt_additions_batch([20, 40], self.soft, target)
+        self.assertEqual(len(batches), 2)
+        self.assertAlmostEqual(batches[1]['additions']['gypsum'], 2 * batches[0]['additions']['gypsum'], places=1)
+        self.assertEqual(set(batches[0]['profile']), set(water.IONS))
+
+
+class HopUtilizationTests(SimpleTestCase):
+    def test_tinseth_matches_the_calculator(self):
+        units = hop_utilization.ibu_units([12.0, 5.5], [20, 30], [60, 10])
+        ibu = hop_utilization.ibu_from_units(units.sum(), 1.050, 20)
+        expected = calculations.ibu_tinseth([12.0, 5.5], [20, 30], [60, 10], 20, 1.050).sum()
+        self.assertAlmostEqual(float(ibu), float(expected))
+
+    def test_models_agree_on_a_typical_bittering_addition(self):
+        units = hop_utilization.ibu_units(12.0, 25, 60, model=['tinseth', 'rager', 'garetz'])
+        ibu = hop_utilization.ibu_from_units(units, 1.050, 20, model=['tinseth', 'rager', 'garetz'])
+        # Same order of magnitude, but each model has its own curve
+        self.assertTrue(np.all((ibu > 25) & (ibu < 60)))
+        self.assertEqual(len(np.unique(ibu.round(3))), 3)
+
+    def test_model_arrays_match_single_models(self):
+        models = np.array(['tinseth', 'rager', 'garetz', 'tinseth'])
+        alpha, grams, minutes = np.array([12.0, 5.5, 8.0, 14.0]), np.array([20, 40, 30, 10]), np.array([60, 15, 45, 90])
+        units = hop_utilization.ibu_units(alpha, grams, minutes, model=models)
+        ibu = hop_utilization.ibu_from_units(units, 1.070, 23, model=models)
+        for i, name in enumerate(models):
+            model = hop_utilization.get_model(name)
+            self.assertEqual(units[i], model.units(alpha[i], grams[i], minutes[i]))
+            self.assertAlmostEqual(ibu[i], float(model.ibu(units[i], 1.070, 23)))
+
+    def test_gravity_corrections(self):
+        for name in ('rager', 'garetz'):
+            model = hop_utilization.get_model(name)
+            # No correction up to 1.050
+            self.assertEqual(model.ibu(500, 1.040, 20), model.ibu(500, 1.050, 20))
+            self.assertLess(model.ibu(500, 1.090, 20), model.ibu(500, 1.050, 20))
+
+    def test_garetz_hopping_rate_is_solved(self):
+        garetz = hop_utilization.get_model('garetz')
+        ibu = float(garetz.ibu(2000, 1.050, 20))
+        self.assertAlmostEqual(ibu * (1 + ibu / garetz.HOPPING_RATE), 2000 * 10 / 20)
+        self.assertEqual(garetz.time_factor(5), 0)
+        self.assertEqual(garetz.time_factor(60), 0.21)
+
+    def test_uses_that_are_not_boiled(self):
+        minutes = hop_utilization.boil_minutes([20, 20, 20, 0, 3], ['boil', 'flameout', 'whirlpool', 'flameout', 'dry_hop'])
+        self.assertEqual(minutes[0], 20)
+        # Cooling wort isomerizes slower than the boil, and whirlpool wort slower still
+        self.assertTrue(0 < minutes[2] < minutes[1] < 20)
+        self.assertEqual(minutes[3], 0)
+        self.assertTrue(np.isnan(minutes[4]))
+
+        units = hop_utilization.ibu_units(5.5, 50, [20, 3], ['whirlpool', 'dry_hop'])
+        self.assertGreater(units[0], 0)
+        self.assertEqual(units[1], 0)
+
+    def test_registry(self):
+        self.assertEqual([name for name, _ in hop_utilization.model_choices()][:3], ['tinseth', 'rager', 'garetz'])
+        with self.assertRaises(KeyError):
+            hop_utilization.get_model('daniels')
+
+        class Linear(hop_utilization.UtilizationModel):
+            name = 'linear'
+            label = 'Linear'
+
+            def time_factor(self, minutes):
+                return np.asarray(minutes, dtype=float) / 300
+
+            def ibu(self, units, og, batch_size_liters):
+                return np.asarray(units, dtype=float) * 10 / batch_size_liters
+
+        hop_utilization.register(Linear)
+        self.addCleanup(hop_utilization.MODELS.pop, 'linear')
+        self.assertAlmostEqual(float(hop_utilization.ibu_units(10, 30, 60, model='linear')), 60)
+        self.assertIn(('linear', 'Linear'), hop_utilization.model_choices())
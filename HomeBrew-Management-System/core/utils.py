@@ -3,6 +3,8 @@ from django.utils import timezone
 from datetime import timedelta
 import re
 import math
+import numpy as np
+from . import water
 
 class RecipeValidator:
     """Validation utilities for recipes"""
@@ -161,8 +163,10 @@ class RecipeScaler:
             'scale_factor': scale_factor
         }
         
+        grain_additions, hop_additions, yeast_additions = recipe.load_ingredients()
+        
         # Scale grains
-        for grain_addition in recipe.grainaddition_set.all():
+        for grain_addition in grain_additions:
             scaled_data['grains'].append({
                 'grain': grain_addition.grain,
                 'weight': grain_addition.weight * scale_factor,
@@ -170,7 +174,7 @@ class RecipeScaler:
             })
         
         # Scale hops
-        for hop_addition in recipe.hopaddition_set.all():
+        for hop_addition in hop_additions:
             hop_scale = scale_factor if scale_hops else 1.0
             scaled_data['hops'].append({
                 'hop': hop_addition.hop,
@@ -180,7 +184,7 @@ class RecipeScaler:
             })
         
         # Scale yeast (less linear scaling)
-        for yeast_addition in recipe.yeastaddition_set.all():
+        for yeast_addition in yeast_additions:
             # Yeast scaling is not linear - use square root
             yeast_scale = math.sqrt(scale_factor)
             scaled_data['yeast'].append({
@@ -189,27 +193,69 @@ class RecipeScaler:
             })
         
         return scaled_data
+    
+    @staticmethod
+    def scale_stats(recipe, new_batch_sizes, scale_hops=True):
+        """
+        Stats of the recipe scaled to each of new_batch_sizes, computed in
+        memory from the recipe's running totals (grains, and hops unless
+        scale_hops is False, scale with the batch size). Returns one dict of
+        stats per batch size.
+        """
+        from recipes.stats import CALCULATED_FIELDS, stats_from_totals
+        
+        batch_sizes = np.asarray(new_batch_sizes, dtype=float)
+        scale_factors = batch_sizes / recipe.batch_size
+        stats = stats_from_totals(
+            batch_sizes,
+            recipe.efficiency,
+            recipe.total_extract_units * scale_factors,
+            recipe.total_color_units * scale_factors,
+            recipe.total_ibu_units * (scale_factors if scale_hops else 1.0),
+            recipe.total_attenuation,
+            recipe.yeast_count,
+            recipe.ibu_model
+        )
+        return [
+            {field: float(stats[field][index]) for field in CALCULATED_FIELDS}
+            for index in range(len(batch_sizes))
+        ]
 
 class WaterChemistry:
     """Water chemistry calculations"""
     
     @staticmethod
-    def calculate_salt_additions(volume_liters, water_profile, target_profile):
-        """Calculate salt additions for water treatment"""
-        # This is a simplified version - real water chemistry is complex
-        additions = {}
-        
-        # Calcium Chloride for calcium and chloride
-        ca_diff = target_profile.get('calcium', 50) - water_profile.get('calcium', 50)
-        if ca_diff > 0:
-            additions['calcium_chloride'] = ca_diff * volume_liters * 0.00368  # Simplified calculation
-        
-        # Gypsum for calcium and sulfate
-        so4_diff = target_profile.get('sulfate', 150) - water_profile.get('sulfate', 50)
-        if so4_diff > 0:
-            additions['gypsum'] = so4_diff * volume_liters * 0.00430  # Simplified calculation
-        
-        return additions
+    def calculate_salt_additions(volume_liters, water_profile, target_profile, max_grams_per_liter=None):
+        """
+        Calculate salt additions (grams) for water treatment: the mix of
+        gypsum, calcium chloride, Epsom salt, baking soda and table salt that
+        brings water_profile closest to target_profile ({ion: ppm} with
+        calcium, magnesium, sodium, chloride, sulfate and bicarbonate).
+        Ions missing from the target are not adjusted. Only salts to add are
+        returned.
+        """
+        grams = water.solve_salts(water_profile, target_profile, volume_liters, max_grams_per_liter)['grams']
+        return {salt: round(float(amount), 2) for salt, amount in zip(water.SALTS, grams) if amount >= 0.005}
+    
+    @staticmethod
+    def calculate_salt_additions_batch(volumes_liters, water_profiles, target_profiles, max_grams_per_liter=None):
+        """
+        Salt additions for many batches in one solve. Volumes and profiles
+        (one profile, or one per batch) broadcast against each other; returns
+        one dict per batch with the grams of each salt and the resulting
+        water profile.
+        """
+        result = water.solve_salts(water_profiles, target_profiles, np.asarray(volumes_liters, dtype=float),
+                                   max_grams_per_liter)
+        grams = np.atleast_2d(result['grams'])
+        profiles = np.atleast_2d(result['profile'])
+        return [
+            {
+                'additions': {salt: round(float(amount), 2) for salt, amount in zip(water.SALTS, batch_grams)},
+                'profile': {ion: round(float(ppm), 1) for ion, ppm in zip(water.IONS, profile)},
+            }
+            for batch_grams, profile in zip(grams, profiles)
+        ]
 
 class InventoryAlerts:
     """Inventory management utilities"""
@@ -270,86 +316,5 @@ def parse_recipe_text(text):
 
 def export_recipe_beerxml(recipe):
     """Export recipe to BeerXML format"""
-    xml_template = """<?xml version="1.0" encoding="UTF-8"?>
-<RECIPES>
-<RECIPE>
-    <NAME>{name}</NAME>
-    <VERSION>1</VERSION>
-    <TYPE>All Grain</TYPE>
-    <STYLE>
-        <NAME>{style}</NAME>
-        <VERSION>1</VERSION>
-        <CATEGORY>Custom</CATEGORY>
-        <CATEGORY_NUMBER>1</CATEGORY_NUMBER>
-        <STYLE_LETTER>A</STYLE_LETTER>
-        <STYLE_GUIDE>Custom</STYLE_GUIDE>
-    </STYLE>
-    <BREWER>{brewer}</BREWER>
-    <BATCH_SIZE>{batch_size}</BATCH_SIZE>
-    <BOIL_SIZE>{boil_size}</BOIL_SIZE>
-    <BOIL_TIME>60</BOIL_TIME>
-    <EFFICIENCY>{efficiency}</EFFICIENCY>
-    <FERMENTABLES>
-        {fermentables}
-    </FERMENTABLES>
-    <HOPS>
-        {hops}
-    </HOPS>
-    <YEASTS>
-        {yeasts}
-    </YEASTS>
-    <NOTES>{notes}</NOTES>
-</RECIPE>
-</RECIPES>"""
-    
-    # Build fermentables XML
-    fermentables_xml = ""
-    for grain in recipe.grainaddition_set.all():
-        fermentables_xml += f"""
-        <FERMENTABLE>
-            <NAME>{grain.grain.name}</NAME>
-            <VERSION>1</VERSION>
-            <TYPE>Grain</TYPE>
-            <AMOUNT>{grain.weight}</AMOUNT>
-            <YIELD>{grain.grain.extract_potential}</YIELD>
-            <COLOR>{grain.grain.color}</COLOR>
-        </FERMENTABLE>"""
-    
-    # Build hops XML
-    hops_xml = ""
-    for hop in recipe.hopaddition_set.all():
-        hops_xml += f"""
-        <HOP>
-            <NAME>{hop.hop.name}</NAME>
-            <VERSION>1</VERSION>
-            <ALPHA>{hop.hop.alpha_acid}</ALPHA>
-            <AMOUNT>{hop.weight}</AMOUNT>
-            <USE>{hop.use.capitalize()}</USE>
-            <TIME>{hop.boil_time}</TIME>
-        </HOP>"""
-    
-    # Build yeasts XML
-    yeasts_xml = ""
-    for yeast in recipe.yeastaddition_set.all():
-        yeasts_xml += f"""
-        <YEAST>
-            <NAME>{yeast.yeast.name}</NAME>
-            <VERSION>1</VERSION>
-            <TYPE>{yeast.yeast.yeast_type.capitalize()}</TYPE>
-            <FORM>Liquid</FORM>
-            <AMOUNT>{yeast.amount}</AMOUNT>
-            <ATTENUATION>{yeast.yeast.attenuation}</ATTENUATION>
-        </YEAST>"""
-    
-    return xml_template.format(
-        name=recipe.name,
-        style=recipe.style.name,
-        brewer=recipe.created_by.username,
-        batch_size=recipe.batch_size,
-        boil_size=recipe.batch_size * 1.2,  # Estimate
-        efficiency=recipe.efficiency,
-        fermentables=fermentables_xml,
-        hops=hops_xml,
-        yeasts=yeasts_xml,
-        notes=recipe.notes or ""
-    )
\ No newline at end of file
+    from recipes.beerxml import iter_beerxml
+    return ''.join(iter_beerxml([recipe]))
@@ -0,0 +1,137 @@
+"""
+Brewing salt solver.
+
+Finds the mix of gypsum, calcium chloride, Epsom salt, baking soda and table
+salt that brings a source water closest to a target ion profile. The fit is
+a bounded non-negative least squares problem in grams per liter: each ion's
+error is weighted by the inverse of its target (at least MIN_ION_SCALE ppm),
+so 5 ppm off a 10 ppm magnesium target counts as much as 150 ppm off a
+300 ppm sulfate target. Ions without a target are left out of the fit.
+
+Many problems are solved in one call: profiles and volumes broadcast against
+each other, and the grams per liter do not depend on the volume, so a week
+of batches that share their water costs a single solve.
+"""
+import numpy as np
+
+IONS = ['calcium', 'magnesium', 'sodium', 'chloride', 'sulfate', 'bicarbonate']
+SALTS = ['gypsum', 'calcium_chloride', 'epsom_salt', 'baking_soda', 'table_salt']
+
+# ppm of each ion (rows, IONS order) from 1 g of each salt (columns, SALTS order) in 1 L
+ION_CONTRIBUTIONS = np.array([
+    # gypsum, CaCl2.2H2O, MgSO4.7H2O, NaHCO3, NaCl
+    [232.8, 272.6, 0.0, 0.0, 0.0],      # calcium
+    [0.0, 0.0, 98.6, 0.0, 0.0],         # magnesium
+    [0.0, 0.0, 0.0, 273.6, 393.4],      # sodium
+    [0.0, 482.3, 0.0, 0.0, 606.6],      # chloride
+    [557.9, 0.0, 389.7, 0.0, 0.0],      # sulfate
+    [0.0, 0.0, 0.0, 726.4, 0.0],        # bicarbonate
+])
+
+# Largest addition of each salt (g/L)
+MAX_GRAMS_PER_LITER = {
+    'gypsum': 1.0,
+    'calcium_chloride': 1.0,
+    'epsom_salt': 0.5,
+    'baking_soda': 0.5,
+    'table_salt': 0.3,
+}
+
+# Smallest target (ppm) used to scale an ion's error
+MIN_ION_SCALE = 10.0
+
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-9
+
+
+def profile_array(profiles):
+    """
+    (..., 6) array of ion profiles given as a dict ({ion: ppm}), a list of
+    dicts or an array in IONS order; missing ions are NaN
+    """
+    if isinstance(profiles, dict):
+        return np.array([profiles.get(ion, np.nan) for ion in IONS], dtype=float)
+    if len(profiles) and isinstance(profiles[0], dict):
+        return np.array([[profile.get(ion, np.nan) for ion in IONS] for profile in profiles], dtype=float)
+    return np.asarray(profiles, dtype=float)
+
+
+def _bounded_least_squares(gram, rhs, upper):
+    """
+    Minimize 1/2 x'Gx - b'x for 0 <= x <= upper by cyclic coordinate descent,
+    for stacked problems: gram (n, k, k), rhs (n, k), upper (n, k).
+    """
+    solution = np.zeros(rhs.shape)
+    diagonal = np.maximum(np.einsum('nii->ni', gram), 1e-12)
+    for _ in range(MAX_ITERATIONS):
+        largest_step = 0.0
+        for salt in range(rhs.shape[1]):
+            gradient = np.einsum('nk,nk->n', gram[:, salt], solution) - rhs[:, salt]
+            updated = np.clip(solution[:, salt] - gradient / diagonal[:, salt], 0.0, upper[:, salt])
+            largest_step = max(largest_step, float(np.max(np.abs(updated - solution[:, salt]), initial=0.0)))
+            solution[:, salt] = updated
+        if largest_step < TOLERANCE:
+            break
+
+    # Coordinate descent can crawl along correlated salts: solve the salts
+    # strictly inside their bounds exactly, keeping the ones at a bound fixed
+    free = (solution > TOLERANCE) & (solution < upper - TOLERANCE)
+    size = rhs.shape[1]
+    # (identity rows for fixed salts, a tiny ridge for collinear free ones)
+    reduced = np.where(free[:, :, None] & free[:, None, :], gram, 0.0)
+    reduced = reduced + np.where(free, 1e-12, 1.0)[:, :, None] * np.eye(size)
+    fixed = np.where(free, 0.0, solution)
+    reduced_rhs = np.where(free, rhs - np.einsum('nkl,nl->nk', gram, fixed), fixed)
+    exact = np.linalg.solve(reduced, reduced_rhs[..., None])[..., 0]
+
+    def objective(x):
+        return 0.5 * np.einsum('nk,nkl,nl->n', x, gram, x) - np.einsum('nk,nk->n', rhs, x)
+
+    improved = np.all((exact >= 0) & (exact <= upper), axis=1) & (objective(exact) < objective(solution))
+    return np.where(improved[:, None], exact, solution)
+
+
+def solve_salts(source, target, volume_liters=1.0, max_grams_per_liter=None):
+    """
+    Salt additions that bring source water closest to target.
+
+    source and target are ion profiles (see profile_array) and broadcast
+    against each other and against volume_liters; missing source ions count
+    as 0 ppm. max_grams_per_liter overrides MAX_GRAMS_PER_LITER per salt.
+
+    Returns a dict of arrays: grams (..., 5, SALTS order) for the volume,
+    grams_per_liter and the resulting profile (..., 6, IONS order).
+    """
+    source = np.nan_to_num(profile_array(source))
+    target = profile_array(target)
+    volume_liters = np.asarray(volume_liters, dtype=float)
+    shape = np.broadcast_shapes(source.shape[:-1], target.shape[:-1], volume_liters.shape)
+
+    limits = dict(MAX_GRAMS_PER_LITER, **(max_grams_per_liter or {}))
+    upper = np.array([limits[salt] for salt in SALTS], dtype=float)
+
+    # Solve once per distinct (source, target) pair
+    pairs = np.concatenate(np.broadcast_arrays(source, target), axis=-1)
+    pair_shape = pairs.shape[:-1]
+    pairs = pairs.reshape(-1, 2 * len(IONS))
+    # (missing target ions as -1, since np.unique does not group NaN)
+    unique_pairs, inverse = np.unique(np.nan_to_num(pairs, nan=-1.0), axis=0, return_inverse=True)
+    unique_pairs = np.where(unique_pairs == -1.0, np.nan, unique_pairs)
+    pair_source, pair_target = unique_pairs[:, :len(IONS)], unique_pairs[:, len(IONS):]
+
+    # Weighted rows: (ion contributions) x = target - source, for the ions with a target
+    weights = np.where(np.isnan(pair_target), 0.0, 1.0 / np.maximum(np.nan_to_num(pair_target), MIN_ION_SCALE))
+    design = weights[:, :, None] * ION_CONTRIBUTIONS[None]
+    deficit = weights * np.nan_to_num(pair_target - pair_source)
+    gram = np.einsum('nik,nil->nkl', design, design)
+    rhs = np.einsum('nik,ni->nk', design, deficit)
+
+    per_liter = _bounded_least_squares(gram, rhs, np.broadcast_to(upper, rhs.shape))
+    per_liter = per_liter[inverse.reshape(-1)].reshape(pair_shape + (len(SALTS),))
+    per_liter = np.broadcast_to(per_liter, shape + (len(SALTS),))
+    resulting = np.broadcast_to(source, shape + (len(IONS),)) + per_liter @ ION_CONTRIBUTIONS.T
+    return {
+        'grams': per_liter * volume_liters[..., None],
+        'grams_per_liter': per_liter,
+        'profile': resulting,
+    }
@@ -136,5 +136,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'recipes': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
\ No newline at end of file
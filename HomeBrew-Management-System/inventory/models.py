@@ -75,6 +75,57 @@ class InventoryItem(TimeStampedModel):
     def __str__(self):
         return f"{self.ingredient_name} ({self.current_stock} {self.unit})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_prices = instance._current_prices()
+        instance._loaded_ingredient = instance._ingredient_key()
+        return instance
+    
+    def _current_prices(self):
+        """Prices as floats, or None when the price fields were not loaded"""
+        deferred = self.get_deferred_fields()
+        if 'cost_per_kg' in deferred or 'cost_per_unit' in deferred:
+            return None
+        return (float(self.cost_per_kg or 0), float(self.cost_per_unit or 0))
+    
+    def _ingredient_key(self):
+        """(user, ingredient type, ingredient id), or None when not loaded"""
+        if self.get_deferred_fields() & {'user', 'ingredient_type', 'ingredient_id'}:
+            return None
+        return (self.user_id, self.ingredient_type, self.ingredient_id)
+    
+    def save(self, *args, **kwargs):
+        """
+        Save and refresh stored recipe costs when the price or the ingredient
+        changed (for the recipes of the previous ingredient too)
+        """
+        prices = self._current_prices()
+        key = self._ingredient_key()
+        loaded_key = getattr(self, '_loaded_ingredient', None)
+        price_changed = prices != getattr(self, '_loaded_prices', None)
+        key_changed = key != loaded_key
+        super().save(*args, **kwargs)
+        
+        if key_changed and loaded_key is not None:
+            from recipes.costing import refresh_costs_for_ingredient
+            refresh_costs_for_ingredient(*loaded_key)
+        if (price_changed or key_changed) and prices is not None and key is not None:
+            self._loaded_prices = prices
+            self._loaded_ingredient = key
+            self.refresh_recipe_costs()
+    
+    def delete(self, *args, **kwargs):
+        """Delete and refresh stored costs of recipes that used this price"""
+        result = super().delete(*args, **kwargs)
+        self.refresh_recipe_costs()
+        return result
+    
+    def refresh_recipe_costs(self):
+        """Recalculate stored costs of this user's recipes using this ingredient"""
+        from recipes.costing import refresh_costs_for_ingredient
+        return refresh_costs_for_ingredient(self.user_id, self.ingredient_type, self.ingredient_id)
+    
     def get_absolute_url(self):
         return reverse('inventory_detail', kwargs={'pk': self.pk})
     
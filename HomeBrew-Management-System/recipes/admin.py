@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition
+from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition, RecipeGenerationJob
 
 class GrainAdditionInline(admin.TabularInline):
     model = GrainAddition
@@ -19,7 +19,8 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ['style', 'created_by', 'is_public', 'created_at']
     search_fields = ['name', 'description']
     inlines = [GrainAdditionInline, HopAdditionInline, YeastAdditionInline]
-    readonly_fields = ['calculated_og', 'calculated_fg', 'calculated_ibu', 'calculated_srm', 'calculated_abv']
+    readonly_fields = ['calculated_og', 'calculated_fg', 'calculated_ibu', 'calculated_srm', 'calculated_abv',
+                       'calculated_cost', 'calculated_cost_per_liter']
 
 @admin.register(Grain)
 class GrainAdmin(admin.ModelAdmin):
@@ -31,4 +32,11 @@ class GrainAdmin(admin.ModelAdmin):
 @admin.register(Hop)
 class HopAdmin(admin.ModelAdmin):
     list_display = ['name', 'hop_type', 'alpha_acid']
-    list_filter = ['hop_type', 'alpha_acid']
\ No newline at end of file
+    list_filter = ['hop_type', 'alpha_acid']
+
+@admin.register(RecipeGenerationJob)
+class RecipeGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['style_name', 'batch_size', 'user', 'method', 'source', 'status', 'progress', 'created_at']
+    list_filter = ['status', 'method', 'source']
+    search_fields = ['style_name', 'constraints']
+    readonly_fields = ['recipe_data', 'started_at', 'finished_at']
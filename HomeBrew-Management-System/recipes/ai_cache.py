@@ -0,0 +1,121 @@
+"""
+Response cache for the AI recipe generator.
+
+A model call takes seconds, and brewers often ask for the same style, batch
+size and constraints again. ResponseCache keeps the parsed recipe data (plain
+dicts, never ORM objects) for a normalized request, with a time to live and
+least-recently-used eviction. The ingredient catalog version is part of the
+key, so adding or renaming ingredients invalidates earlier answers.
+"""
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .ingredient_index import catalog_version
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 60 * 60
+
+
+def _normalize_text(value):
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return ' '.join(value.lower().split())
+
+
+def request_key(method, style_name, batch_size_liters, constraints=None):
+    """
+    Cache key of a generation request: the generator method, the style name
+    and constraints in lowercase with collapsed whitespace, the batch size
+    rounded to 0.1 L and the current catalog version.
+    """
+    return (
+        method,
+        _normalize_text(style_name),
+        round(float(batch_size_liters), 1),
+        _normalize_text(constraints),
+        catalog_version(),
+    )
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache with hit/miss counters"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """A copy of the cached value, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring; hit_rate is None before the first lookup"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def response_cache():
+    """
+    The process-wide ResponseCache, sized by the AI_RECIPE_CACHE_SIZE and
+    AI_RECIPE_CACHE_TTL (seconds) settings.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                max_entries=getattr(settings, 'AI_RECIPE_CACHE_SIZE', DEFAULT_MAX_ENTRIES),
+                ttl=getattr(settings, 'AI_RECIPE_CACHE_TTL', DEFAULT_TTL),
+            )
+        return _cache
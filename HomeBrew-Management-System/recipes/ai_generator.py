@@ -1,31 +1,129 @@
 import json
-import requests
+import logging
 from django.conf import settings
 from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition
+from .ingredient_index import ingredient_index
+from .ai_cache import request_key, response_cache
+from .grain_bill import optimize_grain_bill
+from .stats import grain_contribution, stats_from_totals
+from core import calculations
 from core.models import BeerStyle, BrewingCalculator
-import openai  # or any other AI API
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are an expert brewing recipe generator. Always respond with valid JSON only."
+
+class OpenAIClient:
+    """Chat completion client for the OpenAI API"""
+    
+    def __init__(self, api_key, model="gpt-4"):
+        import openai  # only needed when the API is configured
+        self.client = openai.OpenAI(api_key=api_key)
+        self.model = model
+    
+    def complete(self, prompt, system=SYSTEM_PROMPT):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=1500
+        )
+        return response.choices[0].message.content
+
+class StubClient:
+    """
+    Offline stand-in for an API client. response is the text (or a dict,
+    sent as JSON) returned for every prompt, or a function of the prompt.
+    """
+    
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+    
+    def complete(self, prompt, system=SYSTEM_PROMPT):
+        self.prompts.append(prompt)
+        response = self.response(prompt) if callable(self.response) else self.response
+        return response if isinstance(response, str) else json.dumps(response)
+
+def default_openai_client():
+    """OpenAIClient when OPENAI_API_KEY is set, else None"""
+    if getattr(settings, 'OPENAI_API_KEY', None):
+        return OpenAIClient(settings.OPENAI_API_KEY)
+    return None
 
 class AIRecipeGenerator:
     """
     AI-powered recipe generator that creates recipes based on batch size,
     style preferences, and available ingredients.
+    
+    The API clients only need a complete(prompt) method returning the response
+    text, so they can be replaced by a StubClient. Parsed responses are kept in
+    a ResponseCache (the process-wide one by default) keyed by the normalized
+    request.
     """
     
-    def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY) if hasattr(settings, 'OPENAI_API_KEY') else None
+    def __init__(self, openai_client=None, claude_client=None, cache=None):
+        self.openai_client = openai_client if openai_client is not None else default_openai_client()
+        self.claude_client = claude_client
+        self.cache = cache if cache is not None else response_cache()
+        self.generators = {
+            'claude': self.ask_claude,
+            'openai': self.ask_openai,
+            'formulas': self.recipe_data_from_formulas,
+        }
+    
+    def find_style(self, style_name):
+        return BeerStyle.objects.filter(name__icontains=style_name).first() or BeerStyle.objects.first()
     
-    def generate_recipe_with_claude(self, batch_size_liters, style_name, constraints=None):
+    def generate_recipe_data(self, method, batch_size_liters, style_name, constraints=None, fallback=True):
         """
-        Generate recipe using Claude API (if available in your environment)
+        Parsed recipe data for a request, from the cache or from the generator
+        method ('claude', 'openai' or 'formulas'). Falls back to formulas when
+        the API is not configured or fails (or returns None if fallback is
+        False); the fallback is cached under its own key so the API is tried
+        again next time.
         """
-        if not hasattr(window, 'claude'):
-            return self.generate_recipe_with_formulas(batch_size_liters, style_name, constraints)
+        key = request_key(method, style_name, batch_size_liters, constraints)
+        recipe_data = self.cache.get(key)
+        if recipe_data is None:
+            recipe_data = self.generators[method](batch_size_liters, style_name, constraints)
+            if recipe_data is None:
+                if not fallback:
+                    return None
+                return self.generate_recipe_data('formulas', batch_size_liters, style_name, constraints)
+            self.cache.set(key, recipe_data)
+        return recipe_data
+    
+    def generate_recipe_with_claude(self, batch_size_liters, style_name, constraints=None, *, user):
+        """
+        Generate recipe using Claude API (if a client is configured)
+        """
+        recipe_data = self.generate_recipe_data('claude', batch_size_liters, style_name, constraints)
+        return self.create_recipe_from_ai_response(recipe_data, self.find_style(style_name), batch_size_liters, user)
+    
+    def generate_recipe_with_openai(self, batch_size_liters, style_name, constraints=None, *, user):
+        """
+        Generate recipe using OpenAI API
+        """
+        recipe_data = self.generate_recipe_data('openai', batch_size_liters, style_name, constraints)
+        return self.create_recipe_from_ai_response(recipe_data, self.find_style(style_name), batch_size_liters, user)
+    
+    def generate_recipe_with_formulas(self, batch_size_liters, style_name, constraints=None, *, user):
+        """
+        Fallback: Generate recipe using brewing formulas and algorithms
+        """
+        recipe_data = self.generate_recipe_data('formulas', batch_size_liters, style_name, constraints)
+        return self.create_recipe_from_ai_response(recipe_data, self.find_style(style_name), batch_size_liters, user)
+    
+    def ask_claude(self, batch_size_liters, style_name, constraints=None):
+        """Recipe data from the Claude client, or None"""
+        if not self.claude_client:
+            return None
         
-        # Get style information
-        try:
-            style = BeerStyle.objects.get(name__icontains=style_name)
-        except BeerStyle.DoesNotExist:
-            style = BeerStyle.objects.first()  # Fallback
+        style = self.find_style(style_name)
         
         # Get available ingredients
         available_grains = list(Grain.objects.values('name', 'grain_type', 'color', 'extract_potential'))
@@ -70,25 +168,17 @@ class AIRecipeGenerator:
         """
         
         try:
-            # This would use Claude API if available
-            response = window.claude.complete(prompt)
-            recipe_data = json.loads(response)
-            return self.create_recipe_from_ai_response(recipe_data, style, batch_size_liters)
-        except:
-            # Fallback to formula-based generation
-            return self.generate_recipe_with_formulas(batch_size_liters, style_name, constraints)
+            return json.loads(self.claude_client.complete(prompt))
+        except Exception as e:
+            logger.warning("Claude API error: %s", e)
+            return None
     
-    def generate_recipe_with_openai(self, batch_size_liters, style_name, constraints=None):
-        """
-        Generate recipe using OpenAI API
-        """
+    def ask_openai(self, batch_size_liters, style_name, constraints=None):
+        """Recipe data from the OpenAI client, or None"""
         if not self.openai_client:
-            return self.generate_recipe_with_formulas(batch_size_liters, style_name, constraints)
+            return None
         
-        try:
-            style = BeerStyle.objects.get(name__icontains=style_name)
-        except BeerStyle.DoesNotExist:
-            style = BeerStyle.objects.first()
+        style = self.find_style(style_name)
         
         available_grains = list(Grain.objects.values('name', 'grain_type', 'color', 'extract_potential'))
         available_hops = list(Hop.objects.values('name', 'hop_type', 'alpha_acid'))
@@ -132,177 +222,112 @@ class AIRecipeGenerator:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert brewing recipe generator. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1500
-            )
-            
-            recipe_data = json.loads(response.choices[0].message.content)
-            return self.create_recipe_from_ai_response(recipe_data, style, batch_size_liters)
-            
+            return json.loads(self.openai_client.complete(prompt))
         except Exception as e:
-            print(f"OpenAI API error: {e}")
-            return self.generate_recipe_with_formulas(batch_size_liters, style_name, constraints)
+            logger.warning("OpenAI API error: %s", e)
+            return None
     
-    def generate_recipe_with_formulas(self, batch_size_liters, style_name, constraints=None):
+    def recipe_data_from_formulas(self, batch_size_liters, style_name, constraints=None):
         """
-        Fallback: Generate recipe using brewing formulas and algorithms
+        Recipe data computed from the style ranges with brewing formulas. The
+        grain bill is solved by the grain-bill optimizer; raises ValueError
+        when the catalog cannot make a grain bill within the style's OG range.
         """
-        try:
-            style = BeerStyle.objects.get(name__icontains=style_name)
-        except BeerStyle.DoesNotExist:
-            style = BeerStyle.objects.first()
+        style = self.find_style(style_name)
         
         # Target values (middle of style range)
-        target_og = (style.og_min + style.og_max) / 2
         target_ibu = (style.ibu_min + style.ibu_max) / 2
-        target_srm = (style.srm_min + style.srm_max) / 2
-        
-        # Calculate total grain needed
-        efficiency = 0.75  # 75% efficiency
-        total_points_needed = (target_og - 1) * batch_size_liters * 1000
+        efficiency = 75.0
         
         # Generate grain bill
-        grain_bill = self.generate_smart_grain_bill(total_points_needed, target_srm, batch_size_liters, efficiency)
+        grain_bill = self.generate_smart_grain_bill(style, batch_size_liters, efficiency)
+        
+        # Expected stats of the grain bill, assuming 75% attenuation
+        extract_units, color_units = 0.0, 0.0
+        for grain, weight, _ in grain_bill:
+            grain_extract, grain_color = grain_contribution(weight, grain.extract_potential, grain.color)
+            extract_units += grain_extract
+            color_units += grain_color
+        stats = stats_from_totals(batch_size_liters, efficiency, extract_units, color_units, 0.0, 75.0, 1)
+        og, fg = float(stats['calculated_og']), float(stats['calculated_fg'])
+        if not style.og_min <= round(og, 3) <= style.og_max:
+            raise ValueError(f"No grain bill within the OG range of {style.name} can be made from the catalog")
+        
+        grain_bill = [
+            {"grain_name": grain.name, "weight_kg": round(weight, 3), "percentage": percentage}
+            for grain, weight, percentage in grain_bill
+        ]
         
         # Generate hop schedule
-        hop_schedule = self.generate_smart_hop_schedule(target_ibu, batch_size_liters, target_og)
+        hop_schedule = self.generate_smart_hop_schedule(target_ibu, batch_size_liters, og)
         
         # Select yeast
         yeast_selection = self.select_appropriate_yeast(style)
         
         # Create recipe data
-        recipe_data = {
+        return {
             "recipe_name": f"AI Generated {style.name}",
             "grain_bill": grain_bill,
             "hop_schedule": hop_schedule,
             "yeast": yeast_selection,
-            "expected_og": target_og,
-            "expected_fg": target_og - ((target_og - 1) * 0.75),  # Assume 75% attenuation
+            "expected_og": round(og, 3),
+            "expected_fg": round(fg, 3),
             "expected_ibu": target_ibu,
-            "expected_abv": BrewingCalculator.calculate_abv(target_og, target_og - ((target_og - 1) * 0.75)),
+            "expected_srm": round(float(stats['calculated_srm']), 1),
+            "expected_abv": round(float(stats['calculated_abv']), 1),
             "brewing_notes": self.generate_brewing_notes(batch_size_liters, grain_bill)
         }
-        
-        return self.create_recipe_from_ai_response(recipe_data, style, batch_size_liters)
     
-    def generate_smart_grain_bill(self, total_points_needed, target_srm, batch_size_liters, efficiency):
+    def generate_smart_grain_bill(self, style, batch_size_liters, efficiency):
         """
-        Generate an intelligent grain bill based on target parameters
+        Grain bill for the middle of the style's OG and SRM ranges, solved
+        from the whole catalog by optimize_grain_bill. Returns
+        [(grain, weight_kg, percentage)]; raises ValueError when no grain
+        bill can be made.
         """
-        grain_bill = []
-        
-        # Base malt (70-85% of bill)
-        base_malts = Grain.objects.filter(grain_type='base', color__lte=10)
-        if base_malts.exists():
-            base_malt = base_malts.first()
-            base_percentage = 80.0
-            base_points = total_points_needed * (base_percentage / 100)
-            base_weight = base_points / (base_malt.extract_potential * efficiency) / 2.2  # Convert to kg
-            
-            grain_bill.append({
-                "grain_name": base_malt.name,
-                "weight_kg": round(base_weight, 2),
-                "percentage": base_percentage
-            })
-        
-        # Specialty malts based on target color
-        remaining_percentage = 20.0
-        remaining_points = total_points_needed * 0.2
-        
-        if target_srm > 20:  # Dark beer
-            dark_grains = Grain.objects.filter(grain_type__in=['roasted', 'crystal'], color__gte=100)
-            if dark_grains.exists():
-                dark_grain = dark_grains.first()
-                dark_percentage = 5.0
-                dark_weight = (remaining_points * (dark_percentage / remaining_percentage)) / (dark_grain.extract_potential * efficiency) / 2.2
-                
-                grain_bill.append({
-                    "grain_name": dark_grain.name,
-                    "weight_kg": round(dark_weight, 3),
-                    "percentage": dark_percentage
-                })
-                remaining_percentage -= dark_percentage
-        
-        if target_srm > 5:  # Add crystal malt for color and flavor
-            crystal_grains = Grain.objects.filter(grain_type='crystal', color__range=(30, 100))
-            if crystal_grains.exists():
-                crystal_grain = crystal_grains.first()
-                crystal_percentage = min(15.0, remaining_percentage)
-                crystal_weight = (remaining_points * (crystal_percentage / 20.0)) / (crystal_grain.extract_potential * efficiency) / 2.2
-                
-                grain_bill.append({
-                    "grain_name": crystal_grain.name,
-                    "weight_kg": round(crystal_weight, 3),
-                    "percentage": crystal_percentage
-                })
-        
+        grain_bill = optimize_grain_bill(Grain.objects.order_by('pk'), style, batch_size_liters, efficiency)
+        if not grain_bill:
+            raise ValueError(f"No grain bill for {style.name} can be made from the catalog")
         return grain_bill
     
     def generate_smart_hop_schedule(self, target_ibu, batch_size_liters, og):
         """
-        Generate hop schedule to hit target IBU
+        Generate hop schedule to hit target IBU at the recipe's OG: 70% of the
+        IBU from a 60 minute addition, 20% at 15 minutes and 10% at 5 minutes,
+        shared out among the additions there are hops for
         """
-        hop_schedule = []
-        
-        # Bittering addition (60 min) - 70% of IBU
-        bittering_hops = Hop.objects.filter(hop_type__in=['bittering', 'dual']).order_by('-alpha_acid')
-        if bittering_hops.exists():
-            bittering_hop = bittering_hops.first()
-            bittering_ibu = target_ibu * 0.7
-            bittering_weight = self.calculate_hop_weight_for_ibu(
-                bittering_ibu, bittering_hop.alpha_acid, 60, batch_size_liters, og
-            ) / 1000  # Convert to kg
-            
-            hop_schedule.append({
-                "hop_name": bittering_hop.name,
-                "weight_kg": round(bittering_weight, 3),
-                "boil_time_minutes": 60,
-                "use": "boil"
-            })
-        
-        # Flavor addition (15 min) - 20% of IBU
-        flavor_hops = Hop.objects.filter(hop_type__in=['aroma', 'dual'])
-        if flavor_hops.exists():
-            flavor_hop = flavor_hops.first()
-            flavor_ibu = target_ibu * 0.2
-            flavor_weight = self.calculate_hop_weight_for_ibu(
-                flavor_ibu, flavor_hop.alpha_acid, 15, batch_size_liters, og
-            ) / 1000
-            
-            hop_schedule.append({
-                "hop_name": flavor_hop.name,
-                "weight_kg": round(flavor_weight, 3),
-                "boil_time_minutes": 15,
-                "use": "boil"
-            })
-        
-        # Aroma addition (5 min) - 10% of IBU
-        aroma_hops = Hop.objects.filter(hop_type='aroma')
-        if aroma_hops.exists():
-            aroma_hop = aroma_hops.first()
-            aroma_ibu = target_ibu * 0.1
-            aroma_weight = self.calculate_hop_weight_for_ibu(
-                aroma_ibu, aroma_hop.alpha_acid, 5, batch_size_liters, og
-            ) / 1000
-            
-            hop_schedule.append({
-                "hop_name": aroma_hop.name,
-                "weight_kg": round(aroma_weight, 3),
-                "boil_time_minutes": 5,
+        # (hops, boil time, share of the IBU)
+        plan = [
+            (Hop.objects.filter(hop_type__in=['bittering', 'dual']).order_by('-alpha_acid'), 60, 0.7),
+            (Hop.objects.filter(hop_type__in=['aroma', 'dual']), 15, 0.2),
+            (Hop.objects.filter(hop_type='aroma'), 5, 0.1),
+        ]
+        additions = [(hops.first(), boil_time, share) for hops, boil_time, share in plan]
+        additions = [addition for addition in additions if addition[0] is not None]
+        if not additions:
+            return []
+        
+        weights = calculations.hop_weights_for_ibu(
+            target_ibu,
+            [hop.alpha_acid for hop, _, _ in additions],
+            [boil_time for _, boil_time, _ in additions],
+            batch_size_liters, og,
+            shares=[share for _, _, share in additions]
+        ) / 1000  # Convert to kg
+        
+        return [
+            {
+                "hop_name": hop.name,
+                "weight_kg": round(float(weight), 3),
+                "boil_time_minutes": boil_time,
                 "use": "boil"
-            })
-        
-        return hop_schedule
+            }
+            for (hop, boil_time, _), weight in zip(additions, weights)
+        ]
     
     def calculate_hop_weight_for_ibu(self, target_ibu, alpha_acid, boil_time, batch_size, og):
         """
-        Calculate hop weight needed for target IBU using Tinseth formula
+        Calculate hop weight (grams) needed for target IBU using Tinseth formula
         """
         return BrewingCalculator.calculate_hop_weight_for_ibu(target_ibu, alpha_acid, boil_time, batch_size, og)
     
@@ -368,23 +393,26 @@ class AIRecipeGenerator:
             notes=recipe_data.get('brewing_notes', '')
         )
         
+        # Resolve ingredient names through the in-memory name index
+        index = ingredient_index()
+        
         # Add grain additions
         for grain_data in recipe_data['grain_bill']:
-            try:
-                grain = Grain.objects.get(name=grain_data['grain_name'])
+            grain = index.match('grain', grain_data['grain_name'])
+            if grain:
                 GrainAddition.objects.create(
                     recipe=recipe,
                     grain=grain,
                     weight=grain_data['weight_kg'],
                     percentage=grain_data.get('percentage')
                 )
-            except Grain.DoesNotExist:
-                print(f"Grain not found: {grain_data['grain_name']}")
+            else:
+                logger.warning("Grain not found: %s", grain_data['grain_name'])
         
         # Add hop additions
         for hop_data in recipe_data['hop_schedule']:
-            try:
-                hop = Hop.objects.get(name=hop_data['hop_name'])
+            hop = index.match('hop', hop_data['hop_name'])
+            if hop:
                 HopAddition.objects.create(
                     recipe=recipe,
                     hop=hop,
@@ -392,21 +420,20 @@ class AIRecipeGenerator:
                     boil_time=hop_data['boil_time_minutes'],
                     use=hop_data.get('use', 'boil')
                 )
-            except Hop.DoesNotExist:
-                print(f"Hop not found: {hop_data['hop_name']}")
+            else:
+                logger.warning("Hop not found: %s", hop_data['hop_name'])
         
         # Add yeast
         yeast_data = recipe_data['yeast']
-        try:
-            yeast = Yeast.objects.filter(name__icontains=yeast_data['yeast_name']).first()
-            if yeast:
-                YeastAddition.objects.create(
-                    recipe=recipe,
-                    yeast=yeast,
-                    amount=yeast_data['amount']
-                )
-        except:
-            print(f"Yeast not found: {yeast_data['yeast_name']}")
+        yeast = index.match('yeast', yeast_data['yeast_name'])
+        if yeast:
+            YeastAddition.objects.create(
+                recipe=recipe,
+                yeast=yeast,
+                amount=yeast_data['amount']
+            )
+        else:
+            logger.warning("Yeast not found: %s", yeast_data['yeast_name'])
         
         # Calculate final recipe values
         recipe.calculate_all_values()
@@ -0,0 +1,241 @@
+"""
+Batch recalculation of recipe statistics.
+
+Recipe.calculate_all_values() works on one recipe at a time. The functions in
+this module do the same work for any number of recipes: additions are loaded
+with one query per addition type for each chunk of recipes, their
+contributions and the recipe running totals are computed in NumPy arrays, the
+stats are derived with recipes.stats, and the results are written back with
+bulk_update().
+
+create_recipes() inserts new recipes the same way: contributions, totals,
+stats and cost are computed in memory before a single bulk_create() per model.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from .models import Recipe, GrainAddition, HopAddition, YeastAddition
+from .stats import TOTAL_FIELDS, CALCULATED_FIELDS, grain_contribution, hop_contribution, stats_from_totals
+
+DEFAULT_CHUNK_SIZE = 500
+
+ADDITION_MODELS = (GrainAddition, HopAddition, YeastAddition)
+
+HOP_USES = np.array([use for use, _ in HopAddition.HOP_USES])
+
+# Hop use as its index in HOP_USES, so it loads into the float arrays
+HOP_USE_CODE = Case(
+    *(When(use=use, then=Value(code)) for code, use in enumerate(HOP_USES.tolist())),
+    default=Value(0), output_field=IntegerField()
+)
+
+
+def _addition_arrays(model, recipe_ids, fields, annotations=None):
+    """
+    Load (addition id, recipe position, *fields) for every addition of the
+    given recipes in a single query. recipe_ids must be a sorted NumPy array;
+    fields may name numeric annotations.
+    """
+    rows = list(
+        model.objects.filter(recipe_id__in=recipe_ids.tolist())
+        .annotate(**(annotations or {}))
+        .order_by()
+        .values_list('pk', 'recipe_id', *fields)
+    )
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.intp), np.zeros((len(fields), 0))
+
+    data = np.array(rows, dtype=float)
+    addition_ids = data[:, 0].astype(np.int64)
+    positions = np.searchsorted(recipe_ids, data[:, 1].astype(np.int64))
+    return addition_ids, positions, data[:, 2:].T
+
+
+def _update_contributions(model, addition_ids, stored, current):
+    """
+    Bulk update the contribution fields of additions whose stored value is
+    out of date (e.g. after an ingredient was edited).
+    """
+    changed = np.zeros(len(addition_ids), dtype=bool)
+    for field in current:
+        changed |= ~np.isclose(stored[field], current[field], rtol=0, atol=1e-12)
+    if not changed.any():
+        return 0
+
+    additions = [
+        model(pk=int(addition_id), **{field: float(values[index]) for field, values in current.items()})
+        for index, addition_id in zip(np.flatnonzero(changed), addition_ids[changed])
+    ]
+    model.objects.bulk_update(additions, list(current))
+    return len(additions)
+
+
+def compute_recipe_totals(count, grains, hops, yeasts):
+    """
+    Compute the running totals of many recipes at once.
+
+    grains: (positions, (extract_units, color_units))
+    hops: (positions, (ibu_units,))
+    yeasts: (positions, (attenuation,))
+
+    positions map each addition to its recipe index. Returns a dict of arrays
+    keyed by the Recipe field names in TOTAL_FIELDS.
+    """
+    grain_pos, (extract_units, color_units) = grains
+    hop_pos, (ibu_units,) = hops
+    yeast_pos, (attenuation,) = yeasts
+    return {
+        'total_extract_units': np.bincount(grain_pos, weights=extract_units, minlength=count),
+        'total_color_units': np.bincount(grain_pos, weights=color_units, minlength=count),
+        'total_ibu_units': np.bincount(hop_pos, weights=ibu_units, minlength=count),
+        'total_attenuation': np.bincount(yeast_pos, weights=attenuation, minlength=count),
+        'yeast_count': np.bincount(yeast_pos, minlength=count),
+    }
+
+
+def _recalculate_chunk(recipes):
+    """Recalculate and bulk update one chunk of Recipe instances"""
+    recipes = sorted(recipes, key=lambda recipe: recipe.pk)
+    recipe_ids = np.array([recipe.pk for recipe in recipes], dtype=np.int64)
+    batch_size = np.array([recipe.batch_size for recipe in recipes], dtype=float)
+    efficiency = np.array([recipe.efficiency for recipe in recipes], dtype=float)
+    ibu_model = np.array([recipe.ibu_model for recipe in recipes])
+
+    # Per-addition contributions from the current ingredient data
+    grain_ids, grain_pos, (weight, extract_potential, color, stored_extract, stored_color) = _addition_arrays(
+        GrainAddition, recipe_ids,
+        ['weight', 'grain__extract_potential', 'grain__color', 'extract_units', 'color_units']
+    )
+    extract_units, color_units = grain_contribution(weight, extract_potential, color)
+    _update_contributions(
+        GrainAddition, grain_ids,
+        {'extract_units': stored_extract, 'color_units': stored_color},
+        {'extract_units': extract_units, 'color_units': color_units}
+    )
+
+    hop_ids, hop_pos, (alpha_acid, hop_weight, boil_time, use_code, stored_ibu) = _addition_arrays(
+        HopAddition, recipe_ids, ['hop__alpha_acid', 'weight', 'boil_time', 'use_code', 'ibu_units'],
+        annotations={'use_code': HOP_USE_CODE}
+    )
+    ibu_units = hop_contribution(
+        alpha_acid, hop_weight, boil_time, HOP_USES[use_code.astype(int)], ibu_model[hop_pos]
+    )
+    _update_contributions(HopAddition, hop_ids, {'ibu_units': stored_ibu}, {'ibu_units': ibu_units})
+
+    yeast_ids, yeast_pos, (attenuation, stored_attenuation) = _addition_arrays(
+        YeastAddition, recipe_ids, ['yeast__attenuation', 'attenuation']
+    )
+    _update_contributions(
+        YeastAddition, yeast_ids, {'attenuation': stored_attenuation}, {'attenuation': attenuation}
+    )
+
+    totals = compute_recipe_totals(
+        len(recipes),
+        (grain_pos, (extract_units, color_units)),
+        (hop_pos, (ibu_units,)),
+        (yeast_pos, (attenuation,))
+    )
+    stats = stats_from_totals(
+        batch_size, efficiency, totals['total_extract_units'], totals['total_color_units'],
+        totals['total_ibu_units'], totals['total_attenuation'], totals['yeast_count'], ibu_model
+    )
+
+    for index, recipe in enumerate(recipes):
+        for field in TOTAL_FIELDS:
+            setattr(recipe, field, totals[field][index].item())
+        for field in CALCULATED_FIELDS:
+            setattr(recipe, field, float(stats[field][index]))
+
+    Recipe.objects.bulk_update(recipes, TOTAL_FIELDS + CALCULATED_FIELDS)
+    return len(recipes)
+
+
+def recalculate_recipes(recipes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recalculate stats for a queryset or iterable of recipes.
+
+    Recipes are processed in chunks of chunk_size, each chunk in its own
+    transaction. Recipes without a positive batch size are skipped, since
+    their gravity cannot be calculated. Returns the number of recipes updated.
+    """
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    if hasattr(recipes, 'iterator'):
+        recipes = recipes.filter(batch_size__gt=0).only(
+            'id', 'batch_size', 'efficiency', 'ibu_model', *TOTAL_FIELDS, *CALCULATED_FIELDS
+        ).iterator(chunk_size=chunk_size)
+
+    updated = 0
+    chunk = []
+    for recipe in recipes:
+        if not recipe.batch_size or recipe.batch_size <= 0:
+            continue
+        chunk.append(recipe)
+        if len(chunk) >= chunk_size:
+            with transaction.atomic():
+                updated += _recalculate_chunk(chunk)
+            chunk = []
+
+    if chunk:
+        with transaction.atomic():
+            updated += _recalculate_chunk(chunk)
+
+    return updated
+
+
+def create_recipes(rows, price_books=None):
+    """
+    Insert new recipes and their additions in bulk.
+
+    rows: [(unsaved Recipe, [unsaved GrainAddition/HopAddition/YeastAddition])]
+    with the ingredients of the additions set as objects. price_books can map
+    user ids to already loaded PriceBooks. Contributions, running totals and
+    cost are set in memory, the stats of all recipes are derived in one
+    vectorised pass, and each model is written with one bulk_create(). Call
+    inside a transaction. Returns the saved recipes.
+    """
+    from .costing import PriceBook
+
+    if not rows:
+        return []
+
+    price_books = dict(price_books or {})
+    for recipe, additions in rows:
+        for addition in additions:
+            addition.refresh_contribution()
+            for field, total_field in addition.CONTRIBUTION_FIELDS.items():
+                setattr(recipe, total_field, getattr(recipe, total_field) + getattr(addition, field))
+            if addition.COUNT_FIELD:
+                setattr(recipe, addition.COUNT_FIELD, getattr(recipe, addition.COUNT_FIELD) + 1)
+
+        if recipe.created_by_id not in price_books:
+            price_books[recipe.created_by_id] = PriceBook.for_user(recipe.created_by_id)
+        recipe.calculated_cost = sum(addition.cost(price_books[recipe.created_by_id]) for addition in additions)
+        recipe.calculated_cost_per_liter = (
+            recipe.calculated_cost / recipe.batch_size if recipe.batch_size > 0 else 0
+        )
+
+    recipes = [recipe for recipe, _ in rows]
+    stats = stats_from_totals(
+        *(
+            np.array([getattr(recipe, field) for recipe in recipes], dtype=float)
+            for field in ('batch_size', 'efficiency', *TOTAL_FIELDS)
+        ),
+        ibu_model=np.array([recipe.ibu_model for recipe in recipes])
+    )
+    for index, recipe in enumerate(recipes):
+        for field in CALCULATED_FIELDS:
+            setattr(recipe, field, float(stats[field][index]))
+
+    Recipe.objects.bulk_create(recipes)
+
+    for model in ADDITION_MODELS:
+        model_additions = []
+        for recipe, additions in rows:
+            for addition in additions:
+                if isinstance(addition, model):
+                    addition.recipe = recipe
+                    model_additions.append(addition)
+        model.objects.bulk_create(model_additions, batch_size=DEFAULT_CHUNK_SIZE * 4)
+
+    return recipes
@@ -0,0 +1,480 @@
+"""
+BeerXML import and export.
+
+iter_beerxml() yields a single BeerXML <RECIPES> document for any number of
+recipes, one recipe at a time. Recipes are loaded in chunks together with
+their additions, so memory use stays flat however many recipes are exported,
+and the output can be sent with a StreamingHttpResponse.
+
+import_beerxml() parses a BeerXML file incrementally with iterparse(). The
+ingredient names of each chunk of recipes are resolved against the catalog in
+one batch, and the chunk is written by batch.create_recipes() (stats and cost
+computed in memory, bulk_create() per model) in its own transaction.
+"""
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from core.models import BeerStyle
+from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition, ingredient_prefetches
+from .ingredient_index import ingredient_index
+from .batch import create_recipes
+
+EXPORT_CHUNK_SIZE = 200
+IMPORT_CHUNK_SIZE = 500
+
+# 1 PPG = 1 / 46.214 of the yield of pure sucrose
+SUCROSE_PPG = 46.214
+
+HOP_USES = {
+    'boil': 'Boil',
+    'flameout': 'Aroma',
+    'whirlpool': 'Aroma',
+    'dry_hop': 'Dry Hop',
+}
+
+YEAST_TYPES = {
+    'ale': 'Ale',
+    'lager': 'Lager',
+    'wheat': 'Wheat',
+    'wild': 'Ale',
+}
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<RECIPES>\n'
+XML_FOOTER = '</RECIPES>\n'
+
+
+def _element(tag, value, indent):
+    """<TAG>value</TAG> with the value XML-escaped"""
+    if value is None:
+        value = ''
+    return f"{' ' * indent}<{tag}>{escape(str(value))}</{tag}>\n"
+
+
+def _style_xml(style):
+    match = re.match(r'(\d*)(.*)', style.style_code)
+    parts = ['    <STYLE>\n']
+    for tag, value in [
+        ('NAME', style.name),
+        ('VERSION', 1),
+        ('CATEGORY', style.name),
+        ('CATEGORY_NUMBER', match.group(1) or style.style_code),
+        ('STYLE_LETTER', match.group(2)),
+        ('STYLE_GUIDE', 'BJCP'),
+        ('TYPE', 'Ale'),
+        ('OG_MIN', style.og_min),
+        ('OG_MAX', style.og_max),
+        ('FG_MIN', style.fg_min),
+        ('FG_MAX', style.fg_max),
+        ('IBU_MIN', style.ibu_min),
+        ('IBU_MAX', style.ibu_max),
+        ('COLOR_MIN', style.srm_min),
+        ('COLOR_MAX', style.srm_max),
+        ('ABV_MIN', style.abv_min),
+        ('ABV_MAX', style.abv_max),
+    ]:
+        parts.append(_element(tag, value, 8))
+    parts.append('    </STYLE>\n')
+    return ''.join(parts)
+
+
+def recipe_xml(recipe):
+    """The <RECIPE> element of one recipe (additions prefetched when possible)"""
+    grain_additions, hop_additions, yeast_additions = recipe.load_ingredients()
+
+    parts = ['<RECIPE>\n']
+    for tag, value in [
+        ('NAME', recipe.name),
+        ('VERSION', 1),
+        ('TYPE', 'All Grain'),
+        ('BREWER', recipe.created_by.username),
+        ('BATCH_SIZE', recipe.batch_size),
+        ('BOIL_SIZE', recipe.batch_size * 1.2),  # Estimate
+        ('BOIL_TIME', 60),
+        ('EFFICIENCY', recipe.efficiency),
+    ]:
+        parts.append(_element(tag, value, 4))
+    parts.append(_style_xml(recipe.style))
+
+    parts.append('    <FERMENTABLES>\n')
+    for addition in grain_additions:
+        parts.append('        <FERMENTABLE>\n')
+        for tag, value in [
+            ('NAME', addition.grain.name),
+            ('VERSION', 1),
+            ('TYPE', 'Grain'),
+            ('AMOUNT', addition.weight),
+            ('YIELD', round(addition.grain.extract_potential / SUCROSE_PPG * 100, 1)),
+            ('COLOR', addition.grain.color),
+        ]:
+            parts.append(_element(tag, value, 12))
+        parts.append('        </FERMENTABLE>\n')
+    parts.append('    </FERMENTABLES>\n')
+
+    parts.append('    <HOPS>\n')
+    for addition in hop_additions:
+        parts.append('        <HOP>\n')
+        for tag, value in [
+            ('NAME', addition.hop.name),
+            ('VERSION', 1),
+            ('ALPHA', addition.hop.alpha_acid),
+            ('AMOUNT', addition.weight),
+            ('USE', HOP_USES.get(addition.use, 'Boil')),
+            ('TIME', addition.boil_time),
+        ]:
+            parts.append(_element(tag, value, 12))
+        parts.append('        </HOP>\n')
+    parts.append('    </HOPS>\n')
+
+    parts.append('    <YEASTS>\n')
+    for addition in yeast_additions:
+        parts.append('        <YEAST>\n')
+        for tag, value in [
+            ('NAME', addition.yeast.name),
+            ('VERSION', 1),
+            ('TYPE', YEAST_TYPES.get(addition.yeast.yeast_type, 'Ale')),
+            ('FORM', 'Liquid'),
+            ('AMOUNT', addition.amount),
+            ('LABORATORY', addition.yeast.laboratory),
+            ('PRODUCT_ID', addition.yeast.strain_number),
+            ('ATTENUATION', addition.yeast.attenuation),
+        ]:
+            parts.append(_element(tag, value, 12))
+        parts.append('        </YEAST>\n')
+    parts.append('    </YEASTS>\n')
+
+    parts.append(_element('MISCS', '', 4))
+    parts.append(_element('WATERS', '', 4))
+    parts.append(_element('NOTES', recipe.notes, 4))
+    parts.append('</RECIPE>\n')
+    return ''.join(parts)
+
+
+def _chunks(recipes, chunk_size):
+    """Yield lists of recipes with style, brewer and additions loaded"""
+    if hasattr(recipes, 'iterator'):
+        # QuerySet.iterator() runs the prefetches once per chunk
+        recipes = recipes.with_ingredients().iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for recipe in recipes:
+        chunk.append(recipe)
+        if len(chunk) >= chunk_size:
+            prefetch_related_objects(chunk, 'style', 'created_by', *ingredient_prefetches())
+            yield chunk
+            chunk = []
+    if chunk:
+        prefetch_related_objects(chunk, 'style', 'created_by', *ingredient_prefetches())
+        yield chunk
+
+
+def iter_beerxml(recipes, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield a BeerXML document for a Recipe queryset or an iterable of recipes,
+    one string per recipe.
+    """
+    yield XML_HEADER
+    for chunk in _chunks(recipes, chunk_size):
+        for recipe in chunk:
+            yield recipe_xml(recipe)
+    yield XML_FOOTER
+
+
+# Import
+
+IMPORT_HOP_USES = {
+    'boil': 'boil',
+    'first wort': 'boil',
+    'mash': 'boil',
+    'aroma': 'flameout',
+    'whirlpool': 'whirlpool',
+    'dry hop': 'dry_hop',
+}
+
+IMPORT_YEAST_TYPES = {
+    'ale': 'ale',
+    'lager': 'lager',
+    'wheat': 'wheat',
+}
+
+
+# Fermentable TYPEs that are not mashed malts
+IMPORT_ADJUNCT_TYPES = {'sugar', 'adjunct', 'extract', 'dry extract'}
+
+CRYSTAL_WORDS = ('crystal', 'caramel', 'cara')
+ROASTED_WORDS = ('roast', 'black', 'chocolate', 'carafa')
+
+# Darkest grain (SRM) imported as a base malt (Munich is about 10)
+MAX_BASE_COLOR = 10
+MIN_ROASTED_COLOR = 200
+
+
+def import_grain_type(fermentable_type, color, name):
+    """
+    Catalog grain_type for a BeerXML fermentable: sugars, extracts and
+    adjuncts are adjuncts, grains are classified by name and color so only
+    pale malts count as base malts
+    """
+    if fermentable_type.lower() in IMPORT_ADJUNCT_TYPES:
+        return 'adjunct'
+    name = name.lower()
+    if any(word in name for word in CRYSTAL_WORDS):
+        return 'crystal'
+    if color >= MIN_ROASTED_COLOR or any(word in name for word in ROASTED_WORDS):
+        return 'roasted'
+    if color <= MAX_BASE_COLOR:
+        return 'base'
+    return 'specialty'
+
+
+def normalize_name(name):
+    """Case and whitespace insensitive key for catalog lookups"""
+    return ' '.join(name.lower().split())
+
+
+def _text(element, tag, default=''):
+    value = element.findtext(tag)
+    return value.strip() if value and value.strip() else default
+
+
+def _float(element, tag, default=0.0):
+    try:
+        return float(_text(element, tag, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_recipe(element):
+    """Plain dict of the fields of one <RECIPE> element"""
+    style = element.find('STYLE')
+    style_code = ''
+    if style is not None:
+        style_code = _text(style, 'CATEGORY_NUMBER') + _text(style, 'STYLE_LETTER')
+
+    return {
+        'name': _text(element, 'NAME', 'Imported Recipe')[:200],
+        'batch_size': _float(element, 'BATCH_SIZE', 20.0),
+        'efficiency': _float(element, 'EFFICIENCY', 75.0),
+        'notes': _text(element, 'NOTES'),
+        'style_name': _text(style, 'NAME') if style is not None else '',
+        'style_code': style_code,
+        'fermentables': [
+            {
+                'name': _text(item, 'NAME'),
+                'type': _text(item, 'TYPE', 'Grain'),
+                'weight': _float(item, 'AMOUNT'),
+                # YIELD is % of sucrose; the catalog stores PPG
+                'extract_potential': round(_float(item, 'YIELD', 80.0) / 100 * SUCROSE_PPG, 1),
+                'color': int(round(_float(item, 'COLOR', 2.0))),
+            }
+            for item in element.iterfind('FERMENTABLES/FERMENTABLE')
+        ],
+        'hops': [
+            {
+                'name': _text(item, 'NAME'),
+                'alpha_acid': _float(item, 'ALPHA', 5.0),
+                'weight': _float(item, 'AMOUNT'),
+                'use': IMPORT_HOP_USES.get(_text(item, 'USE', 'Boil').lower(), 'boil'),
+                'time': _float(item, 'TIME'),
+            }
+            for item in element.iterfind('HOPS/HOP')
+        ],
+        'yeasts': [
+            {
+                'name': _text(item, 'NAME'),
+                # BeerXML amounts are liters or kg; anything below one pack counts as one pack
+                'amount': max(1.0, _float(item, 'AMOUNT', 1.0)),
+                'laboratory': _text(item, 'LABORATORY', 'Unknown')[:50],
+                'strain_number': _text(item, 'PRODUCT_ID', '-')[:20],
+                'yeast_type': IMPORT_YEAST_TYPES.get(_text(item, 'TYPE', 'Ale').lower(), 'ale'),
+                'attenuation': _float(item, 'ATTENUATION', 75.0),
+            }
+            for item in element.iterfind('YEASTS/YEAST')
+        ],
+    }
+
+
+def iter_beerxml_recipes(source):
+    """
+    Yield parsed recipes from a BeerXML file (path or file object). Each
+    <RECIPE> element is discarded once parsed, so memory use does not grow
+    with the file size.
+    """
+    root = None
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
+        if element.tag == 'RECIPE':
+            yield parse_recipe(element)
+            root.clear()
+
+
+class IngredientCatalog:
+    """
+    Catalog lookups for an import. Ingredient names are matched and missing
+    ingredients created through the shared ingredient index
+    (resolve_or_create), with the properties given in the file; styles are
+    read once.
+    """
+
+    def __init__(self):
+        self.grains, self.hops, self.yeasts = {}, {}, {}
+        styles = list(BeerStyle.objects.all())
+        self.styles_by_code = {style.style_code.upper(): style for style in styles}
+        self.styles_by_name = {normalize_name(style.name): style for style in styles}
+        self.created = {'grains': 0, 'hops': 0, 'yeasts': 0}
+
+    def style(self, parsed):
+        return (
+            self.styles_by_code.get(parsed['style_code'].upper()) or
+            self.styles_by_name.get(normalize_name(parsed['style_name']))
+        )
+
+    def _resolve(self, ingredient_type, items, resolved, counter, build):
+        """Resolve the names of items not seen yet, creating the missing ingredients"""
+        first = {}
+        for item in items:
+            if item['name'] not in resolved:
+                first.setdefault(item['name'], item)
+        if not first:
+            return
+
+        def build_counted(name):
+            self.created[counter] += 1
+            return build(first[name])
+
+        resolved.update(ingredient_index().resolve_or_create(ingredient_type, list(first), build_counted))
+
+    def resolve(self, parsed_recipes):
+        """Make sure every ingredient named in parsed_recipes is in the catalog"""
+        fermentables = [item for parsed in parsed_recipes for item in parsed['fermentables']]
+        self._resolve('grain', fermentables, self.grains, 'grains', lambda item: Grain(
+            name=item['name'][:100],
+            grain_type=import_grain_type(item['type'], item['color'], item['name']),
+            color=item['color'],
+            extract_potential=item['extract_potential'],
+            description=f"Imported from BeerXML: {item['name']}"
+        ))
+
+        hops = [item for parsed in parsed_recipes for item in parsed['hops']]
+        self._resolve('hop', hops, self.hops, 'hops', lambda item: Hop(
+            name=item['name'][:100],
+            hop_type='dual',
+            alpha_acid=item['alpha_acid'],
+            description=f"Imported from BeerXML: {item['name']}"
+        ))
+
+        # Laboratory and product id first: several strains share a name
+        index = ingredient_index()
+        by_name = []
+        for parsed in parsed_recipes:
+            for item in parsed['yeasts']:
+                key = self._yeast_key(item)
+                if key in self.yeasts:
+                    continue
+                product = f"{item['laboratory']} {item['strain_number']}".strip()
+                yeast = index.match('yeast', product) if item['strain_number'] else None
+                if yeast:
+                    self.yeasts[key] = yeast
+                else:
+                    by_name.append(item)
+        named = {}
+        self._resolve('yeast', by_name, named, 'yeasts', lambda item: Yeast(
+            name=item['name'][:100],
+            laboratory=item['laboratory'],
+            strain_number=item['strain_number'],
+            yeast_type=item['yeast_type'],
+            attenuation=item['attenuation'],
+            temp_range_min=18,
+            temp_range_max=22,
+            description=f"Imported from BeerXML: {item['name']}"
+        ))
+        for item in by_name:
+            self.yeasts[self._yeast_key(item)] = named.get(item['name'])
+
+    def _yeast_key(self, item):
+        return (item['laboratory'], item['strain_number'], item['name'])
+
+    def grain(self, item):
+        return self.grains.get(item['name'])
+
+    def hop(self, item):
+        return self.hops.get(item['name'])
+
+    def yeast(self, item):
+        return self.yeasts.get(self._yeast_key(item))
+
+
+def _import_chunk(parsed_recipes, user, catalog, price_book, result):
+    """Create the recipes of one chunk and their additions with create_recipes()"""
+    catalog.resolve(parsed_recipes)
+
+    rows = []
+    for parsed in parsed_recipes:
+        style = catalog.style(parsed)
+        if style is None:
+            result['skipped'].append((parsed['name'], f"Unknown style {parsed['style_name'] or parsed['style_code']!r}"))
+            continue
+        if parsed['batch_size'] <= 0:
+            result['skipped'].append((parsed['name'], 'Batch size must be positive'))
+            continue
+
+        recipe = Recipe(
+            name=parsed['name'],
+            style=style,
+            created_by=user,
+            batch_size=parsed['batch_size'],
+            efficiency=parsed['efficiency'],
+            notes=parsed['notes'],
+        )
+        additions = []
+        for item in parsed['fermentables']:
+            grain = catalog.grain(item)
+            if grain and item['weight'] > 0:
+                additions.append(GrainAddition(recipe=recipe, grain=grain, weight=item['weight']))
+        for item in parsed['hops']:
+            hop = catalog.hop(item)
+            if hop and item['weight'] > 0:
+                boil_time = 0 if item['use'] == 'dry_hop' else int(round(item['time']))
+                additions.append(
+                    HopAddition(recipe=recipe, hop=hop, weight=item['weight'], boil_time=boil_time, use=item['use'])
+                )
+        for item in parsed['yeasts']:
+            yeast = catalog.yeast(item)
+            if yeast:
+                additions.append(YeastAddition(recipe=recipe, yeast=yeast, amount=item['amount']))
+        rows.append((recipe, additions))
+
+    return [recipe.pk for recipe in create_recipes(rows, {user.pk: price_book})]
+
+
+def import_beerxml(source, user, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import every recipe of a BeerXML file (path or file object) for user.
+
+    Returns a dict with the ids of the created recipes, the (name, reason)
+    pairs of skipped recipes and the number of catalog ingredients created.
+    Raises xml.etree.ElementTree.ParseError for malformed files; recipes of
+    chunks written before the error are kept.
+    """
+    from .costing import PriceBook
+
+    catalog = IngredientCatalog()
+    price_book = PriceBook.for_user(user)
+    result = {'recipe_ids': [], 'skipped': [], 'ingredients_created': catalog.created}
+
+    chunk = []
+    for parsed in iter_beerxml_recipes(source):
+        chunk.append(parsed)
+        if len(chunk) >= chunk_size:
+            with transaction.atomic():
+                result['recipe_ids'].extend(_import_chunk(chunk, user, catalog, price_book, result))
+            chunk = []
+    if chunk:
+        with transaction.atomic():
+            result['recipe_ids'].extend(_import_chunk(chunk, user, catalog, price_book, result))
+
+    return result
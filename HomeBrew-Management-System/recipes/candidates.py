@@ -0,0 +1,212 @@
+"""
+Best-of-N recipe generation.
+
+Instead of saving one random recipe per request, the generator can build
+many candidates and keep only the best. The candidates combine grain bills
+from the grain-bill solver with randomized hop schedules and yeasts, and
+are evaluated as one batch of arrays with stats_from_totals: OG, FG, IBU,
+SRM and ABV of every candidate are scored on their distance from the
+middle of the style ranges, plus their cost. Nothing is written here; the
+caller saves the winner.
+"""
+import numpy as np
+from core import calculations
+from .grain_bill import GrainCatalog, solve_grain_bills
+from .stats import hop_contribution, stats_from_totals
+
+DEFAULT_CANDIDATES = 200
+# Candidates are scored in the request: keep the work per request bounded
+MAX_CANDIDATES = 500
+
+# Score penalty for each stat outside the style range
+OUT_OF_RANGE_PENALTY = 10.0
+
+# Weight of cost in the score (1.0 = cost of the most expensive candidate)
+COST_WEIGHT = 0.25
+
+# Smallest share of the target IBU from the bittering addition
+MIN_BITTERING_SHARE = 0.5
+
+# Boil time (minutes) of the bittering addition
+BITTERING_TIME = 60
+
+STYLE_STATS = {
+    'calculated_og': ('og_min', 'og_max'),
+    'calculated_fg': ('fg_min', 'fg_max'),
+    'calculated_ibu': ('ibu_min', 'ibu_max'),
+    'calculated_srm': ('srm_min', 'srm_max'),
+    'calculated_abv': ('abv_min', 'abv_max'),
+}
+
+
+def _grain_bill_pool(catalog, style, batch_size, efficiency, complexity, budget, size):
+    """
+    The best valid grain bills of the solver as flat arrays: set indices and
+    weights (lists of arrays), extract units, color units and cost.
+    """
+    pool = []
+    for result in solve_grain_bills(catalog, style, batch_size, efficiency, complexity, budget):
+        for index in np.flatnonzero(result['valid']):
+            rank = (
+                (0.0 if result['og_in_style'][index] else 2e6) +
+                (0.0 if result['srm_in_style'][index] else 1e6) +
+                result['score'][index]
+            )
+            pool.append((rank, result['sets'][index], result['weights'][index]))
+    pool.sort(key=lambda entry: entry[0])
+    pool = pool[:size]
+
+    sets = [grain_set for _, grain_set, _ in pool]
+    weights = [grain_weights for _, _, grain_weights in pool]
+    return {
+        'sets': sets,
+        'weights': weights,
+        'extract_units': np.array([(w * catalog.extract[s]).sum() for s, w in zip(sets, weights)]),
+        'color_units': np.array([(w * catalog.color[s]).sum() for s, w in zip(sets, weights)]),
+        'cost': np.array([(w * catalog.price[s]).sum() for s, w in zip(sets, weights)]),
+    }
+
+
+def _hop_schedules(hops, complexity, count, ibu_range, rng):
+    """
+    Random hop schedules as (count, 3) arrays: hop index, weight (kg, NaN for
+    the bittering addition that is solved later), boil time and use, with a
+    mask of the additions present. Column 0 is the bittering addition.
+    """
+    alpha = np.array([hop.alpha_acid for hop in hops], dtype=float)
+    bittering = np.flatnonzero([hop.hop_type in ('bittering', 'dual') for hop in hops])
+    aroma = np.flatnonzero([hop.hop_type in ('aroma', 'dual') for hop in hops])
+    if len(bittering) == 0:
+        bittering = np.argsort(-alpha)[:1]
+
+    hop_index = np.zeros((count, 3), dtype=int)
+    weight = np.zeros((count, 3))
+    boil_time = np.zeros((count, 3))
+    use = np.full((count, 3), 'boil', dtype=object)
+    present = np.zeros((count, 3), dtype=bool)
+
+    hop_index[:, 0] = rng.choice(bittering, count)
+    weight[:, 0] = np.nan
+    boil_time[:, 0] = BITTERING_TIME
+    present[:, 0] = True
+
+    if complexity in ('moderate', 'complex') and len(aroma):
+        # Flavor addition, 15-30 g at 15-20 minutes
+        hop_index[:, 1] = rng.choice(aroma, count)
+        weight[:, 1] = rng.uniform(0.015, 0.030, count)
+        boil_time[:, 1] = rng.integers(15, 21, count)
+        present[:, 1] = True
+
+        if complexity == 'complex':
+            # Aroma addition, 15-40 g at 5 minutes or flameout
+            hop_index[:, 2] = rng.choice(aroma, count)
+            weight[:, 2] = rng.uniform(0.015, 0.040, count)
+            boil_time[:, 2] = rng.choice([5, 0], count)
+            use[:, 2] = np.where(rng.random(count) < 0.5, 'boil', 'flameout')
+            present[:, 2] = True
+
+    return {
+        'hop_index': hop_index, 'weight': weight, 'boil_time': boil_time, 'use': use,
+        'present': present, 'target_ibu': rng.uniform(ibu_range[0], ibu_range[1], count),
+    }
+
+
+def best_recipe(style, batch_size, grains, hops, yeasts, efficiency=75.0, complexity='moderate',
+                price_book=None, max_cost=None, grain_stock=None, candidates=DEFAULT_CANDIDATES, seed=None,
+                ibu_model='tinseth'):
+    """
+    Generate `candidates` recipes for a style and return the best one as a
+    dict with grain_bill [(grain, kg, percentage)], hop_schedule
+    [(hop, kg, boil_time, use)], yeast, stats, cost, score and the number of
+    candidates evaluated. IBU is scored with the hop utilization model the
+    recipe will be saved with. Returns None when no candidate fits max_cost.
+    """
+    candidates = max(1, min(int(candidates), MAX_CANDIDATES))
+    rng = np.random.default_rng(seed)
+    hops, yeasts = list(hops), list(yeasts)
+    if not hops:
+        return None
+
+    # Grain bills: the best solutions of the grain-bill solver
+    catalog = GrainCatalog(grains, price_book, grain_stock)
+    grain_pool = _grain_bill_pool(catalog, style, batch_size, efficiency, complexity, max_cost, candidates)
+    if not grain_pool['sets']:
+        return None
+
+    # Candidates pair grain bills (best first), hop schedules and yeasts
+    grain_choice = np.arange(candidates) % len(grain_pool['sets'])
+    schedules = _hop_schedules(hops, complexity, candidates, (style.ibu_min, style.ibu_max), rng)
+    yeast_choice = rng.integers(0, len(yeasts), candidates) if yeasts else None
+
+    # Gravity before hops, for hop utilization
+    og = stats_from_totals(
+        np.full(candidates, float(batch_size)), np.full(candidates, float(efficiency)),
+        grain_pool['extract_units'][grain_choice], grain_pool['color_units'][grain_choice],
+        np.zeros(candidates), np.zeros(candidates), np.zeros(candidates)
+    )['calculated_og']
+
+    # Solve the bittering weight for the IBU the late additions leave
+    alpha = np.array([hop.alpha_acid for hop in hops], dtype=float)[schedules['hop_index']]
+    grams = calculations.hop_weights_for_ibu(
+        schedules['target_ibu'], alpha, schedules['boil_time'], batch_size, og,
+        fixed_grams=np.where(schedules['present'], schedules['weight'] * 1000, 0.0),
+        min_share=MIN_BITTERING_SHARE
+    )
+    schedules['weight'] = np.where(schedules['present'], np.round(grams / 1000, 4), 0.0)
+    ibu_units = hop_contribution(
+        alpha, schedules['weight'], schedules['boil_time'], schedules['use'].astype(str), ibu_model
+    ).sum(axis=1)
+
+    # Yeast
+    if yeast_choice is not None:
+        attenuation = np.array([yeast.attenuation for yeast in yeasts], dtype=float)[yeast_choice]
+        yeast_count = np.ones(candidates)
+    else:
+        attenuation = yeast_count = np.zeros(candidates)
+
+    stats = stats_from_totals(
+        np.full(candidates, float(batch_size)), np.full(candidates, float(efficiency)),
+        grain_pool['extract_units'][grain_choice], grain_pool['color_units'][grain_choice],
+        ibu_units, attenuation, yeast_count, ibu_model
+    )
+
+    # Cost
+    cost = grain_pool['cost'][grain_choice].copy()
+    if price_book is not None:
+        hop_prices = np.array([price_book.price('hop', hop.pk) for hop in hops])
+        cost += (schedules['weight'] * hop_prices[schedules['hop_index']]).sum(axis=1)
+        if yeast_choice is not None:
+            cost += np.array([price_book.price('yeast', yeast.pk) for yeast in yeasts])[yeast_choice]
+
+    # Score: distance from the middle of each style range (0 middle, 1 edge), penalties outside
+    score = COST_WEIGHT * cost / max(cost.max(), 1e-9)
+    for field, (low_field, high_field) in STYLE_STATS.items():
+        low, high = getattr(style, low_field), getattr(style, high_field)
+        values = stats[field]
+        score = score + np.abs(values - (low + high) / 2) / max((high - low) / 2, 1e-9)
+        score = score + OUT_OF_RANGE_PENALTY * ((values < low) | (values > high))
+    if max_cost is not None:
+        score = np.where(cost <= max_cost + 1e-9, score, np.inf)
+
+    best = int(np.argmin(score))
+    if not np.isfinite(score[best]):
+        return None
+
+    grain_set, grain_weights = grain_pool['sets'][grain_choice[best]], grain_pool['weights'][grain_choice[best]]
+    total = grain_weights.sum()
+    return {
+        'grain_bill': [
+            (catalog.grains[index], float(weight), round(float(weight / total * 100), 1))
+            for index, weight in zip(grain_set, grain_weights)
+        ],
+        'hop_schedule': [
+            (hops[schedules['hop_index'][best, column]], float(schedules['weight'][best, column]),
+             int(schedules['boil_time'][best, column]), schedules['use'][best, column])
+            for column in range(3) if schedules['present'][best, column]
+        ],
+        'yeast': yeasts[yeast_choice[best]] if yeast_choice is not None else None,
+        'stats': {field: float(values[best]) for field, values in stats.items()},
+        'cost': float(cost[best]),
+        'score': float(score[best]),
+        'candidates': candidates,
+    }
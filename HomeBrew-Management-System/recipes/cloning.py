@@ -0,0 +1,165 @@
+"""
+Bulk copying of recipes.
+
+Clones and scaled copies are written with bulk_create() inside one
+transaction: one INSERT per model per chunk instead of one per addition. The
+copies are not recalculated from their additions. Their running totals and
+stats come from the source recipe: a clone keeps them as they are, and a
+scaled copy multiplies the grain and hop totals by the scale factor and
+re-derives OG/FG/ABV/IBU/SRM for the new batch size.
+"""
+import math
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from .models import Recipe, GrainAddition, HopAddition, YeastAddition, ingredient_prefetches
+from .costing import PriceBook
+
+COPY_CHUNK_SIZE = 200
+
+# Fields that are never copied from the source row
+SKIPPED_FIELDS = ('id', 'created_at', 'updated_at', 'recipe')
+
+# Addition fields multiplied by the scale factor (yeast is copied unscaled)
+SCALED_FIELDS = {
+    GrainAddition: ('weight', 'extract_units', 'color_units'),
+    HopAddition: ('weight', 'ibu_units'),
+    YeastAddition: (),
+}
+
+# Recipe totals multiplied by the scale factor
+SCALED_TOTALS = ('total_extract_units', 'total_color_units', 'total_ibu_units')
+
+
+def _copy_values(instance):
+    """Concrete field values of a model instance, without pk, timestamps and recipe"""
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.name not in SKIPPED_FIELDS
+    }
+
+
+def _build_copy(source, scale_factor, **overrides):
+    """
+    Build an unsaved copy of source and its additions.
+    Returns (recipe, {addition model: [unsaved additions]}).
+    """
+    values = _copy_values(source)
+    values.update(overrides)
+    recipe = Recipe(**values)
+
+    additions = {}
+    for model, source_additions in zip(SCALED_FIELDS, source.load_ingredients()):
+        additions[model] = []
+        for source_addition in source_additions:
+            addition_values = _copy_values(source_addition)
+            for field in SCALED_FIELDS[model]:
+                addition_values[field] *= scale_factor
+            additions[model].append(model(recipe=recipe, **addition_values))
+
+    if scale_factor != 1.0:
+        for field in SCALED_TOTALS:
+            setattr(recipe, field, getattr(recipe, field) * scale_factor)
+        recipe.derive_stats()
+
+    return recipe, additions
+
+
+def _price_copy(recipe, additions, price_book):
+    """Set the stored cost of a copy from its (unsaved) additions"""
+    recipe.calculated_cost = sum(
+        addition.cost(price_book)
+        for model_additions in additions.values()
+        for addition in model_additions
+    )
+    recipe.calculated_cost_per_liter = (
+        recipe.calculated_cost / recipe.batch_size if recipe.batch_size > 0 else 0
+    )
+
+
+def _save_copies(copies):
+    """bulk_create the recipes, then their additions with one query per model"""
+    recipes = Recipe.objects.bulk_create([recipe for recipe, _ in copies])
+
+    for model in SCALED_FIELDS:
+        model_additions = []
+        for recipe, additions in copies:
+            for addition in additions[model]:
+                addition.recipe = recipe
+                model_additions.append(addition)
+        model.objects.bulk_create(model_additions, batch_size=COPY_CHUNK_SIZE * 10)
+
+    return recipes
+
+
+def clone_recipes(recipes, created_by=None, copies=1, name_format='{name} (Copy)',
+                  chunk_size=COPY_CHUNK_SIZE):
+    """
+    Clone recipes in bulk, e.g. to seed an account with a recipe library.
+
+    recipes: queryset or iterable of source recipes
+    created_by: owner of the clones (defaults to the source owner)
+    copies: number of clones per source recipe
+    name_format: format string for the clone name; {name} is the source
+        name and {copy} the 1-based copy number
+
+    Everything is written in one transaction. Returns the new recipes.
+    """
+    recipes = list(recipes)
+    price_books = {}
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(recipes), chunk_size):
+            sources = recipes[start:start + chunk_size]
+            prefetch_related_objects(sources, *ingredient_prefetches())
+
+            chunk = []
+            for source in sources:
+                owner_id = created_by.pk if created_by else source.created_by_id
+                for number in range(1, copies + 1):
+                    recipe, additions = _build_copy(
+                        source, 1.0,
+                        name=name_format.format(name=source.name, copy=number),
+                        created_by_id=owner_id
+                    )
+                    # Clones for the same brewer keep the source cost; other
+                    # brewers are priced from their own inventory
+                    if owner_id != source.created_by_id or source.calculated_cost is None:
+                        if owner_id not in price_books:
+                            price_books[owner_id] = PriceBook.for_user(owner_id)
+                        _price_copy(recipe, additions, price_books[owner_id])
+                    chunk.append((recipe, additions))
+            created.extend(_save_copies(chunk))
+
+    return created
+
+
+def clone_recipe(recipe, name=None):
+    """Clone a single recipe for its owner"""
+    name_format = name.replace('{', '{{').replace('}', '}}') if name else '{name} (Copy)'
+    return clone_recipes([recipe], name_format=name_format)[0]
+
+
+def scale_recipe(recipe, new_batch_size, name=None):
+    """
+    Create a copy of recipe scaled to new_batch_size. Grain and hop weights
+    scale with the batch size; yeast amounts are copied unchanged.
+    ValueError for a batch size that is not a positive number or a recipe
+    without a batch size to scale from.
+    """
+    if not math.isfinite(new_batch_size) or new_batch_size <= 0:
+        raise ValueError('The new batch size must be a positive number')
+    if recipe.batch_size <= 0:
+        raise ValueError('The recipe has no batch size to scale from')
+    scale_factor = new_batch_size / recipe.batch_size
+    prefetch_related_objects([recipe], *ingredient_prefetches())
+
+    copy, additions = _build_copy(
+        recipe, scale_factor,
+        name=name or f"{recipe.name} ({new_batch_size}L)",
+        batch_size=new_batch_size
+    )
+    _price_copy(copy, additions, PriceBook.for_user(recipe.created_by_id))
+
+    with transaction.atomic():
+        return _save_copies([(copy, additions)])[0]
@@ -0,0 +1,168 @@
+"""
+Recipe costing against a user's inventory prices.
+
+A PriceBook holds every inventory price of one user, loaded with a single
+query, so any number of additions and recipes can be priced without further
+InventoryItem lookups.
+"""
+from .models import Recipe, GrainAddition, HopAddition, YeastAddition
+
+PRICE_CHUNK_SIZE = 500
+
+
+class PriceBook:
+    """
+    Inventory prices for one user keyed by (ingredient_type, ingredient_id).
+    Grains and hops are priced per kg, yeast per unit.
+    """
+    PRICE_FIELDS = {
+        'grain': 'cost_per_kg',
+        'hop': 'cost_per_kg',
+        'yeast': 'cost_per_unit',
+    }
+
+    def __init__(self, prices=None):
+        self.prices = prices or {}
+
+    @classmethod
+    def for_user(cls, user, ingredient_type=None, ingredient_ids=None):
+        """
+        Load the grain, hop and yeast prices of a user (or user id) in one
+        query, optionally limited to one ingredient type and a set of ids.
+        """
+        from inventory.models import InventoryItem
+
+        rows = InventoryItem.objects.filter(
+            user=user,
+            ingredient_type__in=[ingredient_type] if ingredient_type else cls.PRICE_FIELDS.keys()
+        )
+        if ingredient_ids is not None:
+            rows = rows.filter(ingredient_id__in=ingredient_ids)
+        rows = rows.values_list('ingredient_type', 'ingredient_id', 'cost_per_kg', 'cost_per_unit')
+
+        prices = {}
+        for ingredient_type, ingredient_id, cost_per_kg, cost_per_unit in rows:
+            price = cost_per_unit if cls.PRICE_FIELDS[ingredient_type] == 'cost_per_unit' else cost_per_kg
+            prices[(ingredient_type, ingredient_id)] = float(price or 0)
+        return cls(prices)
+
+    def price(self, ingredient_type, ingredient_id):
+        """Price per kg (grain, hop) or per unit (yeast); 0.0 when not stocked"""
+        return self.prices.get((ingredient_type, ingredient_id), 0.0)
+
+    def recipe_cost(self, recipe):
+        """Cost of a single recipe, using its prefetched additions when available"""
+        grain_additions, hop_additions, yeast_additions = recipe.load_ingredients()
+        return (
+            sum(addition.cost(self) for addition in grain_additions) +
+            sum(addition.cost(self) for addition in hop_additions) +
+            sum(addition.cost(self) for addition in yeast_additions)
+        )
+
+
+# Inventory units in kg (yeast is counted in units)
+UNIT_TO_KG = {
+    'kg': 1.0,
+    'g': 0.001,
+    'lb': 0.45359237,
+    'oz': 0.028349523125,
+}
+
+
+def inventory_stock(user, ingredient_type):
+    """
+    Current stock of one ingredient type for a user as {ingredient_id: amount},
+    in kg for grains and hops and in units for yeast. Only stocked items are
+    included.
+    """
+    from inventory.models import InventoryItem
+
+    rows = InventoryItem.objects.filter(
+        user=user, ingredient_type=ingredient_type, current_stock__gt=0
+    ).values_list('ingredient_id', 'current_stock', 'unit')
+
+    stock = {}
+    for ingredient_id, current_stock, unit in rows:
+        amount = current_stock if ingredient_type == 'yeast' else current_stock * UNIT_TO_KG.get(unit, 1.0)
+        stock[ingredient_id] = stock.get(ingredient_id, 0.0) + amount
+    return stock
+
+
+def price_recipes(recipes, price_books=None):
+    """
+    Price many recipes at once.
+
+    Loads one PriceBook per recipe owner and the additions of the recipes with
+    one query per addition type (per chunk of recipes). price_books can map
+    user ids to already loaded PriceBooks. Returns {recipe_id: cost}.
+    """
+    owners = {recipe.pk: recipe.created_by_id for recipe in recipes}
+    price_books = dict(price_books or {})
+    for user_id in set(owners.values()):
+        if user_id not in price_books:
+            price_books[user_id] = PriceBook.for_user(user_id)
+
+    costs = dict.fromkeys(owners, 0.0)
+    recipe_ids = list(owners)
+    addition_sources = [
+        (GrainAddition, 'grain', 'grain_id', 'weight'),
+        (HopAddition, 'hop', 'hop_id', 'weight'),
+        (YeastAddition, 'yeast', 'yeast_id', 'amount'),
+    ]
+
+    for start in range(0, len(recipe_ids), PRICE_CHUNK_SIZE):
+        chunk = recipe_ids[start:start + PRICE_CHUNK_SIZE]
+        for model, ingredient_type, ingredient_field, quantity_field in addition_sources:
+            rows = model.objects.filter(recipe_id__in=chunk).order_by().values_list(
+                'recipe_id', ingredient_field, quantity_field
+            )
+            for recipe_id, ingredient_id, quantity in rows:
+                price_book = price_books[owners[recipe_id]]
+                costs[recipe_id] += quantity * price_book.price(ingredient_type, ingredient_id)
+
+    return costs
+
+
+def refresh_recipe_costs(recipes, price_books=None):
+    """
+    Recalculate and bulk update calculated_cost / calculated_cost_per_liter
+    for the given recipes. Returns the number of recipes updated.
+    """
+    recipes = list(recipes)
+    costs = price_recipes(recipes, price_books)
+    for recipe in recipes:
+        recipe.calculated_cost = costs[recipe.pk]
+        recipe.calculated_cost_per_liter = (
+            recipe.calculated_cost / recipe.batch_size if recipe.batch_size > 0 else 0
+        )
+
+    Recipe.objects.bulk_update(
+        recipes, ['calculated_cost', 'calculated_cost_per_liter'], batch_size=PRICE_CHUNK_SIZE
+    )
+    return len(recipes)
+
+
+def recipes_using_ingredient(user, ingredient_type, ingredient_id):
+    """
+    Recipes of a user that contain the given ingredient, found through the
+    (ingredient, recipe) indexes on the addition tables.
+    """
+    addition_models = {
+        'grain': (GrainAddition, 'grain_id'),
+        'hop': (HopAddition, 'hop_id'),
+        'yeast': (YeastAddition, 'yeast_id'),
+    }
+    if ingredient_type not in addition_models:
+        return Recipe.objects.none()
+
+    model, ingredient_field = addition_models[ingredient_type]
+    recipe_ids = model.objects.filter(**{ingredient_field: ingredient_id}).values('recipe_id')
+    return Recipe.objects.filter(created_by=user, pk__in=recipe_ids)
+
+
+def refresh_costs_for_ingredient(user_id, ingredient_type, ingredient_id):
+    """Refresh stored costs of the user's recipes affected by an inventory price change"""
+    recipes = recipes_using_ingredient(user_id, ingredient_type, ingredient_id).only(
+        'id', 'created_by', 'batch_size', 'calculated_cost', 'calculated_cost_per_liter'
+    )
+    return refresh_recipe_costs(recipes, {user_id: PriceBook.for_user(user_id)})
@@ -3,12 +3,13 @@
 from django import forms
 from django.forms import modelformset_factory, inlineformset_factory
 from .models import Recipe, GrainAddition, HopAddition, YeastAddition, RecipeStep
+from .candidates import MAX_CANDIDATES
 from core.models import BeerStyle
 
 class RecipeForm(forms.ModelForm):
     class Meta:
         model = Recipe
-        fields = ['name', 'description', 'style', 'batch_size', 'efficiency', 'notes', 'is_public', 'is_favorite']
+        fields = ['name', 'description', 'style', 'batch_size', 'efficiency', 'ibu_model', 'notes', 'is_public', 'is_favorite']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
             'notes': forms.Textarea(attrs={'rows': 4}),
@@ -74,6 +75,13 @@ class RecipeGeneratorForm(forms.Form):
         initial=False,
         help_text="Only use ingredients from current inventory"
     )
+    candidates = forms.IntegerField(
+        required=False,
+        initial=1,
+        min_value=1,
+        max_value=MAX_CANDIDATES,
+        help_text="Generate this many candidate recipes and save only the best one"
+    )
 
 # Create formsets for inline editing
 GrainAdditionFormSet = inlineformset_factory(
@@ -86,4 +94,12 @@ HopAdditionFormSet = inlineformset_factory(
 
 YeastAdditionFormSet = inlineformset_factory(
     Recipe, YeastAddition, form=YeastAdditionForm, extra=1, can_delete=True
-)
\ No newline at end of file
+)
+
+
+class BeerXMLImportForm(forms.Form):
+    """Upload form for importing recipes from a BeerXML file"""
+    beerxml_file = forms.FileField(
+        label="BeerXML file",
+        help_text="A .xml file exported from BeerSmith, Brewfather or another brewing program"
+    )
@@ -0,0 +1,256 @@
+"""
+Deterministic grain-bill optimizer for the recipe generator.
+
+Every candidate grain set (one or two base malts plus up to a few specialty
+grains, depending on complexity) is solved at once. Only the few base malts
+and the few grains of each other grain type closest in color to the style
+are combined, so the number of sets stays bounded (MAX_CANDIDATE_SETS) as
+the catalog grows. For each set the weights come from a regularized least-squares fit of two linear targets, the extract
+units for the style's mid-range OG and the color units for its mid-range SRM,
+pulled towards a typical grist profile, and once more for the OG alone (for
+batches where the color target cannot be met together with it). Candidates are then evaluated with
+the same stats code as saved recipes (stats_from_totals) and checked against
+the grist share limits, inventory stock and the cost ceiling. The best
+candidate within the style ranges is returned; when none reaches them, OG
+takes priority over color. Ties are broken by catalog order, so the same inputs
+always give the same grain bill.
+"""
+from itertools import combinations
+from math import comb
+import numpy as np
+from core.calculations import GAL_PER_LITER, LB_PER_KG, MOREY_EXPONENT, MOREY_FACTOR
+from .stats import stats_from_totals
+
+# Largest share of the grist per grain, by grain type
+MAX_SHARE = {
+    'base': 1.0,
+    'specialty': 0.15,
+    'crystal': 0.20,
+    'roasted': 0.10,
+    'adjunct': 0.30,
+}
+
+# Share of a grain type in the typical grist the solver is pulled towards
+PROFILE_SHARE = {
+    'specialty': 0.06,
+    'crystal': 0.08,
+    'roasted': 0.03,
+    'adjunct': 0.08,
+}
+
+MIN_BASE_SHARE = 0.5
+
+# Smallest share of a grain that is part of a candidate set
+MIN_SHARE = 0.01
+
+# (most base malts, most specialty grains) per complexity
+COMPLEXITY = {
+    'simple': (1, 1),
+    'moderate': (1, 2),
+    'complex': (2, 3),
+}
+
+# Grains combined per request: base malts, and specialty grains of each
+# grain type, closest in color to the style first
+MAX_BASE_MALTS = 4
+MAX_PER_GRAIN_TYPE = 3
+
+# Most candidate grain sets solved per request
+MAX_CANDIDATE_SETS = 2000
+
+# Weights of the OG target, the SRM target and the typical profile in the fit
+OG_WEIGHT = 2.0
+SRM_WEIGHT = 1.0
+PROFILE_WEIGHT = 0.05
+
+# Weight of cost in the score (1.0 = cost of the most expensive candidate)
+COST_WEIGHT = 0.25
+
+# Extract units per kg for 1 PPG (see calculations.extract_points)
+EXTRACT_UNITS_PER_PPG_KG = LB_PER_KG / GAL_PER_LITER
+
+
+class GrainCatalog:
+    """Arrays describing the grains the optimizer may use"""
+
+    def __init__(self, grains, price_book=None, stock=None):
+        self.grains = [grain for grain in grains if grain.extract_potential > 0]
+        self.extract = np.array([grain.extract_potential for grain in self.grains], dtype=float) * EXTRACT_UNITS_PER_PPG_KG
+        self.color = np.array([grain.color for grain in self.grains], dtype=float)
+        self.grain_type = np.array([grain.grain_type for grain in self.grains], dtype=object)
+        self.is_base = self.grain_type == 'base'
+        self.max_share = np.array([MAX_SHARE.get(grain.grain_type, 0.1) for grain in self.grains])
+        self.profile_share = np.array([PROFILE_SHARE.get(grain.grain_type, 0.05) for grain in self.grains])
+        self.price = np.array([
+            price_book.price('grain', grain.pk) if price_book else 0.0 for grain in self.grains
+        ])
+        # Stock in kg; unlimited when stock is not given
+        self.stock = np.array([
+            stock.get(grain.pk, 0.0) if stock is not None else np.inf for grain in self.grains
+        ])
+
+    def closest(self, indices, target_srm, count):
+        """
+        Up to count of the grains at indices that are in stock, closest in
+        color to target_srm (on a log scale) first, in catalog order
+        """
+        indices = indices[self.stock[indices] > 0]
+        distance = np.abs(np.log1p(self.color[indices]) - np.log1p(target_srm))
+        return np.sort(indices[np.argsort(distance, kind='stable')[:count]])
+
+    def candidate_sets(self, complexity, target_srm):
+        """
+        Index arrays of candidate grain sets, grouped by set size. Up to
+        MAX_BASE_MALTS base malts and MAX_PER_GRAIN_TYPE grains of each
+        other grain type are combined; the specialty grains farthest from
+        target_srm are left out while there would be more than
+        MAX_CANDIDATE_SETS sets.
+        """
+        base_count, specialty_count = COMPLEXITY.get(complexity, COMPLEXITY['moderate'])
+        bases = self.closest(np.flatnonzero(self.is_base), target_srm, MAX_BASE_MALTS)
+        specialties = np.concatenate([np.array([], dtype=int)] + [
+            self.closest(np.flatnonzero(self.grain_type == grain_type), target_srm, MAX_PER_GRAIN_TYPE)
+            for grain_type in sorted(set(self.grain_type[~self.is_base]))
+        ])
+
+        def set_count(specialty_total):
+            base_sets = sum(comb(len(bases), count) for count in range(1, base_count + 1))
+            return base_sets * sum(comb(specialty_total, extra) for extra in range(specialty_count + 1))
+
+        while len(specialties) and set_count(len(specialties)) > MAX_CANDIDATE_SETS:
+            specialties = self.closest(specialties, target_srm, len(specialties) - 1)
+        specialties = np.sort(specialties)
+
+        groups = {}
+        for count in range(1, min(base_count, len(bases)) + 1):
+            for base_set in combinations(bases, count):
+                for extra in range(specialty_count + 1):
+                    for specialty_set in combinations(specialties, extra):
+                        grain_set = base_set + specialty_set
+                        groups.setdefault(len(grain_set), []).append(grain_set)
+        return [np.array(sets, dtype=int) for sets in groups.values() if sets]
+
+
+def _solve(catalog, sets, target_extract, target_color, srm_weight=SRM_WEIGHT):
+    """
+    Least-squares weights (kg) for stacked grain sets of one size: fit the
+    extract and color targets, regularized towards the typical profile.
+    """
+    extract = catalog.extract[sets]  # (n, k)
+    color = catalog.color[sets]
+
+    # Typical profile: specialty grains at their profile share, base malts share the rest
+    shares = np.where(catalog.is_base[sets], 0.0, catalog.profile_share[sets])
+    base_mask = catalog.is_base[sets]
+    base_total = np.maximum(1.0 - shares.sum(axis=1, keepdims=True), MIN_BASE_SHARE)
+    shares = np.where(base_mask, base_total / base_mask.sum(axis=1, keepdims=True), shares)
+    profile = shares * target_extract / (shares * extract).sum(axis=1, keepdims=True)
+
+    # Relative residuals: rows scaled by their target
+    rows = np.stack([
+        OG_WEIGHT * extract / target_extract,
+        srm_weight * color / max(target_color, 1e-9),
+    ], axis=1)  # (n, 2, k)
+    targets = np.tile([OG_WEIGHT, srm_weight], (len(sets), 1))
+    scale = PROFILE_WEIGHT / np.maximum(profile, 1e-6) ** 2
+
+    lhs = np.einsum('nik,nil->nkl', rows, rows) + scale[:, :, None] * np.eye(sets.shape[1])
+    rhs = np.einsum('nik,ni->nk', rows, targets) + scale * profile
+    return np.maximum(np.linalg.solve(lhs, rhs[..., None])[..., 0], 0.0)
+
+
+def solve_grain_bills(catalog, style, batch_size, efficiency=75.0, complexity='moderate', budget=None):
+    """
+    Solve all candidate grain sets for a style.
+
+    Returns a list of dicts (one per set size) with arrays: sets, weights,
+    og, srm, cost, valid (within share limits, stock and budget), og_in_style,
+    srm_in_style and score (lower is better).
+    """
+    target_og = (style.og_min + style.og_max) / 2
+    target_srm = (style.srm_min + style.srm_max) / 2
+    target_extract = (target_og - 1) * 1000 * batch_size / (efficiency / 100)
+    target_color = (target_srm / MOREY_FACTOR) ** (1 / MOREY_EXPONENT)
+
+    results = []
+    for sets in catalog.candidate_sets(complexity, target_srm):
+        weights = np.round(np.concatenate([
+            _solve(catalog, sets, target_extract, target_color),
+            _solve(catalog, sets, target_extract, target_color, srm_weight=0.0),
+        ]), 3)
+        sets = np.concatenate([sets, sets])
+        total = weights.sum(axis=1)
+        shares = weights / np.maximum(total, 1e-9)[:, None]
+
+        count = len(sets)
+        stats = stats_from_totals(
+            np.full(count, float(batch_size)), np.full(count, float(efficiency)),
+            (weights * catalog.extract[sets]).sum(axis=1), (weights * catalog.color[sets]).sum(axis=1),
+            np.zeros(count), np.zeros(count), np.zeros(count)
+        )
+        og, srm = stats['calculated_og'], stats['calculated_srm']
+        cost = (weights * catalog.price[sets]).sum(axis=1)
+
+        base_mask = catalog.is_base[sets]
+        og_in_style = (og >= style.og_min) & (og <= style.og_max)
+        srm_in_style = (srm >= style.srm_min) & (srm <= style.srm_max)
+        valid = (
+            ((shares * base_mask).sum(axis=1) >= MIN_BASE_SHARE) &
+            np.all(shares <= catalog.max_share[sets] + 1e-9, axis=1) &
+            np.all(shares >= MIN_SHARE, axis=1) &
+            np.all(weights <= catalog.stock[sets] + 1e-9, axis=1) &
+            (total > 0)
+        )
+        if budget is not None:
+            valid &= cost <= budget + 1e-9
+
+        # Distance from the middle of the style ranges: 0 at the middle, 1 at the edge
+        og_distance = np.abs(og - target_og) / max((style.og_max - style.og_min) / 2, 1e-9)
+        srm_distance = np.abs(srm - target_srm) / max((style.srm_max - style.srm_min) / 2, 1e-9)
+        score = og_distance + srm_distance + COST_WEIGHT * cost / max(cost.max(), 1e-9)
+
+        results.append({
+            'sets': sets, 'weights': weights, 'og': og, 'srm': srm,
+            'cost': cost, 'valid': valid,
+            'og_in_style': og_in_style, 'srm_in_style': srm_in_style, 'score': score,
+        })
+    return results
+
+
+def optimize_grain_bill(grains, style, batch_size, efficiency=75.0, complexity='moderate',
+                        price_book=None, budget=None, stock=None):
+    """
+    Best grain bill for a style within the budget (grain cost, priced from
+    price_book) and stock ({grain id: kg}, None for no limit).
+
+    Returns [(grain, weight_kg, percentage)] or None when no candidate fits.
+    """
+    if budget is not None and budget < 0:
+        return None
+
+    catalog = GrainCatalog(grains, price_book, stock)
+    best = None
+    for result in solve_grain_bills(catalog, style, batch_size, efficiency, complexity, budget):
+        candidates = np.flatnonzero(result['valid'])
+        if len(candidates) == 0:
+            continue
+        # Out of the OG range ranks after out of the SRM range, which ranks after in style
+        rank = (
+            np.where(result['og_in_style'][candidates], 0.0, 2e6) +
+            np.where(result['srm_in_style'][candidates], 0.0, 1e6) +
+            result['score'][candidates]
+        )
+        position = np.argmin(rank)
+        if best is None or rank[position] < best[0]:
+            index = candidates[position]
+            best = (rank[position], result['sets'][index], result['weights'][index])
+
+    if best is None:
+        return None
+
+    _, grain_set, weights = best
+    total = weights.sum()
+    return [
+        (catalog.grains[index], float(weight), round(float(weight / total * 100), 1))
+        for index, weight in zip(grain_set, weights)
+    ]
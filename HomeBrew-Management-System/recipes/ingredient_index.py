@@ -0,0 +1,247 @@
+"""
+Process-local ingredient name index.
+
+AI generated and imported recipes name their ingredients freely ("Crystal
+40L", "caramel 40", "Safale US-05"). IngredientIndex keeps every grain, hop
+and yeast of the catalog in memory keyed by normalized name, with a token
+index for fuzzy matching, so a whole recipe can be resolved without a query
+per ingredient.
+
+The index is versioned. Saving or deleting a catalog row bumps the local
+version, and changes made by other processes are picked up by a cheap
+version query at most every VERSION_CHECK_INTERVAL seconds. Ingredients
+created inside a transaction join the index only when it commits.
+"""
+import re
+import threading
+import time
+from difflib import SequenceMatcher
+from django.db import transaction
+from django.db.models import Count, Max, Value
+from .models import Grain, Hop, Yeast
+
+VERSION_CHECK_INTERVAL = 30
+
+# Minimum fuzzy score for a match
+MATCH_THRESHOLD = 0.6
+
+# Words that carry no information about which ingredient is meant
+STOP_WORDS = {'malt', 'malts', 'hop', 'hops', 'pellet', 'pellets', 'yeast', 'the', 'of', 'and'}
+
+SYNONYMS = {
+    'caramel': 'crystal',
+    'cara': 'crystal',
+    'choc': 'chocolate',
+    '2row': '2 row',
+    'two': '2',
+}
+
+INGREDIENT_MODELS = {
+    'grain': Grain,
+    'hop': Hop,
+    'yeast': Yeast,
+}
+
+
+def normalize(name):
+    """Lowercase, punctuation-free, synonym-mapped form of an ingredient name"""
+    name = (name or '').lower().replace('°', ' ')
+    name = re.sub(r'(\d+)\s*l\b', r'\1', name)  # "40L" / "40 L" (Lovibond) -> "40"
+    words = re.sub(r'[^a-z0-9]+', ' ', name).split()
+    return ' '.join(SYNONYMS.get(word, word) for word in words)
+
+
+def tokens(normalized):
+    return {word for word in normalized.split() if word not in STOP_WORDS}
+
+
+class _TypeIndex:
+    """Exact and token lookups for one ingredient type"""
+
+    def __init__(self, ingredients, keys):
+        self.by_key = {}
+        self.postings = {}
+        self.entries = []
+        for ingredient in ingredients:
+            self.add(ingredient, keys(ingredient))
+
+    def add(self, ingredient, keys):
+        for key in keys:
+            key = normalize(key)
+            if not key:
+                continue
+            self.by_key.setdefault(key, ingredient)
+            position = len(self.entries)
+            self.entries.append((key, ingredient))
+            for token in tokens(key):
+                self.postings.setdefault(token, []).append(position)
+
+    def match(self, name):
+        key = normalize(name)
+        if not key:
+            return None
+        if key in self.by_key:
+            return self.by_key[key]
+
+        query_tokens = tokens(key)
+        candidates = {position for token in query_tokens for position in self.postings.get(token, ())}
+        best_score, best = 0.0, None
+        for position in candidates:
+            entry_key, ingredient = self.entries[position]
+            entry_tokens = tokens(entry_key)
+            overlap = len(query_tokens & entry_tokens) / len(query_tokens | entry_tokens)
+            # Numbers (crystal 40 vs crystal 120, US-05 vs S-04) must agree
+            if {t for t in query_tokens if t.isdigit()} - entry_tokens:
+                overlap *= 0.5
+            score = 0.5 * overlap + 0.5 * SequenceMatcher(None, key, entry_key).ratio()
+            if score > best_score:
+                best_score, best = score, ingredient
+        return best if best_score >= MATCH_THRESHOLD else None
+
+
+class IngredientIndex:
+    """In-memory catalog of grains, hops and yeasts at one catalog version"""
+
+    KEYS = {
+        'grain': lambda grain: [grain.name],
+        'hop': lambda hop: [hop.name],
+        'yeast': lambda yeast: [
+            f'{yeast.laboratory} {yeast.strain_number}',
+            yeast.strain_number,
+            yeast.name,
+        ],
+    }
+
+    def __init__(self, version=None):
+        self.version = version
+        self.types = {
+            ingredient_type: _TypeIndex(model.objects.all(), self.KEYS[ingredient_type])
+            for ingredient_type, model in INGREDIENT_MODELS.items()
+        }
+
+    def match(self, ingredient_type, name):
+        """Best catalog match for name, or None"""
+        return self.types[ingredient_type].match(name)
+
+    def resolve(self, ingredient_type, names):
+        """{name: ingredient or None} for many names of one type"""
+        return {name: self.match(ingredient_type, name) for name in names}
+
+    def add(self, ingredient_type, ingredients):
+        """Add newly created ingredients without reloading the index"""
+        for ingredient in ingredients:
+            self.types[ingredient_type].add(ingredient, self.KEYS[ingredient_type](ingredient))
+
+    def _add_committed(self, ingredient_type, ingredients):
+        _local.uncommitted = False
+        self.add(ingredient_type, ingredients)
+        _adopt(self)
+
+    def resolve_or_create(self, ingredient_type, names, build):
+        """
+        Resolve names, creating the missing ingredients in one bulk_create.
+        build(name) returns an unsaved ingredient for a name. Returns
+        {name: ingredient}.
+        
+        Inside a transaction the index is marked stale at once and the new
+        ingredients are added when the transaction commits, so a rollback
+        cannot leave ingredients in the index that do not exist.
+        """
+        resolved = self.resolve(ingredient_type, names)
+        missing = {}
+        for name, ingredient in resolved.items():
+            key = normalize(name)
+            if ingredient is None and key and key not in missing:
+                missing[key] = build(name)
+
+        if missing:
+            created = list(missing.values())
+            INGREDIENT_MODELS[ingredient_type].objects.bulk_create(created)
+            if transaction.get_connection().in_atomic_block:
+                _local.uncommitted = True
+                bump_catalog_version()
+                transaction.on_commit(lambda: self._add_committed(ingredient_type, created))
+            else:
+                self._add_committed(ingredient_type, created)
+            for name, ingredient in resolved.items():
+                if ingredient is None and normalize(name) in missing:
+                    resolved[name] = missing[normalize(name)]
+        return resolved
+
+
+# db_version is UNKNOWN after this process changed the catalog itself: the
+# next version query is recorded without reloading the index
+UNKNOWN = object()
+
+_lock = threading.Lock()
+# uncommitted is set while this thread's transaction holds new catalog rows
+_local = threading.local()
+_state = {'index': None, 'local_version': 0, 'checked_at': 0.0, 'db_version': None}
+
+
+def _db_version():
+    """Catalog fingerprint (row count and last change per table) in one query"""
+    def fingerprint(model, label):
+        return model.objects.order_by().annotate(kind=Value(label)).values('kind').annotate(
+            count=Count('pk'), changed=Max('updated_at')
+        ).values_list('kind', 'count', 'changed')
+
+    rows = fingerprint(Grain, 'grain').union(fingerprint(Hop, 'hop'), fingerprint(Yeast, 'yeast'), all=True)
+    return tuple(sorted(rows))
+
+
+def catalog_version():
+    """Version of the catalog as seen by this process (used in cache keys)"""
+    return _state['local_version']
+
+
+def bump_catalog_version():
+    """Mark the local index stale after a catalog change"""
+    with _lock:
+        _state['local_version'] += 1
+        _state['checked_at'] = 0.0
+
+
+def _adopt(index):
+    """Keep an index that was updated in place as the current version"""
+    with _lock:
+        _state['local_version'] += 1
+        if _state['index'] is index:
+            index.version = _state['local_version']
+            _state['db_version'] = UNKNOWN
+
+
+def ingredient_index():
+    """
+    The process-wide IngredientIndex. Costs no query while the catalog is
+    known to be unchanged, one version query every VERSION_CHECK_INTERVAL
+    seconds, and a reload (three queries) when the catalog changed.
+    
+    While this thread's transaction holds catalog rows that are not
+    committed yet, a stale index is reloaded into a private index for the
+    caller instead of the shared one.
+    """
+    with _lock:
+        index = _state['index']
+        current = index is not None and index.version == _state['local_version']
+        now = time.monotonic()
+        if current and now - _state['checked_at'] < VERSION_CHECK_INTERVAL:
+            return index
+        if getattr(_local, 'uncommitted', False):
+            if transaction.get_connection().in_atomic_block:
+                return IngredientIndex()
+            # The transaction was rolled back
+            _local.uncommitted = False
+
+        db_version = _db_version()
+        known_version = _state['db_version']
+        _state['checked_at'] = now
+        _state['db_version'] = db_version
+        if current and (known_version is UNKNOWN or db_version == known_version):
+            return index
+
+        if known_version is not None and db_version != known_version:
+            # Changed by another process
+            _state['local_version'] += 1
+        _state['index'] = IngredientIndex(_state['local_version'])
+        return _state['index']
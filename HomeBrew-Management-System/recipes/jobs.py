@@ -0,0 +1,227 @@
+"""
+Background AI recipe generation.
+
+An upstream model call takes seconds, so generation requests are stored as
+RecipeGenerationJob rows and run by an in-process thread pool instead of the
+request thread. The client polls the job until it is completed or failed.
+
+The API call itself runs on a second pool so that it can be abandoned after
+AI_GENERATION_TIMEOUT seconds; the job then falls back to the formula
+generator. An abandoned call still fills the response cache when it returns.
+Jobs live in the process that accepted them: a job that was queued or running
+when the process stopped is not resumed. Jobs that have not changed for
+AI_JOB_EXPIRY seconds are marked failed (expire_stale_jobs), so clients
+polling an orphaned job get an answer.
+"""
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import BrewingCalculator
+from .models import RecipeGenerationJob
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 60
+# Seconds without progress after which a queued or running job is failed
+DEFAULT_EXPIRY = 10 * 60
+
+EXPIRED_ERROR = 'The job stopped before it finished. Please try again.'
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(name):
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AI_GENERATION_WORKERS', DEFAULT_WORKERS),
+                thread_name_prefix=f'ai-{name}'
+            )
+        return _pools[name]
+
+
+def _closing_connection(func, *args):
+    """Run func in a pool thread and release the thread's database connection"""
+    try:
+        return func(*args)
+    finally:
+        connection.close()
+
+
+def submit_generation_job(user, batch_size, style_name, constraints='', method='openai', save_recipe=False):
+    """
+    Store a generation job and queue it once the current transaction commits.
+    Returns the job.
+    """
+    expire_stale_jobs()
+    job = RecipeGenerationJob.objects.create(
+        user=user,
+        batch_size=batch_size,
+        style_name=style_name,
+        constraints=constraints or '',
+        method=method,
+        save_recipe=save_recipe,
+        message='Waiting for a free worker'
+    )
+    transaction.on_commit(lambda: _pool('jobs').submit(_closing_connection, run_generation_job, job.pk))
+    return job
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'AI_JOB_EXPIRY', DEFAULT_EXPIRY))
+
+
+def expire_stale_jobs(jobs=None):
+    """
+    Mark queued or running jobs (of the jobs queryset, all by default) that
+    have not changed for AI_JOB_EXPIRY seconds as failed. Their process
+    stopped or they are stuck; a failed job is never claimed again. Returns
+    the number of expired jobs.
+    """
+    if jobs is None:
+        jobs = RecipeGenerationJob.objects.all()
+    now = timezone.now()
+    return jobs.filter(status__in=('queued', 'running'), updated_at__lt=_expiry_cutoff()).update(
+        status='failed', message='Generation expired', error=EXPIRED_ERROR, finished_at=now, updated_at=now
+    )
+
+
+def expire_if_stale(job):
+    """The job, failed and refreshed if it had expired"""
+    if not job.is_finished and job.updated_at < _expiry_cutoff():
+        if expire_stale_jobs(RecipeGenerationJob.objects.filter(pk=job.pk)):
+            job.refresh_from_db()
+    return job
+
+
+def _update(job_id, **fields):
+    """Update a running job; a job that expired meanwhile stays failed"""
+    RecipeGenerationJob.objects.filter(pk=job_id, status='running').update(updated_at=timezone.now(), **fields)
+
+
+def run_generation_job(job_id, generator=None, timeout=None):
+    """
+    Run a queued job: ask the API (up to timeout seconds), fall back to the
+    formula generator, and optionally save the recipe. The recipe is saved
+    and the job completed in one transaction, only if the job has not
+    expired meanwhile.
+    """
+    from .ai_generator import AIRecipeGenerator
+
+    # Claim the job so it runs only once
+    claimed = RecipeGenerationJob.objects.filter(pk=job_id, status='queued').update(
+        status='running', progress=10, message='Generating recipe',
+        started_at=timezone.now(), updated_at=timezone.now()
+    )
+    if not claimed:
+        return
+
+    job = RecipeGenerationJob.objects.select_related('user').get(pk=job_id)
+    if timeout is None:
+        timeout = getattr(settings, 'AI_GENERATION_TIMEOUT', DEFAULT_TIMEOUT)
+
+    try:
+        generator = generator or AIRecipeGenerator()
+        request = (job.batch_size, job.style_name, job.constraints)
+
+        recipe_data, source = None, job.method
+        if job.method != 'formulas':
+            future = _pool('api').submit(
+                _closing_connection, generator.generate_recipe_data, job.method, *request, False
+            )
+            try:
+                recipe_data = future.result(timeout=timeout)
+            except TimeoutError:
+                recipe_data = None
+            if recipe_data is None:
+                _update(job_id, progress=50, message='AI service unavailable, using brewing formulas')
+
+        if recipe_data is None:
+            source = 'formulas'
+            recipe_data = generator.generate_recipe_data('formulas', *request)
+
+        if job.save_recipe:
+            _update(job_id, progress=80, message='Saving recipe')
+        with transaction.atomic():
+            # Lock the job: a job that expired during generation gets no recipe
+            if not RecipeGenerationJob.objects.select_for_update().filter(pk=job_id, status='running').exists():
+                return
+            recipe = None
+            if job.save_recipe:
+                recipe = generator.create_recipe_from_ai_response(
+                    recipe_data, generator.find_style(job.style_name), job.batch_size, job.user
+                )
+            _update(
+                job_id, status='completed', progress=100, message='Recipe ready', source=source,
+                recipe_data=recipe_data, recipe=recipe, finished_at=timezone.now()
+            )
+    except Exception as e:
+        _update(job_id, status='failed', message='Generation failed', error=str(e), finished_at=timezone.now())
+
+
+def display_recipe(recipe_data, batch_size):
+    """
+    Recipe data of a job in the format of the AI generator page and the
+    ai_save_recipe endpoint
+    """
+    grain_bill = [
+        {
+            'name': grain['grain_name'],
+            'weight_kg': grain['weight_kg'],
+            'percentage': grain.get('percentage') or 0,
+        }
+        for grain in recipe_data.get('grain_bill', [])
+    ]
+    total_grain = sum(grain['weight_kg'] for grain in grain_bill)
+    strike_volume = batch_size + total_grain * 0.96
+    water_ratio = strike_volume / total_grain if total_grain else 3.0
+
+    yeast = recipe_data.get('yeast') or {}
+    notes = recipe_data.get('brewing_notes') or ''
+    return {
+        'recipe_name': recipe_data.get('recipe_name', 'AI Generated Recipe'),
+        'grain_bill': grain_bill,
+        'hop_schedule': [
+            {
+                'name': hop['hop_name'],
+                'weight_g': round(hop['weight_kg'] * 1000, 1),
+                'boil_time': hop.get('boil_time_minutes', 60),
+                'use': hop.get('use', 'boil'),
+            }
+            for hop in recipe_data.get('hop_schedule', [])
+        ],
+        'yeast': {'name': yeast.get('yeast_name', 'US-05'), 'amount': yeast.get('amount', 1)},
+        'expected_stats': {
+            'og': recipe_data.get('expected_og', 0),
+            'fg': recipe_data.get('expected_fg', 0),
+            'ibu': recipe_data.get('expected_ibu', 0),
+            'abv': recipe_data.get('expected_abv', 0),
+            'srm': recipe_data.get('expected_srm', 0),
+        },
+        'brewing_instructions': [line.strip() for line in notes.splitlines() if line.strip()],
+        'water_calculations': {
+            'strike_volume': round(strike_volume, 1),
+            'strike_temp': round(BrewingCalculator.calculate_strike_water_temp(20, 67, water_ratio), 1),
+            'mash_temp': 67,
+        },
+    }
+
+
+def job_payload(job):
+    """JSON-ready status of a job"""
+    payload = {
+        'job_id': job.pk,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'source': job.source,
+        'error': job.error,
+        'recipe_id': job.recipe_id,
+        'recipe': None,
+    }
+    if job.status == 'completed' and job.recipe_data:
+        payload['recipe'] = display_recipe(job.recipe_data, job.batch_size)
+    return payload
@@ -0,0 +1,75 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from core import hop_utilization
+
+# Share of synthetic additions per use
+USE_SHARES = {'boil': 0.7, 'flameout': 0.1, 'whirlpool': 0.1, 'dry_hop': 0.1}
+
+
+def synthetic_corpus(recipes, rng, max_additions=5):
+    """
+    Random recipes and hop additions as arrays: per recipe og and
+    batch_size; per addition recipe position, alpha acid, grams, minutes and
+    use
+    """
+    counts = rng.integers(1, max_additions + 1, recipes)
+    position = np.repeat(np.arange(recipes), counts)
+    additions = len(position)
+    use = rng.choice(list(USE_SHARES), additions, p=list(USE_SHARES.values()))
+    minutes = np.where(
+        use == 'boil', rng.choice([90, 60, 45, 30, 20, 15, 10, 5, 0], additions),
+        np.where(use == 'dry_hop', 0, rng.choice([0, 10, 20, 30, 45, 60], additions))
+    )
+    return {
+        'og': rng.uniform(1.030, 1.110, recipes),
+        'batch_size': rng.uniform(5, 60, recipes),
+        'position': position,
+        'alpha_acid': rng.uniform(3, 16, additions),
+        'grams': rng.uniform(5, 120, additions),
+        'minutes': minutes.astype(float),
+        'use': use,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the hop utilization models on a synthetic recipe corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000, help='Number of synthetic recipes')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        recipes = max(1, options['recipes'])
+        corpus = synthetic_corpus(recipes, np.random.default_rng(options['seed']))
+        additions = len(corpus['position'])
+        self.stdout.write(f'{recipes} recipes, {additions} hop additions')
+        self.stdout.write(
+            f'{"Model":10} {"Time (ms)":>10} {"ns/addition":>12} {"Mean IBU":>9} {"P5":>7} {"P95":>7} '
+            f'{"vs Tinseth":>11}'
+        )
+
+        results = {}
+        for name, model in hop_utilization.MODELS.items():
+            start = time.perf_counter()
+            units = model.units(corpus['alpha_acid'], corpus['grams'], corpus['minutes'], corpus['use'])
+            totals = np.bincount(corpus['position'], weights=units, minlength=recipes)
+            ibu = model.ibu(totals, corpus['og'], corpus['batch_size'])
+            elapsed = time.perf_counter() - start
+            results[name] = ibu
+
+            baseline = results.get('tinseth')
+            ratio = np.median(ibu[baseline > 0] / baseline[baseline > 0]) if baseline is not None else np.nan
+            self.stdout.write(
+                f'{name:10} {elapsed * 1000:10.1f} {elapsed / additions * 1e9:12.1f} {ibu.mean():9.1f} '
+                f'{np.percentile(ibu, 5):7.1f} {np.percentile(ibu, 95):7.1f} {ratio:10.2f}x'
+            )
+
+        # Hot stand: boil minutes equivalent of whirlpool and flameout additions
+        self.stdout.write('Boil minutes equivalent of a hot stand:')
+        stand = np.array([10, 20, 30, 60], dtype=float)
+        for use in ('flameout', 'whirlpool'):
+            equivalent = hop_utilization.boil_minutes(stand, use)
+            self.stdout.write(
+                f'  {use:9} ' + ', '.join(f'{m:.0f} min -> {e:.1f}' for m, e in zip(stand, equivalent))
+            )
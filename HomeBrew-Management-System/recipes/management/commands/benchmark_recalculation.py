@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipe
+from recipes.batch import recalculate_recipes, CALCULATED_FIELDS, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-recipe calculate_all_values loop with the batch engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Number of recipes to benchmark')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        recipe_ids = list(
+            Recipe.objects.filter(batch_size__gt=0)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:options['limit']]
+        )
+        if not recipe_ids:
+            self.stdout.write(self.style.WARNING('No recipes to benchmark.'))
+            return
+
+        self.stdout.write(f'Benchmarking {len(recipe_ids)} recipes...')
+
+        # Per-recipe loop
+        with CaptureQueriesContext(connection) as loop_queries:
+            start = time.perf_counter()
+            for recipe in Recipe.objects.filter(pk__in=recipe_ids):
+                recipe.calculate_all_values()
+            loop_time = time.perf_counter() - start
+        loop_values = self.snapshot(recipe_ids)
+
+        # Batch engine
+        with CaptureQueriesContext(connection) as batch_queries:
+            start = time.perf_counter()
+            recalculate_recipes(Recipe.objects.filter(pk__in=recipe_ids), chunk_size=options['chunk_size'])
+            batch_time = time.perf_counter() - start
+        batch_values = self.snapshot(recipe_ids)
+
+        max_difference = max(
+            abs((loop_value or 0) - (batch_value or 0))
+            for pk in recipe_ids
+            for loop_value, batch_value in zip(loop_values[pk], batch_values[pk])
+        )
+
+        self.stdout.write(f'Per-recipe loop: {loop_time:.3f}s, {len(loop_queries)} queries')
+        self.stdout.write(f'Batch engine:    {batch_time:.3f}s, {len(batch_queries)} queries')
+        if batch_time > 0:
+            self.stdout.write(f'Speedup:         {loop_time / batch_time:.1f}x')
+        self.stdout.write(f'Max difference:  {max_difference:.2e}')
+
+    def snapshot(self, recipe_ids):
+        """Read the calculated fields for the benchmarked recipes"""
+        return {
+            row[0]: row[1:]
+            for row in Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', *CALCULATED_FIELDS)
+        }
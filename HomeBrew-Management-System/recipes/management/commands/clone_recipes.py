@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+from recipes.cloning import clone_recipes, COPY_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Bulk clone recipes, e.g. to seed an account with a recipe library'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-user', required=True, help='Username whose recipes are cloned')
+        parser.add_argument('--to-user', help='Username that receives the clones (defaults to --from-user)')
+        parser.add_argument('--style', help='Only clone recipes of this style code')
+        parser.add_argument('--public-only', action='store_true', help='Only clone public recipes')
+        parser.add_argument('--copies', type=int, default=1, help='Number of clones per recipe')
+        parser.add_argument('--name-format', default='{name} (Copy)',
+                            help='Clone name; {name} is the source name, {copy} the copy number')
+        parser.add_argument('--chunk-size', type=int, default=COPY_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            target = User.objects.get(username=options['to_user'] or options['from_user'])
+        except User.DoesNotExist:
+            raise CommandError('Target user does not exist')
+
+        recipes = Recipe.objects.filter(created_by__username=options['from_user']).order_by('pk')
+        if options['style']:
+            recipes = recipes.filter(style__style_code=options['style'])
+        if options['public_only']:
+            recipes = recipes.filter(is_public=True)
+
+        self.stdout.write(f'Cloning {recipes.count()} recipes x {options["copies"]} for {target.username}...')
+        created = clone_recipes(
+            recipes,
+            created_by=target,
+            copies=options['copies'],
+            name_format=options['name_format'],
+            chunk_size=options['chunk_size']
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully created {len(created)} recipes!')
+        )
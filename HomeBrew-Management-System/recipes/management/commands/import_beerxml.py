@@ -0,0 +1,34 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from recipes.beerxml import import_beerxml, IMPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Import recipes from a BeerXML file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='BeerXML file to import')
+        parser.add_argument('--user', required=True, help='Username that owns the imported recipes')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist')
+
+        start = time.perf_counter()
+        result = import_beerxml(options['path'], user, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+
+        for name, reason in result['skipped']:
+            self.stdout.write(self.style.WARNING(f'Skipped "{name}": {reason}'))
+        created = result['ingredients_created']
+        self.stdout.write(
+            f'New catalog ingredients: {created["grains"]} grains, '
+            f'{created["hops"]} hops, {created["yeasts"]} yeasts'
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully imported {len(result["recipe_ids"])} recipes in {elapsed:.1f}s!')
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.batch import recalculate_recipes, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recalculate OG/FG/IBU/SRM/ABV for recipes using the batch engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only recalculate recipes created by this username')
+        parser.add_argument('--style', help='Only recalculate recipes of this style code')
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Number of recipes loaded and written per query'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['user']:
+            recipes = recipes.filter(created_by__username=options['user'])
+        if options['style']:
+            recipes = recipes.filter(style__style_code=options['style'])
+
+        self.stdout.write(f'Recalculating {recipes.count()} recipes...')
+        updated = recalculate_recipes(recipes, chunk_size=options['chunk_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully recalculated {updated} recipes!')
+        )
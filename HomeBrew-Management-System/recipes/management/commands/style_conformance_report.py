@@ -0,0 +1,79 @@
+import csv
+import numpy as np
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.style_index import STAT_NAMES, RECIPE_FIELDS, StyleIndex
+from core.models import BeerStyle
+
+
+class Command(BaseCommand):
+    help = 'Report how many recipes fit their style ranges, per style and per stat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only report recipes created by this username')
+        parser.add_argument('--csv', help='Also write one row per recipe to this CSV file')
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Number of recipes checked per batch'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('pk')
+        if options['user']:
+            recipes = recipes.filter(created_by__username=options['user'])
+
+        index = StyleIndex(BeerStyle.objects.all())
+        summary = {}  # style id -> [recipes, in style, out per stat...]
+        writer = None
+        csv_file = open(options['csv'], 'w', newline='') if options['csv'] else None
+        if csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['recipe_id', 'name', 'style', 'fits', 'out_of_range', 'best_matching_style'])
+
+        rows = recipes.values_list('pk', 'name', 'style_id', *RECIPE_FIELDS)
+        total = 0
+        try:
+            chunk = []
+            for row in rows.iterator(chunk_size=options['chunk_size']):
+                chunk.append(row)
+                if len(chunk) == options['chunk_size']:
+                    total += self.check_chunk(index, chunk, summary, writer)
+                    chunk = []
+            if chunk:
+                total += self.check_chunk(index, chunk, summary, writer)
+        finally:
+            if csv_file:
+                csv_file.close()
+
+        self.stdout.write(f'{"Style":<32} {"Recipes":>8} {"In style":>9} ' + ' '.join(f'{name.upper():>5}' for name in STAT_NAMES))
+        for style in index.styles:
+            counts = summary.get(style.pk)
+            if counts:
+                self.stdout.write(
+                    f'{str(style)[:32]:<32} {counts[0]:>8} {counts[1]:>9} ' +
+                    ' '.join(f'{count:>5}' for count in counts[2:])
+                )
+        fitting = sum(counts[1] for counts in summary.values())
+        self.stdout.write(self.style.SUCCESS(f'{fitting} of {total} recipes are within their style ranges'))
+
+    def check_chunk(self, index, chunk, summary, writer):
+        """Check one chunk of (id, name, style id, stats...) rows; returns its size"""
+        stats = np.array([[np.nan if value is None else value for value in row[3:]] for row in chunk], dtype=float)
+        style_ids = [row[2] for row in chunk]
+        own = index.conformance(stats, style_ids)
+
+        for row, style_id, fits, deviation in zip(chunk, style_ids, own['fits'], own['deviation']):
+            counts = summary.setdefault(style_id, [0, 0] + [0] * len(STAT_NAMES))
+            counts[0] += 1
+            counts[1] += int(fits)
+            for position, value in enumerate(deviation):
+                counts[2 + position] += int(value != 0 and not np.isnan(value))
+
+        if writer:
+            best = np.argmin(index.conformance(stats)['distance'], axis=1) if index.styles else []
+            for position, (row, fits, deviation) in enumerate(zip(chunk, own['fits'], own['deviation'])):
+                out = [name for name, value in zip(STAT_NAMES, deviation) if value != 0 and not np.isnan(value)]
+                own_style = index.styles[index.positions[row[2]]].style_code if row[2] in index.positions else ''
+                best_style = index.styles[best[position]].style_code if index.styles else ''
+                writer.writerow([row[0], row[1], own_style, bool(fits), ' '.join(out), best_style])
+        return len(chunk)
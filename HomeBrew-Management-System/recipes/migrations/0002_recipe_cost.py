@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+def backfill_recipe_costs(apps, schema_editor):
+    """Store the current inventory cost of every existing recipe"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    additions = [
+        (apps.get_model('recipes', 'GrainAddition'), 'grain', 'grain_id', 'weight', 'cost_per_kg'),
+        (apps.get_model('recipes', 'HopAddition'), 'hop', 'hop_id', 'weight', 'cost_per_kg'),
+        (apps.get_model('recipes', 'YeastAddition'), 'yeast', 'yeast_id', 'amount', 'cost_per_unit'),
+    ]
+
+    prices = {}
+    for row in InventoryItem.objects.values('user_id', 'ingredient_type', 'ingredient_id', 'cost_per_kg', 'cost_per_unit'):
+        for _, ingredient_type, _, _, price_field in additions:
+            if row['ingredient_type'] == ingredient_type:
+                key = (row['user_id'], ingredient_type, row['ingredient_id'])
+                prices[key] = float(row[price_field] or 0)
+
+    recipes = list(Recipe.objects.only('id', 'created_by_id', 'batch_size'))
+    owners = {recipe.pk: recipe.created_by_id for recipe in recipes}
+    costs = dict.fromkeys(owners, 0.0)
+    for model, ingredient_type, ingredient_field, quantity_field, _ in additions:
+        for recipe_id, ingredient_id, quantity in model.objects.values_list('recipe_id', ingredient_field, quantity_field):
+            costs[recipe_id] += quantity * prices.get((owners[recipe_id], ingredient_type, ingredient_id), 0.0)
+
+    for recipe in recipes:
+        recipe.calculated_cost = costs[recipe.pk]
+        recipe.calculated_cost_per_liter = costs[recipe.pk] / recipe.batch_size if recipe.batch_size > 0 else 0
+    Recipe.objects.bulk_update(recipes, ['calculated_cost', 'calculated_cost_per_liter'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='calculated_cost',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='calculated_cost_per_liter',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='grainaddition',
+            index=models.Index(fields=['grain', 'recipe'], name='recipes_gra_grain_i_ad4b31_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hopaddition',
+            index=models.Index(fields=['hop', 'recipe'], name='recipes_hop_hop_id_041070_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='yeastaddition',
+            index=models.Index(fields=['yeast', 'recipe'], name='recipes_yea_yeast_i_f20cfb_idx'),
+        ),
+        migrations.RunPython(backfill_recipe_costs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2 on 2026-10-17 19:15
+
+from django.db import migrations, models
+
+
+# The contribution formulas as of this migration, frozen so that later
+# changes to recipes.stats do not change what it writes
+def grain_contribution(weight_kg, extract_potential, color):
+    """(extract_units, color_units) of a grain addition"""
+    return weight_kg * 2.2 * extract_potential / 0.264, weight_kg * color
+
+
+def hop_contribution(alpha_acid, weight_kg, boil_time):
+    """IBU units of a boiled hop addition (Tinseth boil time factor)"""
+    return alpha_acid * (weight_kg * 1000) * (1 - 2.718 ** (-0.04 * boil_time)) / 4.15
+
+
+def backfill_contributions(apps, schema_editor):
+    """Store the contribution of every addition and the running totals of every recipe"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    GrainAddition = apps.get_model('recipes', 'GrainAddition')
+    HopAddition = apps.get_model('recipes', 'HopAddition')
+    YeastAddition = apps.get_model('recipes', 'YeastAddition')
+
+    totals = {
+        recipe_id: {'total_extract_units': 0.0, 'total_color_units': 0.0,
+                    'total_ibu_units': 0.0, 'total_attenuation': 0.0, 'yeast_count': 0}
+        for recipe_id in Recipe.objects.values_list('pk', flat=True)
+    }
+
+    grain_additions = list(GrainAddition.objects.select_related('grain'))
+    for addition in grain_additions:
+        addition.extract_units, addition.color_units = grain_contribution(
+            addition.weight, addition.grain.extract_potential, addition.grain.color
+        )
+        totals[addition.recipe_id]['total_extract_units'] += addition.extract_units
+        totals[addition.recipe_id]['total_color_units'] += addition.color_units
+    GrainAddition.objects.bulk_update(grain_additions, ['extract_units', 'color_units'], batch_size=500)
+
+    hop_additions = list(HopAddition.objects.select_related('hop'))
+    for addition in hop_additions:
+        addition.ibu_units = hop_contribution(addition.hop.alpha_acid, addition.weight, addition.boil_time)
+        totals[addition.recipe_id]['total_ibu_units'] += addition.ibu_units
+    HopAddition.objects.bulk_update(hop_additions, ['ibu_units'], batch_size=500)
+
+    yeast_additions = list(YeastAddition.objects.select_related('yeast'))
+    for addition in yeast_additions:
+        addition.attenuation = addition.yeast.attenuation
+        totals[addition.recipe_id]['total_attenuation'] += addition.attenuation
+        totals[addition.recipe_id]['yeast_count'] += 1
+    YeastAddition.objects.bulk_update(yeast_additions, ['attenuation'], batch_size=500)
+
+    recipes = [Recipe(pk=recipe_id, **values) for recipe_id, values in totals.items()]
+    Recipe.objects.bulk_update(
+        recipes,
+        ['total_extract_units', 'total_color_units', 'total_ibu_units', 'total_attenuation', 'yeast_count'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipe_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grainaddition',
+            name='color_units',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='grainaddition',
+            name='extract_units',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hopaddition',
+            name='ibu_units',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='total_attenuation',
+            field=models.FloatField(default=0.0, help_text='Sum of yeast attenuation %'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='total_color_units',
+            field=models.FloatField(default=0.0, help_text='Malt color units (kg x SRM)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='total_extract_units',
+            field=models.FloatField(default=0.0, help_text='Gravity points at 100% efficiency'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='total_ibu_units',
+            field=models.FloatField(default=0.0, help_text='Alpha acid x grams x boil time factor'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='yeast_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='yeastaddition',
+            name='attenuation',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.RunPython(backfill_contributions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 19:30
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_addition_contributions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeGenerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('progress', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('message', models.CharField(blank=True, max_length=200)),
+                ('method', models.CharField(choices=[('openai', 'OpenAI'), ('claude', 'Claude'), ('formulas', 'Brewing formulas')], default='openai', max_length=20)),
+                ('style_name', models.CharField(max_length=100)),
+                ('batch_size', models.FloatField(validators=[django.core.validators.MinValueValidator(1.0)])),
+                ('constraints', models.TextField(blank=True)),
+                ('save_recipe', models.BooleanField(default=False, help_text='Save the generated recipe when done')),
+                ('source', models.CharField(blank=True, choices=[('openai', 'OpenAI'), ('claude', 'Claude'), ('formulas', 'Brewing formulas')], help_text='Generator that answered', max_length=20)),
+                ('recipe_data', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('recipe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='recipes_rec_status_8e0460_idx')],
+            },
+        ),
+    ]
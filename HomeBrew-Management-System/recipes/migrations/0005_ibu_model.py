@@ -0,0 +1,94 @@
+# Generated by Django 5.2 on 2026-10-17 19:46
+
+import math
+from django.db import migrations, models
+
+
+# Tinseth and the hot stand model as of this migration, frozen so that later
+# changes to recipes.stats or core.hop_utilization do not change what it writes
+HOT_STAND_TEMPERATURES = {'flameout': 100.0, 'whirlpool': 80.0}
+AMBIENT_TEMPERATURE = 20.0
+COOLING_MINUTES = 80.0
+ISOMERIZATION_ACTIVATION = 11858.0
+HOT_STAND_STEP = 0.5
+
+
+def hot_stand_minutes(minutes, start_temperature):
+    """Boil minutes equivalent to a hot stand of minutes in cooling wort"""
+    def rate(time):
+        temperature = AMBIENT_TEMPERATURE + (start_temperature - AMBIENT_TEMPERATURE) * math.exp(-time / COOLING_MINUTES)
+        return math.exp(-ISOMERIZATION_ACTIVATION * (1 / (temperature + 273.15) - 1 / 373.15))
+
+    total, time = 0.0, 0.0
+    while time + HOT_STAND_STEP <= minutes:
+        total += (rate(time) + rate(time + HOT_STAND_STEP)) / 2 * HOT_STAND_STEP
+        time += HOT_STAND_STEP
+    if minutes > time:
+        # Linear interpolation within the last step
+        total += (rate(time) + rate(time + HOT_STAND_STEP)) / 2 * (minutes - time)
+    return total
+
+
+def hop_contribution(alpha_acid, weight_kg, boil_time, use):
+    """Tinseth IBU units of a hop addition; dry hops add none"""
+    if use == 'dry_hop':
+        return 0.0
+    minutes = max(boil_time, 0)
+    if use in HOT_STAND_TEMPERATURES:
+        minutes = hot_stand_minutes(minutes, HOT_STAND_TEMPERATURES[use])
+    return alpha_acid * weight_kg * 1000 * -math.expm1(-0.04 * minutes) / 4.15
+
+
+def tinseth_ibu(recipe):
+    """Tinseth IBU of the recipe's running totals"""
+    points = recipe.total_extract_units * recipe.efficiency / 100
+    og = 1 + points / recipe.batch_size / 1000 if points > 0 else 1.0
+    return 1.65 * 0.000125 ** (og - 1) * recipe.total_ibu_units * 10 / recipe.batch_size
+
+
+def refresh_hop_uses(apps, schema_editor):
+    """
+    Whirlpool, flameout and dry hop additions were counted as boil additions;
+    store their new IBU units and update the totals and IBU of their recipes
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    HopAddition = apps.get_model('recipes', 'HopAddition')
+
+    additions = list(
+        HopAddition.objects.exclude(use='boil').select_related('hop')
+    )
+    deltas = {}
+    for addition in additions:
+        ibu_units = hop_contribution(addition.hop.alpha_acid, addition.weight, addition.boil_time, addition.use)
+        deltas[addition.recipe_id] = deltas.get(addition.recipe_id, 0.0) + ibu_units - addition.ibu_units
+        addition.ibu_units = ibu_units
+    HopAddition.objects.bulk_update(additions, ['ibu_units'], batch_size=500)
+
+    recipes = list(Recipe.objects.filter(pk__in=deltas))
+    for recipe in recipes:
+        recipe.total_ibu_units += deltas[recipe.pk]
+        if recipe.batch_size <= 0:
+            continue
+        recipe.calculated_ibu = tinseth_ibu(recipe)
+    Recipe.objects.bulk_update(recipes, ['total_ibu_units', 'calculated_ibu'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_generation_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ibu_model',
+            field=models.CharField(choices=[('tinseth', 'Tinseth'), ('rager', 'Rager'), ('garetz', 'Garetz')], default='tinseth', help_text='Hop utilization model used for IBU', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='total_ibu_units',
+            field=models.FloatField(default=0.0, help_text='Alpha acid x grams x boil time utilization'),
+        ),
+        migrations.RunPython(refresh_hop_uses, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,33 @@
 from django.db import models
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
+from core import hop_utilization
 from core.models import TimeStampedModel, BeerStyle, BrewingCalculator
+from .stats import TOTAL_FIELDS, CALCULATED_FIELDS, grain_contribution, hop_contribution, stats_from_totals
 import json
 
+INGREDIENT_LOOKUPS = ('grainaddition_set', 'hopaddition_set', 'yeastaddition_set')
+
+def ingredient_prefetches():
+    """Prefetches that load every addition of a recipe together with its ingredient"""
+    return [
+        Prefetch('grainaddition_set', queryset=GrainAddition.objects.select_related('grain')),
+        Prefetch('hopaddition_set', queryset=HopAddition.objects.select_related('hop')),
+        Prefetch('yeastaddition_set', queryset=YeastAddition.objects.select_related('yeast')),
+    ]
+
+class RecipeQuerySet(models.QuerySet):
+    """
+    QuerySet with a shared loader for recipe ingredients
+    """
+    
+    def with_ingredients(self):
+        """Fetch recipes with style, brewer, all additions and their ingredient rows"""
+        return self.select_related('style', 'created_by').prefetch_related(*ingredient_prefetches())
+
 class Recipe(TimeStampedModel):
     """
     Main recipe model
@@ -17,6 +40,10 @@ class Recipe(TimeStampedModel):
     # Batch information
     batch_size = models.FloatField(help_text="Batch size in liters")
     efficiency = models.FloatField(default=75.0, help_text="Expected efficiency %")
+    ibu_model = models.CharField(
+        max_length=20, choices=hop_utilization.model_choices(), default='tinseth',
+        help_text="Hop utilization model used for IBU"
+    )
     
     # Calculated values (updated when ingredients change)
     calculated_og = models.FloatField(null=True, blank=True)
@@ -25,6 +52,18 @@ class Recipe(TimeStampedModel):
     calculated_srm = models.FloatField(null=True, blank=True)
     calculated_abv = models.FloatField(null=True, blank=True)
     
+    # Materialized cost (updated when additions or inventory prices change)
+    calculated_cost = models.FloatField(null=True, blank=True)
+    calculated_cost_per_liter = models.FloatField(null=True, blank=True)
+    
+    # Running totals of addition contributions (independent of batch size and
+    # efficiency); additions adjust them by delta when they change
+    total_extract_units = models.FloatField(default=0.0, help_text="Gravity points at 100% efficiency")
+    total_color_units = models.FloatField(default=0.0, help_text="Malt color units (kg x SRM)")
+    total_ibu_units = models.FloatField(default=0.0, help_text="Alpha acid x grams x boil time utilization")
+    total_attenuation = models.FloatField(default=0.0, help_text="Sum of yeast attenuation %")
+    yeast_count = models.IntegerField(default=0)
+    
     # Recipe status
     is_public = models.BooleanField(default=False)
     is_favorite = models.BooleanField(default=False)
@@ -32,6 +71,8 @@ class Recipe(TimeStampedModel):
     # Brewing notes
     notes = models.TextField(blank=True, help_text="General brewing notes")
     
+    objects = RecipeQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
     
@@ -41,69 +82,256 @@ class Recipe(TimeStampedModel):
     def get_absolute_url(self):
         return reverse('recipe_detail', kwargs={'pk': self.pk})
     
+    def save(self, *args, **kwargs):
+        """
+        Full saves of an existing recipe leave the running totals alone: the
+        additions adjust them in the database, so the values held by this
+        instance may be stale.
+        """
+        if (kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+                and not self._state.adding and self.pk is not None):
+            kwargs['update_fields'] = self._field_names(with_totals=False)
+        super().save(*args, **kwargs)
+    
+    def _field_names(self, with_totals=True):
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and (with_totals or field.name not in TOTAL_FIELDS)
+        ]
+    
+    def load_ingredients(self, refresh=False):
+        """
+        Return (grain_additions, hop_additions, yeast_additions) as lists.
+        
+        Uses the additions already prefetched by Recipe.objects.with_ingredients()
+        and otherwise loads them with one query per addition type. Pass
+        refresh=True after additions were changed to drop stale prefetches.
+        """
+        if refresh:
+            prefetched = getattr(self, '_prefetched_objects_cache', {})
+            for lookup in INGREDIENT_LOOKUPS:
+                prefetched.pop(lookup, None)
+        
+        prefetch_related_objects([self], *ingredient_prefetches())
+        return (
+            list(self.grainaddition_set.all()),
+            list(self.hopaddition_set.all()),
+            list(self.yeastaddition_set.all()),
+        )
+    
     def total_grain_weight(self):
         """Calculate total grain weight in kg"""
-        return sum(ingredient.weight for ingredient in self.grainaddition_set.all())
+        grain_additions, _, _ = self.load_ingredients()
+        return sum(ingredient.weight for ingredient in grain_additions)
     
-    def total_cost(self):
-        """Calculate total recipe cost"""
-        grain_cost = sum(addition.cost() for addition in self.grainaddition_set.all())
-        hop_cost = sum(addition.cost() for addition in self.hopaddition_set.all())
-        yeast_cost = sum(addition.cost() for addition in self.yeastaddition_set.all())
-        return grain_cost + hop_cost + yeast_cost
+    def total_cost(self, price_book=None):
+        """Calculate total recipe cost from the brewer's inventory prices"""
+        from .costing import PriceBook
+        if price_book is None:
+            price_book = PriceBook.for_user(self.created_by_id)
+        return price_book.recipe_cost(self)
     
-    def calculate_all_values(self):
-        """Recalculate all recipe values"""
-        # Original Gravity calculation
-        total_points = 0
-        grain_colors = []
+    def update_cost(self, price_book=None):
+        """Recalculate the stored cost fields (does not save)"""
+        self.calculated_cost = self.total_cost(price_book)
+        self.calculated_cost_per_liter = (
+            self.calculated_cost / self.batch_size if self.batch_size > 0 else 0
+        )
+        return self.calculated_cost
+    
+    def derive_stats(self):
+        """Set the calculated values from the running totals (does not save)"""
+        stats = stats_from_totals(
+            self.batch_size, self.efficiency, self.total_extract_units, self.total_color_units,
+            self.total_ibu_units, self.total_attenuation, self.yeast_count, self.ibu_model
+        )
+        for field in CALCULATED_FIELDS:
+            setattr(self, field, float(stats[field]))
+    
+    def refresh_stats(self):
+        """
+        Re-derive calculated values from the running totals stored in the
+        database. Runs in constant time regardless of the number of additions.
+        """
+        self.refresh_from_db(fields=TOTAL_FIELDS + ['calculated_cost'])
+        self.derive_stats()
         
-        for grain_addition in self.grainaddition_set.all():
-            points = BrewingCalculator.calculate_extract_points(
-                grain_addition.weight, 
-                grain_addition.grain.extract_potential,
-                self.efficiency / 100
+        if self.calculated_cost is None:
+            self.update_cost()
+        else:
+            self.calculated_cost_per_liter = (
+                self.calculated_cost / self.batch_size if self.batch_size > 0 else 0
             )
-            total_points += points
-            grain_colors.append((grain_addition.weight, grain_addition.grain.color))
         
-        if total_points > 0:
-            self.calculated_og = 1 + (total_points / self.batch_size / 1000)
-        else:
-            self.calculated_og = 1.000
+        self.save(update_fields=CALCULATED_FIELDS + ['calculated_cost', 'calculated_cost_per_liter'])
+    
+    def calculate_all_values(self):
+        """Recalculate all recipe values from scratch"""
+        grain_additions, hop_additions, yeast_additions = self.load_ingredients(refresh=True)
         
-        # Final Gravity (rough estimate)
-        if self.yeastaddition_set.exists():
-            avg_attenuation = sum(y.yeast.attenuation for y in self.yeastaddition_set.all()) / self.yeastaddition_set.count()
-            self.calculated_fg = self.calculated_og - ((self.calculated_og - 1) * avg_attenuation / 100)
-        else:
-            self.calculated_fg = self.calculated_og - 0.010  # Default attenuation
+        # Refresh every addition's stored contribution (ingredients may have changed)
+        for additions in (grain_additions, hop_additions, yeast_additions):
+            changed = [addition for addition in additions if addition.refresh_contribution()]
+            if changed:
+                type(changed[0]).objects.bulk_update(changed, changed[0].CONTRIBUTION_FIELDS)
         
-        # ABV calculation
-        self.calculated_abv = BrewingCalculator.calculate_abv(self.calculated_og, self.calculated_fg)
+        # Rebuild the running totals
+        self.total_extract_units = sum(addition.extract_units for addition in grain_additions)
+        self.total_color_units = sum(addition.color_units for addition in grain_additions)
+        self.total_ibu_units = sum(addition.ibu_units for addition in hop_additions)
+        self.total_attenuation = sum(addition.attenuation for addition in yeast_additions)
+        self.yeast_count = len(yeast_additions)
         
-        # IBU calculation
-        total_ibu = 0
-        for hop_addition in self.hopaddition_set.all():
-            ibu = BrewingCalculator.calculate_ibu_tinseth(
-                hop_addition.hop.alpha_acid,
-                hop_addition.weight * 1000,  # Convert to grams
-                hop_addition.boil_time,
-                self.batch_size,
-                self.calculated_og
-            )
-            total_ibu += ibu
-        self.calculated_ibu = total_ibu
+        # OG, FG, ABV, IBU and SRM
+        self.derive_stats()
         
-        # SRM Color calculation
-        if grain_colors:
-            self.calculated_srm = BrewingCalculator.calculate_srm_color(grain_colors)
-        else:
-            self.calculated_srm = 0
+        # Cost from the brewer's inventory prices
+        self.update_cost()
+        
+        self.save(update_fields=self._field_names() if self.pk else None)
+
+class RecipeAddition(TimeStampedModel):
+    """
+    Base class for recipe additions.
+    
+    Each addition stores its own contribution to the recipe's running totals.
+    Saving or deleting a single addition adjusts the recipe totals (and the
+    stored cost) by the difference, so the recipe can be refreshed with
+    Recipe.refresh_stats() instead of a full recalculation.
+    """
+    # Addition contribution field -> Recipe total field
+    CONTRIBUTION_FIELDS = {}
+    # Recipe counter adjusted when an addition is created or deleted
+    COUNT_FIELD = None
+    INGREDIENT_TYPE = None
+    QUANTITY_FIELD = 'weight'
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_cost_key = instance._cost_key()
+        return instance
+    
+    def _cost_key(self):
+        """(ingredient_id, quantity) used to price this addition"""
+        return (
+            self.__dict__.get(f'{self.INGREDIENT_TYPE}_id'),
+            self.__dict__.get(self.QUANTITY_FIELD),
+        )
+    
+    def contribution(self):
+        """Contribution of this addition to the recipe totals, by addition field"""
+        raise NotImplementedError
+    
+    def refresh_contribution(self):
+        """Store the current contribution on the instance; return True if it changed"""
+        changed = False
+        for field, value in self.contribution().items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        return changed
+    
+    def save(self, *args, **kwargs):
+        """Save and adjust the recipe's running totals by the difference"""
+        is_new = self._state.adding or self.pk is None
+        previous = {
+            field: 0.0 if is_new else getattr(self, field)
+            for field in self.CONTRIBUTION_FIELDS
+        }
+        previous_cost_key = None if is_new else getattr(self, '_loaded_cost_key', False)
+        
+        self.refresh_contribution()
+        super().save(*args, **kwargs)
+        
+        deltas = {
+            self.CONTRIBUTION_FIELDS[field]: getattr(self, field) - previous[field]
+            for field in self.CONTRIBUTION_FIELDS
+        }
+        if is_new and self.COUNT_FIELD:
+            deltas[self.COUNT_FIELD] = 1
+        
+        current_cost_key = self._cost_key()
+        self._apply_to_recipe(deltas, previous_cost_key, current_cost_key)
+        self._loaded_cost_key = current_cost_key
+    
+    def delete(self, *args, **kwargs):
+        """Delete and remove this addition's contribution from the recipe totals"""
+        deltas = {
+            total_field: -getattr(self, field)
+            for field, total_field in self.CONTRIBUTION_FIELDS.items()
+        }
+        if self.COUNT_FIELD:
+            deltas[self.COUNT_FIELD] = -1
+        previous_cost_key = getattr(self, '_loaded_cost_key', self._cost_key())
+        
+        result = super().delete(*args, **kwargs)
+        self._apply_to_recipe(deltas, previous_cost_key, None)
+        return result
+    
+    def _apply_to_recipe(self, deltas, previous_cost_key, current_cost_key):
+        """
+        Add the total deltas and the cost difference to the recipe row. When
+        the previous state is unknown the stored cost is cleared, so the next
+        Recipe.refresh_stats() reprices the recipe.
+        """
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        
+        if previous_cost_key is False:
+            updates['calculated_cost'] = None
+        elif previous_cost_key != current_cost_key:
+            cost_delta = self._cost_delta(previous_cost_key, current_cost_key)
+            if cost_delta:
+                updates['calculated_cost'] = Coalesce(F('calculated_cost'), 0.0) + cost_delta
         
-        self.save()
+        if updates:
+            Recipe.objects.filter(pk=self.recipe_id).update(**updates)
+    
+    def _cost_delta(self, previous_cost_key, current_cost_key):
+        """Cost difference between two (ingredient_id, quantity) states"""
+        from .costing import PriceBook
+        cost_keys = [key for key in (previous_cost_key, current_cost_key) if key and key[0] is not None]
+        if not cost_keys:
+            return 0.0
+        
+        price_book = PriceBook.for_user(
+            self.recipe.created_by_id,
+            ingredient_type=self.INGREDIENT_TYPE,
+            ingredient_ids={ingredient_id for ingredient_id, _ in cost_keys}
+        )
+        
+        def cost(cost_key):
+            if not cost_key or cost_key[0] is None:
+                return 0.0
+            ingredient_id, quantity = cost_key
+            return (quantity or 0) * price_book.price(self.INGREDIENT_TYPE, ingredient_id)
+        
+        return cost(current_cost_key) - cost(previous_cost_key)
+
+class CatalogIngredient(TimeStampedModel):
+    """
+    Base class for catalog ingredients. Changes mark the in-memory
+    ingredient name index stale.
+    """
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        from .ingredient_index import bump_catalog_version
+        super().save(*args, **kwargs)
+        bump_catalog_version()
+    
+    def delete(self, *args, **kwargs):
+        from .ingredient_index import bump_catalog_version
+        result = super().delete(*args, **kwargs)
+        bump_catalog_version()
+        return result
 
-class Grain(TimeStampedModel):
+class Grain(CatalogIngredient):
     """
     Grain/Malt ingredients
     """
@@ -127,7 +355,7 @@ class Grain(TimeStampedModel):
     def __str__(self):
         return f"{self.name} ({self.color} SRM)"
 
-class Hop(TimeStampedModel):
+class Hop(CatalogIngredient):
     """
     Hop ingredients
     """
@@ -148,7 +376,7 @@ class Hop(TimeStampedModel):
     def __str__(self):
         return f"{self.name} ({self.alpha_acid}% AA)"
 
-class Yeast(TimeStampedModel):
+class Yeast(CatalogIngredient):
     """
     Yeast strains
     """
@@ -174,37 +402,52 @@ class Yeast(TimeStampedModel):
     def __str__(self):
         return f"{self.laboratory} {self.strain_number} - {self.name}"
 
-class GrainAddition(TimeStampedModel):
+class GrainAddition(RecipeAddition):
     """
     Grain addition to a recipe
     """
+    CONTRIBUTION_FIELDS = {
+        'extract_units': 'total_extract_units',
+        'color_units': 'total_color_units',
+    }
+    INGREDIENT_TYPE = 'grain'
+    
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     grain = models.ForeignKey(Grain, on_delete=models.CASCADE)
     weight = models.FloatField(help_text="Weight in kg")
     percentage = models.FloatField(blank=True, null=True, help_text="Percentage of grain bill")
     
+    # Contribution to the recipe totals
+    extract_units = models.FloatField(default=0.0, editable=False)
+    color_units = models.FloatField(default=0.0, editable=False)
+    
     class Meta:
         ordering = ['-weight']
+        indexes = [models.Index(fields=['grain', 'recipe'])]
     
     def __str__(self):
         return f"{self.weight}kg {self.grain.name}"
     
-    def cost(self):
+    def contribution(self):
+        extract_units, color_units = grain_contribution(
+            self.weight, self.grain.extract_potential, self.grain.color
+        )
+        return {'extract_units': extract_units, 'color_units': color_units}
+    
+    def cost(self, price_book=None):
         """Calculate cost of this grain addition"""
-        try:
-            from inventory.models import InventoryItem
-            inventory_item = InventoryItem.objects.get(
-                ingredient_type='grain',
-                ingredient_id=self.grain.id
-            )
-            return (self.weight * inventory_item.cost_per_kg)
-        except:
-            return 0.0
+        from .costing import PriceBook
+        if price_book is None:
+            price_book = PriceBook.for_user(self.recipe.created_by_id)
+        return self.weight * price_book.price('grain', self.grain_id)
 
-class HopAddition(TimeStampedModel):
+class HopAddition(RecipeAddition):
     """
     Hop addition to a recipe
     """
+    CONTRIBUTION_FIELDS = {'ibu_units': 'total_ibu_units'}
+    INGREDIENT_TYPE = 'hop'
+    
     HOP_USES = [
         ('boil', 'Boil'),
         ('flameout', 'Flameout'),
@@ -218,46 +461,59 @@ class HopAddition(TimeStampedModel):
     boil_time = models.IntegerField(default=0, help_text="Boil time in minutes")
     use = models.CharField(max_length=20, choices=HOP_USES, default='boil')
     
+    # Contribution to the recipe totals
+    ibu_units = models.FloatField(default=0.0, editable=False)
+    
     class Meta:
         ordering = ['-boil_time', '-weight']
+        indexes = [models.Index(fields=['hop', 'recipe'])]
     
     def __str__(self):
         return f"{self.weight*1000}g {self.hop.name} @ {self.boil_time}min"
     
-    def cost(self):
+    def contribution(self):
+        return {'ibu_units': hop_contribution(
+            self.hop.alpha_acid, self.weight, self.boil_time, self.use, self.recipe.ibu_model
+        )}
+    
+    def cost(self, price_book=None):
         """Calculate cost of this hop addition"""
-        try:
-            from inventory.models import InventoryItem
-            inventory_item = InventoryItem.objects.get(
-                ingredient_type='hop',
-                ingredient_id=self.hop.id
-            )
-            return (self.weight * inventory_item.cost_per_kg)
-        except:
-            return 0.0
+        from .costing import PriceBook
+        if price_book is None:
+            price_book = PriceBook.for_user(self.recipe.created_by_id)
+        return self.weight * price_book.price('hop', self.hop_id)
 
-class YeastAddition(TimeStampedModel):
+class YeastAddition(RecipeAddition):
     """
     Yeast addition to a recipe
     """
+    CONTRIBUTION_FIELDS = {'attenuation': 'total_attenuation'}
+    COUNT_FIELD = 'yeast_count'
+    INGREDIENT_TYPE = 'yeast'
+    QUANTITY_FIELD = 'amount'
+    
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     yeast = models.ForeignKey(Yeast, on_delete=models.CASCADE)
     amount = models.FloatField(help_text="Amount (packets/vials)")
     
+    # Contribution to the recipe totals
+    attenuation = models.FloatField(default=0.0, editable=False)
+    
+    class Meta:
+        indexes = [models.Index(fields=['yeast', 'recipe'])]
+    
     def __str__(self):
         return f"{self.amount} x {self.yeast.name}"
     
-    def cost(self):
+    def contribution(self):
+        return {'attenuation': self.yeast.attenuation}
+    
+    def cost(self, price_book=None):
         """Calculate cost of this yeast addition"""
-        try:
-            from inventory.models import InventoryItem
-            inventory_item = InventoryItem.objects.get(
-                ingredient_type='yeast',
-                ingredient_id=self.yeast.id
-            )
-            return (self.amount * inventory_item.cost_per_unit)
-        except:
-            return 0.0
+        from .costing import PriceBook
+        if price_book is None:
+            price_book = PriceBook.for_user(self.recipe.created_by_id)
+        return self.amount * price_book.price('yeast', self.yeast_id)
 
 class RecipeStep(TimeStampedModel):
     """
@@ -283,4 +539,52 @@ class RecipeStep(TimeStampedModel):
         ordering = ['order']
     
     def __str__(self):
-        return f"{self.recipe.name} - Step {self.order}: {self.name}"
\ No newline at end of file
+        return f"{self.recipe.name} - Step {self.order}: {self.name}"
+
+class RecipeGenerationJob(TimeStampedModel):
+    """
+    AI recipe generation request run in the background (see recipes.jobs)
+    """
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    METHODS = [
+        ('openai', 'OpenAI'),
+        ('claude', 'Claude'),
+        ('formulas', 'Brewing formulas'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUSES, default='queued')
+    progress = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])
+    message = models.CharField(max_length=200, blank=True)
+    
+    # Request
+    method = models.CharField(max_length=20, choices=METHODS, default='openai')
+    style_name = models.CharField(max_length=100)
+    batch_size = models.FloatField(validators=[MinValueValidator(1.0)])
+    constraints = models.TextField(blank=True)
+    save_recipe = models.BooleanField(default=False, help_text="Save the generated recipe when done")
+    
+    # Result
+    source = models.CharField(max_length=20, choices=METHODS, blank=True, help_text="Generator that answered")
+    recipe_data = models.JSONField(null=True, blank=True)
+    recipe = models.ForeignKey(Recipe, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+    
+    def __str__(self):
+        return f"{self.style_name} {self.batch_size}L ({self.get_status_display()})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
@@ -0,0 +1,87 @@
+"""
+Recipe statistics from running totals.
+
+Every addition contributes a fixed amount to a handful of per-recipe totals
+that do not depend on batch size or efficiency:
+
+- grains: extract units (gravity points at 100% efficiency) and color units (MCU)
+- hops: IBU units (alpha acid x grams x boil time utilization of the
+  recipe's hop utilization model, see core.hop_utilization)
+- yeast: attenuation, averaged over the number of yeast additions
+
+OG/FG/ABV/IBU/SRM are derived from those totals, so a recipe can be updated
+in constant time when one addition changes. The functions accept scalars or
+NumPy arrays, which lets the batch engine use the same code.
+"""
+import numpy as np
+from core import calculations, hop_utilization
+from core.models import BrewingCalculator
+
+# Recipe running total fields
+TOTAL_FIELDS = [
+    'total_extract_units',
+    'total_color_units',
+    'total_ibu_units',
+    'total_attenuation',
+    'yeast_count',
+]
+
+# Recipe fields derived from the totals
+CALCULATED_FIELDS = [
+    'calculated_og',
+    'calculated_fg',
+    'calculated_ibu',
+    'calculated_srm',
+    'calculated_abv',
+]
+
+
+def grain_contribution(weight_kg, extract_potential, color):
+    """Return (extract_units, color_units) of a grain addition"""
+    extract_units = BrewingCalculator.calculate_extract_points(weight_kg, extract_potential, 1.0)
+    return extract_units, weight_kg * color
+
+
+def hop_contribution(alpha_acid, weight_kg, boil_time, use='boil', ibu_model='tinseth'):
+    """Return the IBU units of a hop addition (IBU before gravity and volume)"""
+    ibu_units = hop_utilization.ibu_units(alpha_acid, weight_kg * 1000, boil_time, use, ibu_model)
+    return ibu_units.item() if np.ndim(ibu_units) == 0 else ibu_units
+
+
+def stats_from_totals(batch_size, efficiency, extract_units, color_units,
+                      ibu_units, attenuation, yeast_count, ibu_model='tinseth'):
+    """
+    Derive OG, FG, ABV, IBU and SRM from running totals.
+
+    ibu_model is the name of a hop utilization model, or an array of names
+    for many recipes. Returns a dict keyed by the Recipe fields in
+    CALCULATED_FIELDS. With scalar inputs the values are 0-d arrays; wrap them
+    in float() before saving.
+    """
+    batch_size = np.asarray(batch_size, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Original Gravity
+        total_points = np.asarray(extract_units, dtype=float) * (np.asarray(efficiency, dtype=float) / 100)
+        og = np.where(total_points > 0, 1 + (total_points / batch_size / 1000), 1.000)
+
+        # Final Gravity (average yeast attenuation, default 10 points drop)
+        yeast_count = np.asarray(yeast_count)
+        avg_attenuation = np.asarray(attenuation, dtype=float) / np.maximum(yeast_count, 1)
+        fg = np.where(yeast_count > 0, og - ((og - 1) * avg_attenuation / 100), og - 0.010)
+
+        abv = calculations.abv(og, fg)
+
+        # IBU (the recipe's hop utilization model, Tinseth by default)
+        ibu = hop_utilization.ibu_from_units(ibu_units, og, batch_size, ibu_model)
+
+        # SRM color (Morey)
+        srm = calculations.srm_morey(color_units)
+
+    return {
+        'calculated_og': og,
+        'calculated_fg': fg,
+        'calculated_ibu': ibu,
+        'calculated_srm': srm,
+        'calculated_abv': abv,
+    }
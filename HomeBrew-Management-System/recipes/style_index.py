@@ -0,0 +1,165 @@
+"""
+Vectorized style conformance.
+
+StyleIndex keeps the OG/FG/IBU/SRM/ABV ranges of every BeerStyle as two
+NumPy matrices, so a batch of recipes can be checked against all styles at
+once: which styles each recipe fits and how far each stat is outside the
+range. The process-wide index is reloaded when the styles change, which is
+checked with one aggregate query at most every VERSION_CHECK_INTERVAL
+seconds.
+"""
+import threading
+import time
+import numpy as np
+from django.db.models import Count, Max
+from core.models import BeerStyle
+
+VERSION_CHECK_INTERVAL = 30
+
+# Stats compared with the style ranges: (name, recipe field, style min field, style max field)
+STATS = (
+    ('og', 'calculated_og', 'og_min', 'og_max'),
+    ('fg', 'calculated_fg', 'fg_min', 'fg_max'),
+    ('ibu', 'calculated_ibu', 'ibu_min', 'ibu_max'),
+    ('srm', 'calculated_srm', 'srm_min', 'srm_max'),
+    ('abv', 'calculated_abv', 'abv_min', 'abv_max'),
+)
+STAT_NAMES = [name for name, _, _, _ in STATS]
+RECIPE_FIELDS = [field for _, field, _, _ in STATS]
+
+
+def recipe_stats(recipes):
+    """(n, 5) array of the calculated stats of recipes (model instances or dicts); NaN when missing"""
+    rows = []
+    for recipe in recipes:
+        get = recipe.get if isinstance(recipe, dict) else lambda field: getattr(recipe, field)
+        rows.append([np.nan if get(field) is None else get(field) for field in RECIPE_FIELDS])
+    return np.array(rows, dtype=float).reshape(len(rows), len(STATS))
+
+
+class StyleIndex:
+    """Style ranges as (styles, stats) matrices"""
+
+    def __init__(self, styles, version=None):
+        self.version = version
+        self.styles = list(styles)
+        self.ids = np.array([style.pk for style in self.styles], dtype=int)
+        self.positions = {style.pk: position for position, style in enumerate(self.styles)}
+        self.low = np.array([[getattr(style, low) for _, _, low, _ in STATS] for style in self.styles], dtype=float)
+        self.high = np.array([[getattr(style, high) for _, _, _, high in STATS] for style in self.styles], dtype=float)
+        self.low = self.low.reshape(len(self.styles), len(STATS))
+        self.high = self.high.reshape(len(self.styles), len(STATS))
+        self.width = np.maximum(self.high - self.low, 1e-9)
+
+    def deviations(self, stats, style_ids=None):
+        """
+        Signed distance of each stat outside the style range: negative below
+        the minimum, positive above the maximum, 0 inside and NaN for missing
+        stats. stats is (n, 5); the result is (n, styles, 5), or (n, 5) when
+        style_ids gives one style per recipe.
+        """
+        stats = np.asarray(stats, dtype=float)
+        if style_ids is None:
+            values, low, high = stats[:, None, :], self.low[None], self.high[None]
+        else:
+            positions = self.style_positions(style_ids)
+            low, high = self.low[positions], self.high[positions]
+            # Unknown styles compare as missing stats
+            values = np.where((positions < 0)[:, None], np.nan, stats)
+        deviation = np.where(values < low, values - low, np.where(values > high, values - high, 0.0))
+        return np.where(np.isnan(values), np.nan, deviation)
+
+    def style_positions(self, style_ids):
+        return np.array([self.positions.get(style_id, -1) for style_id in style_ids], dtype=int)
+
+    def conformance(self, stats, style_ids=None, ignore_missing=False):
+        """
+        Conformance of recipes with all styles (or with one style each, see
+        deviations). Returns a dict of arrays:
+
+        deviation: signed distance outside the range, per stat
+        relative: deviation as a fraction of the range width
+        fits: every stat within range
+        distance: sum of the absolute relative deviations
+
+        A missing stat makes a recipe not fit at an infinite distance, unless
+        ignore_missing is set, in which case only the known stats are compared.
+        """
+        deviation = self.deviations(stats, style_ids)
+        width = self.width[None] if style_ids is None else self.width[self.style_positions(style_ids)]
+        relative = deviation / width
+        if ignore_missing:
+            missing = np.zeros(deviation.shape[:-1], dtype=bool)
+            deviation = np.nan_to_num(deviation)
+        else:
+            missing = np.isnan(deviation).any(axis=-1)
+        return {
+            'deviation': deviation,
+            'relative': relative,
+            'fits': ~missing & (deviation == 0).all(axis=-1),
+            'distance': np.where(missing, np.inf, np.abs(np.nan_to_num(relative)).sum(axis=-1)),
+        }
+
+    def matching_styles(self, stats, limit=5):
+        """
+        Styles ranked by distance for one set of stats (NaN for unknown stats,
+        which are not compared): [(style, fits, distance, {stat: deviation})],
+        best first.
+        """
+        stats = np.asarray(stats, dtype=float).reshape(1, len(STATS))
+        result = self.conformance(stats, ignore_missing=True)
+        order = np.argsort(result['distance'][0], kind='stable')[:limit]
+        return [
+            (
+                self.styles[position],
+                bool(result['fits'][0, position]),
+                float(result['distance'][0, position]),
+                dict(zip(STAT_NAMES, result['deviation'][0, position].tolist())),
+            )
+            for position in order
+        ]
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None, 'checked_at': 0.0}
+
+
+def _db_version():
+    return tuple(BeerStyle.objects.aggregate(count=Count('pk'), changed=Max('updated_at')).values())
+
+
+def style_index():
+    """The process-wide StyleIndex, reloaded when the styles changed"""
+    with _lock:
+        now = time.monotonic()
+        if _state['index'] is not None and now - _state['checked_at'] < VERSION_CHECK_INTERVAL:
+            return _state['index']
+
+        version = _db_version()
+        _state['checked_at'] = now
+        if _state['index'] is None or version != _state['version']:
+            _state['index'] = StyleIndex(BeerStyle.objects.all(), version)
+            _state['version'] = version
+        return _state['index']
+
+
+def style_badges(recipes):
+    """
+    {recipe id: badge} for recipes against their own style. A badge is a dict
+    with fits and the names of the stats outside the range ('out'); recipes
+    without a style or stats get None.
+    """
+    recipes = list(recipes)
+    if not recipes:
+        return {}
+    index = style_index()
+    result = index.conformance(recipe_stats(recipes), [recipe.style_id for recipe in recipes])
+
+    badges = {}
+    for row, recipe in enumerate(recipes):
+        if not np.isfinite(result['distance'][row]):
+            badges[recipe.pk] = None
+            continue
+        out = [name for name, deviation in zip(STAT_NAMES, result['deviation'][row]) if deviation != 0]
+        badges[recipe.pk] = {'fits': not out, 'out': out}
+    return badges
@@ -1,3 +1,953 @@
-from django.test import TestCase
+import io
+import json
+import math
+import xml.etree.ElementTree as ET
+from unittest import mock
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from core import calculations, hop_utilization
+from core.models import BeerStyle
+from inventory.models import InventoryItem
+from .ai_cache import ResponseCache
+from .ai_generator import AIRecipeGenerator, StubClient
+from .batch import recalculate_recipes
+from .beerxml import import_beerxml, import_grain_type, iter_beerxml
+from .candidates import MAX_CANDIDATES, best_recipe
+from .cloning import clone_recipe, clone_recipes, scale_recipe
+from .costing import PriceBook, price_recipes
+from .forms import RecipeGeneratorForm
+from .grain_bill import GrainCatalog, MAX_CANDIDATE_SETS, optimize_grain_bill
+from .jobs import expire_stale_jobs, run_generation_job
+from . import style_index as style_index_module
+from .style_index import StyleIndex, recipe_stats, style_badges, style_index
+from . import ingredient_index as index_module
+from .ingredient_index import ingredient_index
+from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition, RecipeGenerationJob
+from .stats import CALCULATED_FIELDS, TOTAL_FIELDS, grain_contribution, stats_from_totals
+from .views import build_grain, fit_hop_weights
 
-# Create your tests here.
+
+class RecipeTestData:
+    """Catalog, style and a simple pale ale recipe shared by the recipe tests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('brewer', password='secret')
+        cls.style = BeerStyle.objects.create(
+            name='American Pale Ale', style_code='18B', description='Hoppy pale ale',
+            og_min=1.045, og_max=1.060, fg_min=1.010, fg_max=1.015, ibu_min=30, ibu_max=50,
+            srm_min=5, srm_max=10, abv_min=4.5, abv_max=6.2
+        )
+        cls.pale = Grain.objects.create(name='Pale Ale Malt', grain_type='base', color=3, extract_potential=37)
+        cls.crystal = Grain.objects.create(name='Crystal 40', grain_type='crystal', color=40, extract_potential=34)
+        cls.cascade = Hop.objects.create(name='Cascade', hop_type='aroma', alpha_acid=5.5)
+        cls.magnum = Hop.objects.create(name='Magnum', hop_type='bittering', alpha_acid=12.0)
+        cls.us05 = Yeast.objects.create(
+            name='US-05', laboratory='Fermentis', strain_number='US-05', yeast_type='ale',
+            attenuation=78, temp_range_min=15, temp_range_max=22
+        )
+
+    def make_recipe(self, name='Test Pale Ale', batch_size=20.0):
+        recipe = Recipe.objects.create(
+            name=name, style=self.style, created_by=self.user, batch_size=batch_size, efficiency=75.0
+        )
+        GrainAddition.objects.create(recipe=recipe, grain=self.pale, weight=4.5)
+        GrainAddition.objects.create(recipe=recipe, grain=self.crystal, weight=0.4)
+        HopAddition.objects.create(recipe=recipe, hop=self.magnum, weight=0.02, boil_time=60)
+        HopAddition.objects.create(recipe=recipe, hop=self.cascade, weight=0.03, boil_time=10)
+        YeastAddition.objects.create(recipe=recipe, yeast=self.us05, amount=1)
+        recipe.refresh_stats()
+        recipe.refresh_from_db()
+        return recipe
+
+
+class RecipeScalePreviewTests(RecipeTestData, TestCase):
+    def setUp(self):
+        self.recipe = self.make_recipe()
+        self.client.force_login(self.user)
+        self.url = reverse('recipe_scale_preview', args=[self.recipe.pk])
+
+    def test_preview_matches_saved_scale(self):
+        response = self.client.get(self.url, {'batch_size': '40'})
+        self.assertEqual(response.status_code, 200)
+        preview = response.json()['previews'][0]
+
+        scaled = scale_recipe(self.recipe, 40)
+        scaled.refresh_from_db()
+        self.assertAlmostEqual(preview['og'], scaled.calculated_og, delta=0.0005)
+        self.assertAlmostEqual(preview['ibu'], scaled.calculated_ibu, delta=0.05)
+        self.assertAlmostEqual(preview['srm'], scaled.calculated_srm, delta=0.05)
+
+    def test_preview_does_not_save(self):
+        count = Recipe.objects.count()
+        self.client.get(self.url, {'batch_size': '10,40'})
+        self.assertEqual(Recipe.objects.count(), count)
+
+    def test_rejects_non_finite_batch_sizes(self):
+        for value in ('nan', 'inf', '-inf', 'abc'):
+            response = self.client.get(self.url, {'batch_size': value})
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_rejects_non_positive_batch_sizes(self):
+        response = self.client.get(self.url, {'batch_size': '0'})
+        self.assertEqual(response.status_code, 400)
+
+
+BEERXML_RECIPE = """<?xml version="1.0" encoding="UTF-8"?>
+<RECIPES>
+<RECIPE>
+    <NAME>Imported Stout</NAME>
+    <BATCH_SIZE>20</BATCH_SIZE>
+    <EFFICIENCY>72</EFFICIENCY>
+    <STYLE><NAME>American Pale Ale</NAME><CATEGORY_NUMBER>18</CATEGORY_NUMBER><STYLE_LETTER>B</STYLE_LETTER></STYLE>
+    <FERMENTABLES>
+        <FERMENTABLE><NAME>Maris Otter</NAME><TYPE>Grain</TYPE><AMOUNT>4</AMOUNT><YIELD>81</YIELD><COLOR>3</COLOR></FERMENTABLE>
+        <FERMENTABLE><NAME>Caramunich III</NAME><TYPE>Grain</TYPE><AMOUNT>0.3</AMOUNT><YIELD>72</YIELD><COLOR>57</COLOR></FERMENTABLE>
+        <FERMENTABLE><NAME>Debittered Black</NAME><TYPE>Grain</TYPE><AMOUNT>0.2</AMOUNT><YIELD>65</YIELD><COLOR>550</COLOR></FERMENTABLE>
+        <FERMENTABLE><NAME>Amber Malt</NAME><TYPE>Grain</TYPE><AMOUNT>0.2</AMOUNT><YIELD>75</YIELD><COLOR>22</COLOR></FERMENTABLE>
+        <FERMENTABLE><NAME>Light DME</NAME><TYPE>Dry Extract</TYPE><AMOUNT>0.5</AMOUNT><YIELD>95</YIELD><COLOR>4</COLOR></FERMENTABLE>
+        <FERMENTABLE><NAME>Cane Sugar</NAME><TYPE>Sugar</TYPE><AMOUNT>0.2</AMOUNT><YIELD>100</YIELD><COLOR>0</COLOR></FERMENTABLE>
+    </FERMENTABLES>
+</RECIPE>
+</RECIPES>
+"""
+
+
+class BeerXMLTests(RecipeTestData, TestCase):
+    def setUp(self):
+        index_module._state.update(index=None, local_version=0, checked_at=0.0, db_version=None)
+        index_module._local.uncommitted = False
+
+    def test_export_import_round_trip(self):
+        recipe = self.make_recipe()
+        document = ''.join(iter_beerxml(Recipe.objects.filter(pk=recipe.pk)))
+
+        other = User.objects.create_user('importer', password='secret')
+        result = import_beerxml(io.BytesIO(document.encode('utf-8')), other)
+
+        self.assertEqual(len(result['recipe_ids']), 1)
+        self.assertEqual(result['skipped'], [])
+        self.assertEqual(result['ingredients_created'], {'grains': 0, 'hops': 0, 'yeasts': 0})
+        imported = Recipe.objects.get(pk=result['recipe_ids'][0])
+        self.assertEqual(imported.created_by, other)
+        self.assertEqual(imported.grainaddition_set.count(), 2)
+        self.assertEqual(imported.hopaddition_set.count(), 2)
+        self.assertEqual(imported.yeastaddition_set.count(), 1)
+        self.assertAlmostEqual(imported.calculated_og, recipe.calculated_og, places=3)
+        self.assertAlmostEqual(imported.calculated_ibu, recipe.calculated_ibu, places=1)
+        self.assertAlmostEqual(imported.calculated_srm, recipe.calculated_srm, places=1)
+
+    def test_new_fermentables_get_a_grain_type(self):
+        import_beerxml(io.BytesIO(BEERXML_RECIPE.encode('utf-8')), self.user)
+        types = dict(Grain.objects.values_list('name', 'grain_type'))
+        self.assertEqual(types['Maris Otter'], 'base')
+        self.assertEqual(types['Caramunich III'], 'crystal')
+        self.assertEqual(types['Debittered Black'], 'roasted')
+        self.assertEqual(types['Amber Malt'], 'specialty')
+        self.assertEqual(types['Light DME'], 'adjunct')
+        self.assertEqual(types['Cane Sugar'], 'adjunct')
+
+    def test_import_matches_catalog_names_through_the_index(self):
+        document = BEERXML_RECIPE.replace('Amber Malt', 'Caramel 40L').replace(
+            '</FERMENTABLES>',
+            '</FERMENTABLES><HOPS><HOP><NAME>cascade pellets</NAME><ALPHA>6</ALPHA><AMOUNT>0.02</AMOUNT>'
+            '<USE>Boil</USE><TIME>10</TIME></HOP></HOPS>'
+        )
+        result = import_beerxml(io.BytesIO(document.encode('utf-8')), self.user)
+
+        self.assertEqual(result['ingredients_created'], {'grains': 5, 'hops': 0, 'yeasts': 0})
+        self.assertFalse(Grain.objects.filter(name='Caramel 40L').exists())
+        recipe = Recipe.objects.get(pk=result['recipe_ids'][0])
+        self.assertTrue(recipe.grainaddition_set.filter(grain=self.crystal).exists())
+        self.assertEqual(recipe.hopaddition_set.get().hop, self.cascade)
+
+        # Ingredients created by the first import are matched by the second
+        result = import_beerxml(io.BytesIO(document.encode('utf-8')), self.user)
+        self.assertEqual(result['ingredients_created'], {'grains': 0, 'hops': 0, 'yeasts': 0})
+        self.assertEqual(Grain.objects.filter(name='Maris Otter').count(), 1)
+
+    def test_import_grain_type(self):
+        self.assertEqual(import_grain_type('Grain', 9, 'Munich'), 'base')
+        self.assertEqual(import_grain_type('Grain', 2, 'Carapils'), 'crystal')
+        self.assertEqual(import_grain_type('Adjunct', 1, 'Flaked Oats'), 'adjunct')
+        self.assertEqual(import_grain_type('Grain', 350, 'Pale Chocolate'), 'roasted')
+
+
+class IngredientIndexTests(TransactionTestCase):
+    def setUp(self):
+        index_module._state.update(index=None, local_version=0, checked_at=0.0, db_version=None)
+        index_module._local.uncommitted = False
+        self.crystal = Grain.objects.create(name='Crystal 40', grain_type='crystal', color=40, extract_potential=34)
+
+    def test_fuzzy_match(self):
+        index = ingredient_index()
+        self.assertEqual(index.match('grain', 'caramel 40L'), self.crystal)
+        self.assertIsNone(index.match('grain', 'Crystal 120'))
+
+    def test_created_ingredients_join_index_on_commit(self):
+        with transaction.atomic():
+            grain = ingredient_index().resolve_or_create('grain', ['Golden Promise'], build_grain)['Golden Promise']
+            self.assertIsNone(index_module._state['index'].match('grain', 'Golden Promise'))
+        self.assertEqual(ingredient_index().match('grain', 'Golden Promise'), grain)
+
+    def test_rollback_leaves_no_ingredients_in_index(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                ingredient_index().resolve_or_create('grain', ['Golden Promise'], build_grain)
+                raise RuntimeError
+        self.assertFalse(Grain.objects.filter(name='Golden Promise').exists())
+
+        index = ingredient_index()
+        self.assertIsNone(index.match('grain', 'Golden Promise'))
+        with transaction.atomic():
+            grain = index.resolve_or_create('grain', ['Golden Promise'], build_grain)['Golden Promise']
+        self.assertTrue(Grain.objects.filter(pk=grain.pk).exists())
+
+    def test_failed_ai_save_does_not_break_later_saves(self):
+        user = User.objects.create_user('brewer', password='secret')
+        self.client.force_login(user)
+        payload = json.dumps({
+            'name': 'Golden Ale', 'style_name': 'Golden Ale', 'batch_size': 20,
+            'grain_bill': [{'name': 'Golden Promise', 'weight_kg': 4.5, 'percentage': 100}],
+        })
+        url = reverse('ai_save_recipe')
+
+        with mock.patch('recipes.views.create_recipes', side_effect=RuntimeError('database is locked')):
+            response = self.client.post(url, payload, content_type='application/json')
+        self.assertFalse(response.json()['success'])
+
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertTrue(response.json()['success'], response.json())
+        recipe = Recipe.objects.get(pk=response.json()['recipe_id'])
+        self.assertEqual(recipe.grainaddition_set.get().grain.name, 'Golden Promise')
+
+
+class AISaveRecipesBatchTests(RecipeTestData, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('ai_save_recipes_batch')
+
+    def recipe_payload(self, recipe_name='AI Pale Ale', **grain_fields):
+        return {
+            'name': recipe_name, 'style_name': 'American Pale Ale', 'batch_size': 20,
+            'grain_bill': [dict({'name': 'Pale Ale Malt', 'weight_kg': 4.5, 'percentage': 92}, **grain_fields)],
+            'hop_schedule': [{'name': 'Magnum', 'weight_g': 20, 'boil_time': 60, 'use': 'boil'}],
+            'yeast': {'name': 'US-05', 'amount': '1 packet'},
+        }
+
+    def post(self, payloads):
+        return self.client.post(self.url, json.dumps(payloads), content_type='application/json')
+
+    def test_saves_all_recipes(self):
+        response = self.post([self.recipe_payload('One'), self.recipe_payload('Two')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        recipe = Recipe.objects.get(name='Two')
+        self.assertEqual(recipe.grainaddition_set.get().grain, self.pale)
+        self.assertEqual(recipe.hopaddition_set.get().hop, self.magnum)
+        self.assertEqual(recipe.yeastaddition_set.get().yeast, self.us05)
+        self.assertGreater(recipe.calculated_og, 1.0)
+
+    def test_invalid_field_rejects_batch_with_index(self):
+        for fields in ({'percentage': 'lots'}, {'weight_kg': 'NaN'}, {'weight_kg': -1}, {'name': ['x']}):
+            response = self.post([self.recipe_payload('One'), self.recipe_payload('Two', **fields)])
+            self.assertEqual(response.status_code, 400, fields)
+            self.assertEqual(response.json()['index'], 1)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_invalid_structure_is_rejected(self):
+        for payload in (
+            dict(self.recipe_payload(), grain_bill=['Pale Ale Malt']),
+            dict(self.recipe_payload(), hop_schedule=[{'name': 'Magnum', 'weight_g': 20, 'use': 'mash tun'}]),
+            dict(self.recipe_payload(), yeast={'name': 'US-05', 'amount': 'some'}),
+            dict(self.recipe_payload(), expected_stats=[1.05]),
+            dict(self.recipe_payload(), batch_size='inf'),
+        ):
+            response = self.post([payload])
+            self.assertEqual(response.status_code, 400, payload)
+            self.assertEqual(response.json()['index'], 0)
+
+
+class AIResponseCacheTests(RecipeTestData, TestCase):
+    RECIPE_DATA = {'recipe_name': 'Cached IPA', 'grain_bill': [], 'hop_schedule': []}
+
+    def test_normalized_requests_share_an_entry(self):
+        client = StubClient(self.RECIPE_DATA)
+        generator = AIRecipeGenerator(openai_client=client, cache=ResponseCache())
+        first = generator.generate_recipe_data('openai', 20, 'American Pale Ale', 'no crystal')
+        second = generator.generate_recipe_data('openai', 20.01, '  american   pale ale ', 'No Crystal')
+        self.assertEqual(first, second)
+        self.assertEqual(len(client.prompts), 1)
+        self.assertEqual(generator.cache.stats()['hits'], 1)
+
+    def test_entries_expire(self):
+        now = [0.0]
+        cache = ResponseCache(ttl=10, clock=lambda: now[0])
+        cache.set('key', {'a': 1})
+        self.assertEqual(cache.get('key'), {'a': 1})
+        now[0] = 11
+        self.assertIsNone(cache.get('key'))
+
+    def test_api_errors_are_logged_and_not_cached(self):
+        def fail(prompt):
+            raise RuntimeError('rate limited')
+        client = StubClient(fail)
+        generator = AIRecipeGenerator(openai_client=client, cache=ResponseCache())
+        with self.assertLogs('recipes.ai_generator', 'WARNING') as logs:
+            self.assertIsNone(generator.generate_recipe_data('openai', 20, 'American Pale Ale', fallback=False))
+        self.assertIn('rate limited', logs.output[0])
+        self.assertEqual(generator.cache.stats()['size'], 0)
+
+
+class GenerationJobTests(RecipeTestData, TransactionTestCase):
+    def setUp(self):
+        self.setUpTestData()
+
+    def make_job(self, method='formulas', save_recipe=True, **fields):
+        return RecipeGenerationJob.objects.create(
+            user=self.user, batch_size=20, style_name='American Pale Ale', method=method,
+            save_recipe=save_recipe, **fields
+        )
+
+    def generator(self, response=None):
+        return AIRecipeGenerator(openai_client=StubClient(response or {}), cache=ResponseCache())
+
+    def test_formula_job_saves_a_recipe_within_the_style(self):
+        job = self.make_job()
+        run_generation_job(job.pk, generator=self.generator())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(job.source, 'formulas')
+        recipe = job.recipe
+        self.assertTrue(self.style.og_min <= round(recipe.calculated_og, 3) <= self.style.og_max)
+        self.assertLess(sum(addition.weight for addition in recipe.grainaddition_set.all()), 8)
+        self.assertAlmostEqual(job.recipe_data['expected_og'], recipe.calculated_og, places=3)
+
+    def test_failed_api_falls_back_to_formulas(self):
+        def fail(prompt):
+            raise RuntimeError('service unavailable')
+        job = self.make_job(method='openai', save_recipe=False)
+        with self.assertLogs('recipes.ai_generator', 'WARNING'):
+            run_generation_job(job.pk, generator=self.generator(fail))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(job.source, 'formulas')
+
+    def test_formula_job_fails_without_a_grain_bill(self):
+        Grain.objects.all().delete()
+        job = self.make_job()
+        run_generation_job(job.pk, generator=self.generator())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.recipe)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_orphaned_job_expires(self):
+        job = self.make_job(status='running')
+        RecipeGenerationJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.client.force_login(self.user)
+
+        payload = self.client.get(reverse('ai_generation_job_status', args=[job.pk])).json()
+        self.assertEqual(payload['status'], 'failed')
+        self.assertTrue(payload['error'])
+
+        # The job is never run after it expired
+        run_generation_job(job.pk, generator=self.generator())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_job_expired_during_generation_saves_no_recipe(self):
+        job = self.make_job()
+        generator = self.generator()
+        generate = generator.generate_recipe_data
+
+        def slow_generation(*args, **kwargs):
+            recipe_data = generate(*args, **kwargs)
+            RecipeGenerationJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+            expire_stale_jobs()
+            return recipe_data
+
+        with mock.patch.object(generator, 'generate_recipe_data', side_effect=slow_generation):
+            run_generation_job(job.pk, generator=generator)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.recipe)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_recent_job_does_not_expire(self):
+        job = self.make_job()
+        self.client.force_login(self.user)
+        payload = self.client.get(reverse('ai_generation_job_status', args=[job.pk])).json()
+        self.assertEqual(payload['status'], 'queued')
+
+
+class GrainBillTests(RecipeTestData, TestCase):
+    def large_catalog(self, count=84):
+        colors = {'base': 2, 'specialty': 20, 'crystal': 10, 'roasted': 250, 'adjunct': 1}
+        grains = []
+        for i in range(count):
+            grain_type = list(colors)[i % len(colors)]
+            grains.append(Grain(
+                pk=1000 + i, name=f'Grain {i}', grain_type=grain_type,
+                color=colors[grain_type] + i % 17, extract_potential=30 + i % 8
+            ))
+        return grains
+
+    def test_grain_bill_is_within_the_style(self):
+        grain_bill = optimize_grain_bill([self.pale, self.crystal], self.style, 20)
+        contributions = [grain_contribution(weight, grain.extract_potential, grain.color) for grain, weight, _ in grain_bill]
+        stats = stats_from_totals(
+            20, 75, sum(extract for extract, _ in contributions), sum(color for _, color in contributions), 0, 0, 0
+        )
+        self.assertTrue(self.style.og_min <= stats['calculated_og'] <= self.style.og_max)
+        self.assertTrue(self.style.srm_min <= stats['calculated_srm'] <= self.style.srm_max)
+        self.assertAlmostEqual(sum(percentage for _, _, percentage in grain_bill), 100, delta=0.2)
+
+    def test_same_inputs_give_the_same_grain_bill(self):
+        grains = self.large_catalog()
+        first = optimize_grain_bill(grains, self.style, 20, complexity='complex')
+        second = optimize_grain_bill(grains, self.style, 20, complexity='complex')
+        self.assertEqual(first, second)
+
+    def test_candidate_sets_are_bounded(self):
+        catalog = GrainCatalog(self.large_catalog(200))
+        for complexity in ('simple', 'moderate', 'complex'):
+            sets = catalog.candidate_sets(complexity, 7.5)
+            self.assertLessEqual(sum(len(group) for group in sets), MAX_CANDIDATE_SETS)
+        self.assertIsNotNone(optimize_grain_bill(self.large_catalog(200), self.style, 20, complexity='complex'))
+
+    def test_budget_is_respected(self):
+        price_book = PriceBook({('grain', self.pale.pk): 2.0, ('grain', self.crystal.pk): 5.0})
+        grain_bill = optimize_grain_bill([self.pale, self.crystal], self.style, 20, price_book=price_book, budget=20)
+        cost = sum(weight * price_book.price('grain', grain.pk) for grain, weight, _ in grain_bill)
+        self.assertLessEqual(cost, 20)
+        self.assertIsNone(optimize_grain_bill([self.pale, self.crystal], self.style, 20, price_book=price_book, budget=1))
+
+
+class BestRecipeTests(RecipeTestData, TestCase):
+    def save_best(self, best, ibu_model):
+        recipe = Recipe.objects.create(
+            name='Best Pale Ale', style=self.style, created_by=self.user, batch_size=20.0,
+            efficiency=75.0, ibu_model=ibu_model
+        )
+        for grain, weight, percentage in best['grain_bill']:
+            GrainAddition.objects.create(recipe=recipe, grain=grain, weight=weight, percentage=percentage)
+        for hop, weight, boil_time, use in best['hop_schedule']:
+            HopAddition.objects.create(recipe=recipe, hop=hop, weight=weight, boil_time=boil_time, use=use)
+        YeastAddition.objects.create(recipe=recipe, yeast=best['yeast'], amount=1.0)
+        recipe.refresh_stats()
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_scored_stats_match_the_saved_recipe(self):
+        for ibu_model in ('tinseth', 'rager', 'garetz'):
+            best = best_recipe(
+                self.style, 20.0, [self.pale, self.crystal], [self.cascade, self.magnum], [self.us05],
+                complexity='complex', candidates=50, seed=1, ibu_model=ibu_model
+            )
+            recipe = self.save_best(best, ibu_model)
+            for field, value in best['stats'].items():
+                self.assertAlmostEqual(getattr(recipe, field), value, places=2, msg=f'{ibu_model} {field}')
+
+
+class RecipeGeneratorFormTests(RecipeTestData, TestCase):
+    def form(self, **data):
+        return RecipeGeneratorForm({'style': self.style.pk, 'batch_size': 20, 'complexity': 'moderate', **data})
+
+    def test_candidates_is_optional_and_capped(self):
+        form = self.form()
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(form.cleaned_data['candidates'])
+        self.assertTrue(self.form(candidates=MAX_CANDIDATES).is_valid())
+        self.assertIn('candidates', self.form(candidates=MAX_CANDIDATES + 1).errors)
+
+    def test_post_without_candidates_generates_one_recipe(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('recipe_generator'), {
+            'style': self.style.pk, 'batch_size': 20, 'complexity': 'simple'
+        })
+        recipe = Recipe.objects.get()
+        self.assertRedirects(response, reverse('recipe_detail', args=[recipe.pk]), fetch_redirect_response=False)
+
+
+class RecalculateRecipesTests(RecipeTestData, TestCase):
+    def values(self, recipe):
+        recipe.refresh_from_db()
+        return {field: getattr(recipe, field) for field in TOTAL_FIELDS + CALCULATED_FIELDS}
+
+    def assertValuesEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for field in first:
+            self.assertAlmostEqual(first[field], second[field], places=9, msg=field)
+
+    def test_batch_matches_single_recipe_calculation(self):
+        recipes = [self.make_recipe(f'Pale Ale {i}', batch_size=10.0 + i) for i in range(4)]
+        recipes[1].ibu_model = 'rager'
+        recipes[1].save()
+        HopAddition.objects.create(recipe=recipes[2], hop=self.cascade, weight=0.05, boil_time=0, use='dry_hop')
+        # Ingredient edits that bypass the addition totals
+        Hop.objects.filter(pk=self.magnum.pk).update(alpha_acid=14.0)
+        Grain.objects.filter(pk=self.crystal.pk).update(color=60)
+
+        self.assertEqual(recalculate_recipes(Recipe.objects.filter(pk__in=[r.pk for r in recipes])), 4)
+        batch = [self.values(recipe) for recipe in recipes]
+        for recipe in recipes:
+            recipe.calculate_all_values()
+        for recipe, batch_values in zip(recipes, batch):
+            self.assertValuesEqual(batch_values, self.values(recipe))
+        self.assertNotEqual(batch[0]['calculated_ibu'], batch[1]['calculated_ibu'])
+
+    def test_queries_do_not_grow_with_recipes(self):
+        def queries(count):
+            Recipe.objects.all().delete()
+            for i in range(count):
+                self.make_recipe(f'Pale Ale {i}')
+            with CaptureQueriesContext(connection) as context:
+                recalculate_recipes()
+            return len(context.captured_queries)
+
+        self.assertEqual(queries(2), queries(8))
+
+    def test_recipes_without_batch_size_are_skipped(self):
+        recipe = self.make_recipe()
+        Recipe.objects.filter(pk=recipe.pk).update(batch_size=0)
+        self.assertEqual(recalculate_recipes(), 0)
+
+
+class IngredientLoadingTests(RecipeTestData, TestCase):
+    def test_prefetched_ingredients_need_no_queries(self):
+        recipe = Recipe.objects.with_ingredients().get(pk=self.make_recipe().pk)
+        with self.assertNumQueries(0):
+            grains, hops, yeasts = recipe.load_ingredients()
+            names = [addition.grain.name for addition in grains] + [addition.hop.name for addition in hops]
+            self.assertEqual(yeasts[0].yeast, self.us05)
+            self.assertAlmostEqual(recipe.total_grain_weight(), 4.9)
+        self.assertEqual(len(names), 4)
+
+    def test_detail_queries_do_not_grow_with_additions(self):
+        recipe = self.make_recipe()
+        self.client.login(username='brewer', password='secret')
+
+        def queries():
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(reverse('recipe_detail', args=[recipe.pk])).status_code, 200)
+            return len(context.captured_queries)
+
+        before = queries()
+        for boil_time in (30, 20, 5):
+            HopAddition.objects.create(recipe=recipe, hop=self.cascade, weight=0.01, boil_time=boil_time)
+        GrainAddition.objects.create(recipe=recipe, grain=self.crystal, weight=0.2)
+        self.assertEqual(queries(), before)
+
+
+class RecipeCostTests(RecipeTestData, TestCase):
+    def stock(self, user, ingredient, ingredient_type, **prices):
+        return InventoryItem.objects.create(
+            user=user, ingredient_type=ingredient_type, ingredient_id=ingredient.pk,
+            ingredient_name=ingredient.name, current_stock=10, **prices
+        )
+
+    def test_price_book_prices_by_type(self):
+        self.stock(self.user, self.pale, 'grain', cost_per_kg=2.5)
+        self.stock(self.user, self.us05, 'yeast', cost_per_unit=4, cost_per_kg=99)
+        self.stock(User.objects.create_user('other'), self.crystal, 'grain', cost_per_kg=5)
+        price_book = PriceBook.for_user(self.user)
+        self.assertEqual(price_book.price('grain', self.pale.pk), 2.5)
+        self.assertEqual(price_book.price('yeast', self.us05.pk), 4.0)
+        self.assertEqual(price_book.price('grain', self.crystal.pk), 0.0)
+
+    def test_bulk_prices_match_single_recipes(self):
+        self.stock(self.user, self.pale, 'grain', cost_per_kg=2.5)
+        self.stock(self.user, self.crystal, 'grain', cost_per_kg=4)
+        self.stock(self.user, self.magnum, 'hop', cost_per_kg=60)
+        self.stock(self.user, self.us05, 'yeast', cost_per_unit=4)
+        recipes = [self.make_recipe(f'Pale Ale {i}', batch_size=10.0 + i) for i in range(3)]
+        HopAddition.objects.create(recipe=recipes[1], hop=self.magnum, weight=0.01, boil_time=30)
+
+        costs = price_recipes(recipes)
+        for recipe in recipes:
+            self.assertAlmostEqual(costs[recipe.pk], recipe.total_cost())
+        self.assertAlmostEqual(costs[recipes[0].pk], 4.5 * 2.5 + 0.4 * 4 + 0.02 * 60 + 4)
+
+    def stored_cost(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.calculated_cost
+
+    def test_stored_cost_follows_price_changes(self):
+        item = self.stock(self.user, self.pale, 'grain', cost_per_kg=2)
+        recipe = self.make_recipe()
+        other = User.objects.create_user('other')
+        other_recipe = Recipe.objects.create(name='Other', style=self.style, created_by=other, batch_size=20)
+        GrainAddition.objects.create(recipe=other_recipe, grain=self.pale, weight=5)
+        self.assertAlmostEqual(self.stored_cost(recipe), 9.0)
+
+        item.cost_per_kg = 3
+        item.save()
+        self.assertAlmostEqual(self.stored_cost(recipe), 13.5)
+        self.assertAlmostEqual(recipe.calculated_cost_per_liter, 13.5 / 20)
+        self.assertFalse(self.stored_cost(other_recipe))
+
+        item.current_stock = 1
+        item.save()
+        self.assertAlmostEqual(self.stored_cost(recipe), 13.5)
+
+        item.delete()
+        self.assertAlmostEqual(self.stored_cost(recipe), 0.0)
+
+    def test_stored_cost_follows_ingredient_changes(self):
+        item = self.stock(self.user, self.pale, 'grain', cost_per_kg=2)
+        pale_recipe = self.make_recipe()
+        crystal_recipe = Recipe.objects.create(name='Crystal', style=self.style, created_by=self.user, batch_size=20)
+        GrainAddition.objects.create(recipe=crystal_recipe, grain=self.crystal, weight=1)
+        crystal_recipe.refresh_stats()
+        self.assertAlmostEqual(self.stored_cost(pale_recipe), 9.0)
+        self.assertFalse(self.stored_cost(crystal_recipe))
+
+        item = InventoryItem.objects.get(pk=item.pk)
+        item.ingredient_id = self.crystal.pk
+        item.ingredient_name = self.crystal.name
+        item.save()
+        self.assertAlmostEqual(self.stored_cost(pale_recipe), 0.4 * 2)
+        self.assertAlmostEqual(self.stored_cost(crystal_recipe), 2.0)
+
+    def test_addition_changes_adjust_the_stored_cost(self):
+        self.stock(self.user, self.pale, 'grain', cost_per_kg=2)
+        self.stock(self.user, self.crystal, 'grain', cost_per_kg=4)
+        recipe = self.make_recipe()
+        addition = recipe.grainaddition_set.get(grain=self.pale)
+        addition.weight = 5
+        addition.save()
+        self.assertAlmostEqual(self.stored_cost(recipe), 5 * 2 + 0.4 * 4)
+
+        addition.grain = self.crystal
+        addition.save()
+        self.assertAlmostEqual(self.stored_cost(recipe), 5.4 * 4)
+
+        addition.delete()
+        self.assertAlmostEqual(self.stored_cost(recipe), 0.4 * 4)
+        self.assertAlmostEqual(self.stored_cost(recipe), recipe.total_cost())
+
+
+class IncrementalStatsTests(RecipeTestData, TestCase):
+    def assertMatchesRecalculation(self, recipe, step):
+        """Stats derived from the running totals equal a recalculation from the additions"""
+        recipe.refresh_stats()
+        recipe.refresh_from_db()
+        incremental = {field: getattr(recipe, field) for field in TOTAL_FIELDS + CALCULATED_FIELDS}
+        recipe.calculate_all_values()
+        recipe.refresh_from_db()
+        for field, value in incremental.items():
+            self.assertAlmostEqual(value, getattr(recipe, field), places=9, msg=f'{step}: {field}')
+
+    def test_addition_edits_match_a_full_recalculation(self):
+        recipe = self.make_recipe()
+        grain = recipe.grainaddition_set.get(grain=self.pale)
+        hop = recipe.hopaddition_set.get(hop=self.cascade)
+
+        grain.weight = 5.2
+        grain.save()
+        self.assertMatchesRecalculation(recipe, 'grain weight')
+        hop.boil_time = 25
+        hop.save()
+        self.assertMatchesRecalculation(recipe, 'boil time')
+        hop.hop = self.magnum
+        hop.save()
+        self.assertMatchesRecalculation(recipe, 'hop variety')
+        hop.use = 'whirlpool'
+        hop.save()
+        self.assertMatchesRecalculation(recipe, 'hop use')
+        s04 = Yeast.objects.create(
+            name='S-04', laboratory='Fermentis', strain_number='S-04', yeast_type='ale',
+            attenuation=72, temp_range_min=15, temp_range_max=20
+        )
+        YeastAddition.objects.create(recipe=recipe, yeast=s04, amount=1)
+        self.assertMatchesRecalculation(recipe, 'second yeast')
+        grain.delete()
+        self.assertMatchesRecalculation(recipe, 'grain deleted')
+        recipe.yeastaddition_set.get(yeast=self.us05).delete()
+        self.assertMatchesRecalculation(recipe, 'yeast deleted')
+        self.assertEqual(recipe.yeast_count, 1)
+
+    def test_refresh_stats_does_not_load_additions(self):
+        recipe = self.make_recipe()
+        for boil_time in range(5, 50, 5):
+            HopAddition.objects.create(recipe=recipe, hop=self.cascade, weight=0.01, boil_time=boil_time)
+        with self.assertNumQueries(2):
+            recipe.refresh_stats()
+
+
+class CloningTests(RecipeTestData, TestCase):
+    def snapshot(self, recipe):
+        recipe.refresh_from_db()
+        return {field: getattr(recipe, field) for field in TOTAL_FIELDS + CALCULATED_FIELDS + ['calculated_cost']}
+
+    def test_clone_copies_additions_and_stats(self):
+        source = self.make_recipe()
+        clone = clone_recipe(source)
+        self.assertEqual(clone.name, 'Test Pale Ale (Copy)')
+        self.assertEqual(
+            sorted(clone.grainaddition_set.values_list('grain_id', 'weight')),
+            sorted(source.grainaddition_set.values_list('grain_id', 'weight'))
+        )
+        self.assertEqual(clone.hopaddition_set.count(), 2)
+        copied = self.snapshot(clone)
+        clone.calculate_all_values()
+        for field, value in self.snapshot(clone).items():
+            self.assertAlmostEqual(copied[field], value, places=9, msg=field)
+
+    def test_clones_for_another_brewer_use_their_prices(self):
+        source = self.make_recipe()
+        other = User.objects.create_user('other')
+        InventoryItem.objects.create(
+            user=other, ingredient_type='grain', ingredient_id=self.pale.pk, ingredient_name='Pale', cost_per_kg=2
+        )
+        clones = clone_recipes([source], created_by=other, copies=3, name_format='{name} #{copy}')
+        self.assertEqual([clone.name for clone in clones], [f'Test Pale Ale #{n}' for n in (1, 2, 3)])
+        self.assertTrue(all(clone.created_by_id == other.pk for clone in clones))
+        self.assertAlmostEqual(self.snapshot(clones[0])['calculated_cost'], 9.0)
+
+    def test_clone_queries_do_not_grow_with_recipes(self):
+        def queries(count):
+            sources = [self.make_recipe(f'Pale Ale {i}') for i in range(count)]
+            with CaptureQueriesContext(connection) as context:
+                clone_recipes(sources)
+            return len(context.captured_queries)
+
+        self.assertEqual(queries(2), queries(6))
+
+    def test_scaled_copy_matches_a_recalculation(self):
+        source = self.make_recipe(batch_size=20.0)
+        scaled = scale_recipe(source, 30.0)
+        self.assertEqual(scaled.name, 'Test Pale Ale (30.0L)')
+        self.assertAlmostEqual(scaled.grainaddition_set.get(grain=self.pale).weight, 6.75)
+        self.assertAlmostEqual(scaled.yeastaddition_set.get().amount, 1)
+        copied = self.snapshot(scaled)
+        self.assertAlmostEqual(copied['calculated_og'], source.calculated_og, places=6)
+        scaled.calculate_all_values()
+        for field, value in self.snapshot(scaled).items():
+            self.assertAlmostEqual(copied[field], value, places=9, msg=field)
+
+
+class RecipeScaleTests(RecipeTestData, TestCase):
+    def test_scale_rejects_invalid_batch_sizes(self):
+        recipe = self.make_recipe()
+        self.client.login(username='brewer', password='secret')
+        url = reverse('recipe_scale', args=[recipe.pk])
+
+        for value in ['nan', 'inf', '-inf', '0', '-5', 'twenty', '']:
+            response = self.client.post(url, {'new_batch_size': value})
+            self.assertRedirects(response, url, fetch_redirect_response=False, msg_prefix=value)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+        for value in [math.nan, math.inf, 0, -5]:
+            with self.assertRaises(ValueError):
+                scale_recipe(recipe, value)
+        Recipe.objects.filter(pk=recipe.pk).update(batch_size=0)
+        recipe.refresh_from_db()
+        with self.assertRaises(ValueError):
+            scale_recipe(recipe, 20)
+        self.assertRedirects(self.client.post(url, {'new_batch_size': '20'}), url, fetch_redirect_response=False)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_scale_creates_the_scaled_copy(self):
+        recipe = self.make_recipe()
+        self.client.login(username='brewer', password='secret')
+        response = self.client.post(reverse('recipe_scale', args=[recipe.pk]), {'new_batch_size': '40'})
+        scaled = Recipe.objects.exclude(pk=recipe.pk).get()
+        self.assertRedirects(response, reverse('recipe_detail', args=[scaled.pk]), fetch_redirect_response=False)
+        self.assertEqual(scaled.batch_size, 40)
+
+
+class BeerXMLExportTests(RecipeTestData, TestCase):
+    def test_export_streams_the_filtered_recipes(self):
+        for name in ('Bitter & Twisted', 'Pale <One>', 'Stout'):
+            self.make_recipe(name)
+        other = User.objects.create_user('other')
+        Recipe.objects.create(name='Not Mine', style=self.style, created_by=other, batch_size=20)
+        self.client.login(username='brewer', password='secret')
+
+        response = self.client.get(reverse('recipe_export_beerxml'), {'sort': 'name'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="recipes.xml"')
+        document = ET.fromstring(b''.join(response.streaming_content))
+        self.assertEqual(
+            [recipe.findtext('NAME') for recipe in document.iter('RECIPE')],
+            ['Bitter & Twisted', 'Pale <One>', 'Stout']
+        )
+        self.assertEqual(len(document.find('RECIPE').find('HOPS')), 2)
+
+        response = self.client.get(reverse('recipe_export_beerxml'), {'search': 'stout'})
+        document = ET.fromstring(b''.join(response.streaming_content))
+        self.assertEqual([recipe.findtext('NAME') for recipe in document.iter('RECIPE')], ['Stout'])
+
+    def test_unknown_sort_falls_back_to_newest_first(self):
+        for name in ('First', 'Second'):
+            self.make_recipe(name)
+        self.client.login(username='brewer', password='secret')
+
+        response = self.client.get(reverse('recipe_export_beerxml'), {'sort': 'bogus'})
+        self.assertEqual(response.status_code, 200)
+        document = ET.fromstring(b''.join(response.streaming_content))
+        self.assertEqual([recipe.findtext('NAME') for recipe in document.iter('RECIPE')], ['Second', 'First'])
+
+        response = self.client.get(reverse('recipe_list'), {'sort': 'created_by__password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['sort_by'], '-created_at')
+        response = self.client.get(reverse('recipe_list'), {'sort': '-calculated_cost_per_liter'})
+        self.assertEqual(response.context['sort_by'], '-calculated_cost_per_liter')
+
+    def test_export_queries_grow_per_chunk_not_per_recipe(self):
+        def queries(count):
+            Recipe.objects.all().delete()
+            for i in range(count):
+                self.make_recipe(f'Pale Ale {i}')
+            with CaptureQueriesContext(connection) as context:
+                document = ''.join(iter_beerxml(Recipe.objects.all(), chunk_size=10))
+            self.assertEqual(document.count('<RECIPE>'), count)
+            return len(context.captured_queries)
+
+        self.assertEqual(queries(2), queries(8))
+
+
+class StyleIndexTests(RecipeTestData, TestCase):
+    def setUp(self):
+        style_index_module._state.update(index=None, version=None, checked_at=0.0)
+        self.stout = BeerStyle.objects.create(
+            name='Irish Stout', style_code='15B', description='Dark and dry',
+            og_min=1.036, og_max=1.044, fg_min=1.007, fg_max=1.011, ibu_min=25, ibu_max=45,
+            srm_min=25, srm_max=40, abv_min=4.0, abv_max=4.5
+        )
+
+    def test_conformance_against_every_style(self):
+        index = StyleIndex([self.style, self.stout])
+        stats = [[1.050, 1.012, 40, 7, 5.0], [1.040, 1.009, 55, 30, 4.2], [1.050, None, 40, 7, 5.0]]
+        result = index.conformance(recipe_stats([dict(zip(
+            ['calculated_og', 'calculated_fg', 'calculated_ibu', 'calculated_srm', 'calculated_abv'], row
+        )) for row in stats]))
+
+        self.assertEqual(result['fits'].tolist(), [[True, False], [False, False], [False, False]])
+        self.assertEqual(result['distance'][0, 0], 0)
+        # 10 IBU above the stout's 25-45 range is half its width
+        self.assertAlmostEqual(result['deviation'][1, 1, 2], 10)
+        self.assertAlmostEqual(result['distance'][1, 1], 0.5)
+        self.assertLess(result['deviation'][1, 0, 0], 0)
+        self.assertEqual(result['distance'][2].tolist(), [float('inf'), float('inf')])
+
+        result = index.conformance(recipe_stats([{'calculated_og': 1.050, 'calculated_ibu': 40}]), ignore_missing=True)
+        self.assertEqual(result['fits'].tolist(), [[True, False]])
+
+    def test_matching_styles_ranks_by_distance(self):
+        index = StyleIndex([self.style, self.stout])
+        matches = index.matching_styles([1.041, 1.009, 35, float('nan'), float('nan')])
+        self.assertEqual([style for style, _, _, _ in matches], [self.stout, self.style])
+        style, fits, distance, deviations = matches[0]
+        self.assertTrue(fits)
+        self.assertEqual(distance, 0)
+        self.assertEqual(set(deviations), {'og', 'fg', 'ibu', 'srm', 'abv'})
+        self.assertEqual(len(index.matching_styles([1.041] * 5, limit=1)), 1)
+
+    def test_badges_compare_recipes_with_their_own_style(self):
+        fitting = self.make_recipe('Fits')
+        Recipe.objects.filter(pk=fitting.pk).update(
+            calculated_og=1.052, calculated_fg=1.012, calculated_ibu=40, calculated_srm=7, calculated_abv=5.2
+        )
+        bitter = self.make_recipe('Too Bitter')
+        Recipe.objects.filter(pk=bitter.pk).update(
+            calculated_og=1.052, calculated_fg=1.012, calculated_ibu=80, calculated_srm=7, calculated_abv=5.2
+        )
+        unbrewed = Recipe.objects.create(name='No Stats', style=self.style, created_by=self.user, batch_size=20)
+
+        badges = style_badges(Recipe.objects.all())
+        self.assertEqual(badges[fitting.pk], {'fits': True, 'out': []})
+        self.assertEqual(badges[bitter.pk], {'fits': False, 'out': ['ibu']})
+        self.assertIsNone(badges[unbrewed.pk])
+        self.assertEqual(style_badges([]), {})
+
+    def test_index_reloads_when_styles_change(self):
+        index = style_index()
+        self.assertIs(style_index(), index)
+        self.assertEqual(len(index.styles), 2)
+
+        BeerStyle.objects.create(
+            name='Porter', style_code='20A', description='Brown malty ale',
+            og_min=1.040, og_max=1.052, fg_min=1.008, fg_max=1.014, ibu_min=18, ibu_max=35,
+            srm_min=20, srm_max=30, abv_min=4.0, abv_max=5.4
+        )
+        # Cached until the next version check
+        self.assertIs(style_index(), index)
+        style_index_module._state['checked_at'] = 0.0
+        self.assertEqual(len(style_index().styles), 3)
+
+    def test_style_match_endpoint(self):
+        self.client.login(username='brewer', password='secret')
+        response = self.client.get(reverse('style_match'), {'og': '1.041', 'ibu': '35', 'limit': '1'})
+        self.assertEqual(response.status_code, 200)
+        styles = response.json()['styles']
+        self.assertEqual([style['style_code'] for style in styles], ['15B'])
+        self.assertTrue(styles[0]['fits'])
+
+        response = self.client.get(reverse('style_match'), {'og': 'strong'})
+        self.assertEqual(response.status_code, 400)
+
+        recipe = self.make_recipe()
+        response = self.client.get(reverse('recipe_matching_styles', args=[recipe.pk]))
+        self.assertEqual(response.json()['recipe_id'], recipe.pk)
+        self.assertEqual(len(response.json()['styles']), 2)
+
+
+class FitHopWeightsTests(RecipeTestData, TestCase):
+    def test_bittering_addition_makes_up_the_target(self):
+        bittering = HopAddition(hop=self.magnum, weight=0, boil_time=60)
+        aroma = HopAddition(hop=self.cascade, weight=0.03, boil_time=10)
+        fit_hop_weights([bittering, aroma], 40, 20, 1.050)
+
+        self.assertEqual(aroma.weight, 0.03)
+        ibu = calculations.ibu_tinseth([12.0, 5.5], [bittering.weight * 1000, 30], [60, 10], 20, 1.050).sum()
+        self.assertAlmostEqual(float(ibu), 40, delta=0.2)
+
+    def test_bittering_keeps_half_the_target(self):
+        bittering = HopAddition(hop=self.magnum, weight=0, boil_time=60)
+        aroma = HopAddition(hop=self.cascade, weight=0.5, boil_time=10)
+        fit_hop_weights([bittering, aroma], 40, 20, 1.050)
+
+        ibu = calculations.ibu_tinseth(12.0, bittering.weight * 1000, 60, 20, 1.050)
+        # Weights are rounded to 0.1 g
+        self.assertAlmostEqual(float(ibu), 20, delta=0.2)
+
+
+class IbuModelTests(RecipeTestData, TestCase):
+    def expected_ibu(self, recipe):
+        units = hop_utilization.ibu_units([12.0, 5.5], [20, 30], [60, 10], model=recipe.ibu_model).sum()
+        return float(hop_utilization.ibu_from_units(units, recipe.calculated_og, recipe.batch_size, recipe.ibu_model))
+
+    def test_recipe_ibu_follows_its_model(self):
+        recipe = self.make_recipe()
+        self.assertAlmostEqual(recipe.calculated_ibu, self.expected_ibu(recipe))
+
+        tinseth_ibu = recipe.calculated_ibu
+        for name in ('rager', 'garetz'):
+            recipe.ibu_model = name
+            recipe.save()
+            recipe.calculate_all_values()
+            recipe.refresh_from_db()
+            self.assertAlmostEqual(recipe.calculated_ibu, self.expected_ibu(recipe))
+            self.assertNotAlmostEqual(recipe.calculated_ibu, tinseth_ibu)
+
+    def test_dry_hops_add_no_ibu(self):
+        recipe = self.make_recipe()
+        ibu = recipe.calculated_ibu
+        addition = HopAddition.objects.create(recipe=recipe, hop=self.cascade, weight=0.1, boil_time=0, use='dry_hop')
+        recipe.refresh_stats()
+        recipe.refresh_from_db()
+        self.assertEqual(addition.ibu_units, 0)
+        self.assertAlmostEqual(recipe.calculated_ibu, ibu)
+
+        HopAddition.objects.create(recipe=recipe, hop=self.cascade, weight=0.1, boil_time=20, use='whirlpool')
+        recipe.refresh_stats()
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.calculated_ibu, ibu)
@@ -6,12 +6,21 @@ from . import views
 urlpatterns = [
     path('', views.recipe_list, name='recipe_list'),
     path('create/', views.recipe_create, name='recipe_create'),
+    path('import/beerxml/', views.recipe_import_beerxml, name='recipe_import_beerxml'),
+    path('styles/match/', views.style_match, name='style_match'),
+    path('export/beerxml/', views.recipe_export_beerxml, name='recipe_export_beerxml'),
     path('<int:pk>/', views.recipe_detail, name='recipe_detail'),
     path('<int:pk>/edit/', views.recipe_edit, name='recipe_edit'),
     path('<int:pk>/delete/', views.recipe_delete, name='recipe_delete'),
     path('<int:pk>/clone/', views.recipe_clone, name='recipe_clone'),
     path('<int:pk>/scale/', views.recipe_scale, name='recipe_scale'),
+    path('<int:pk>/export/beerxml/', views.recipe_export_beerxml_single, name='recipe_export_beerxml_single'),
+    path('<int:pk>/styles/', views.recipe_matching_styles, name='recipe_matching_styles'),
+    path('<int:pk>/scale/preview/', views.recipe_scale_preview, name='recipe_scale_preview'),
     path('generator/', views.recipe_generator, name='recipe_generator'),
     path('ai-generator/', views.ai_recipe_generator_django, name='ai_recipe_generator_django'),
+    path('ai-jobs/', views.ai_generation_job_create, name='ai_generation_job_create'),
+    path('ai-jobs/<int:pk>/', views.ai_generation_job_status, name='ai_generation_job_status'),
     path('ai-save/', views.ai_save_recipe, name='ai_save_recipe'),
+    path('ai-save/batch/', views.ai_save_recipes_batch, name='ai_save_recipes_batch'),
 ]
\ No newline at end of file
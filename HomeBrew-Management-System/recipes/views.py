@@ -3,20 +3,48 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q, Avg, Count
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator
+from django.urls import reverse
+from django.utils.text import slugify
 from django.views.decorators.csrf import csrf_exempt
-from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition
+from .models import Recipe, Grain, Hop, Yeast, GrainAddition, HopAddition, YeastAddition, RecipeGenerationJob
+from .costing import PriceBook, inventory_stock
+from .grain_bill import optimize_grain_bill
+from .candidates import best_recipe, BITTERING_TIME, MIN_BITTERING_SHARE
+from .cloning import clone_recipe, scale_recipe
+from .beerxml import iter_beerxml, import_beerxml
+from .ingredient_index import ingredient_index
+from .batch import create_recipes
+from .jobs import submit_generation_job, job_payload, expire_if_stale
+from .stats import CALCULATED_FIELDS
+from .style_index import STAT_NAMES, recipe_stats, style_badges, style_index
 from .forms import (RecipeForm, GrainAdditionFormSet, HopAdditionFormSet, 
-                   YeastAdditionFormSet, RecipeGeneratorForm)
+                   YeastAdditionFormSet, RecipeGeneratorForm, BeerXMLImportForm)
+from core import calculations
 from core.models import BeerStyle
+from core.utils import RecipeScaler
+import logging
+import math
 import random
 import json
+import xml.etree.ElementTree as ET
 
-@login_required
-def recipe_list(request):
-    """List all recipes with search and filtering"""
+logger = logging.getLogger(__name__)
+
+# Orderings accepted in the sort query parameter
+SORT_FIELDS = ['created_at', 'name', 'calculated_cost', 'calculated_cost_per_liter']
+SORT_OPTIONS = {prefix + field for field in SORT_FIELDS for prefix in ('', '-')}
+
+def recipe_sort(request):
+    """sort query parameter if it is a known ordering, newest first otherwise"""
+    sort_by = request.GET.get('sort', '-created_at')
+    return sort_by if sort_by in SORT_OPTIONS else '-created_at'
+
+def filter_recipes(request):
+    """The user's recipes filtered and sorted by the recipe_list query parameters"""
     recipes = Recipe.objects.filter(created_by=request.user)
     
     # Search functionality
@@ -33,15 +61,26 @@ def recipe_list(request):
     if style_filter:
         recipes = recipes.filter(style_id=style_filter)
     
-    # Sorting
-    sort_by = request.GET.get('sort', '-created_at')
-    recipes = recipes.order_by(sort_by)
+    return recipes.order_by(recipe_sort(request))
+
+@login_required
+def recipe_list(request):
+    """List all recipes with search and filtering"""
+    recipes = filter_recipes(request)
+    search_query = request.GET.get('search')
+    style_filter = request.GET.get('style')
+    sort_by = recipe_sort(request)
     
     # Pagination
     paginator = Paginator(recipes, 12)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    # Style conformance badges for the recipes on this page
+    badges = style_badges(page_obj.object_list)
+    for recipe in page_obj.object_list:
+        recipe.style_badge = badges.get(recipe.pk)
+    
     context = {
         'page_obj': page_obj,
         'search_query': search_query,
@@ -52,23 +91,114 @@ def recipe_list(request):
     
     return render(request, 'recipes/recipe_list.html', context)
 
+def match_limit(request):
+    """limit query parameter of the style match endpoints (1-50, default 5)"""
+    try:
+        return max(1, min(int(request.GET.get('limit', 5)), 50))
+    except ValueError:
+        return 5
+
+def style_match_payload(matches):
+    return [
+        {
+            'style_id': style.pk,
+            'style_code': style.style_code,
+            'name': style.name,
+            'fits': fits,
+            'distance': round(distance, 4),
+            'deviations': {stat: round(deviation, 4) for stat, deviation in deviations.items()},
+        }
+        for style, fits, distance, deviations in matches
+    ]
+
+@login_required
+def style_match(request):
+    """
+    Styles ranked by how well the given stats (og, fg, ibu, srm, abv query
+    parameters; any may be left out) fit their ranges
+    """
+    stats = []
+    for stat in STAT_NAMES:
+        value = request.GET.get(stat)
+        try:
+            stats.append(float(value) if value not in (None, '') else float('nan'))
+        except ValueError:
+            return JsonResponse({'error': f'Invalid value for {stat}'}, status=400)
+    limit = match_limit(request)
+    
+    matches = style_index().matching_styles(stats, limit=limit)
+    return JsonResponse({'stats': dict(zip(STAT_NAMES, stats)), 'styles': style_match_payload(matches)})
+
+@login_required
+def recipe_matching_styles(request, pk):
+    """Styles ranked by how well the recipe's calculated stats fit their ranges"""
+    recipe = get_object_or_404(Recipe, pk=pk, created_by=request.user)
+    limit = match_limit(request)
+    
+    matches = style_index().matching_styles(recipe_stats([recipe])[0], limit=limit)
+    return JsonResponse({
+        'recipe_id': recipe.pk,
+        'style_id': recipe.style_id,
+        'styles': style_match_payload(matches),
+    })
+
+@login_required
+def recipe_export_beerxml(request):
+    """Stream the filtered recipe list (or every recipe) as one BeerXML file"""
+    response = StreamingHttpResponse(iter_beerxml(filter_recipes(request)), content_type='application/xml')
+    response['Content-Disposition'] = 'attachment; filename="recipes.xml"'
+    return response
+
+@login_required
+def recipe_export_beerxml_single(request, pk):
+    """Download a single recipe as BeerXML"""
+    recipe = get_object_or_404(Recipe.objects.with_ingredients(), pk=pk, created_by=request.user)
+    filename = slugify(recipe.name) or 'recipe'
+    response = StreamingHttpResponse(iter_beerxml([recipe]), content_type='application/xml')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.xml"'
+    return response
+
+@login_required
+def recipe_import_beerxml(request):
+    """Import recipes from an uploaded BeerXML file"""
+    if request.method == 'POST':
+        form = BeerXMLImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                result = import_beerxml(form.cleaned_data['beerxml_file'], request.user)
+            except ET.ParseError as e:
+                messages.error(request, f'Could not read BeerXML file: {e}')
+            else:
+                messages.success(request, f'Imported {len(result["recipe_ids"])} recipes!')
+                if result['skipped']:
+                    skipped = ', '.join(name for name, _ in result['skipped'][:10])
+                    messages.warning(request, f'Skipped {len(result["skipped"])} recipes: {skipped}')
+                return redirect('recipe_list')
+    else:
+        form = BeerXMLImportForm()
+    
+    return render(request, 'recipes/recipe_import.html', {'form': form})
+
 @login_required
 def recipe_detail(request, pk):
     """Recipe detail view"""
-    recipe = get_object_or_404(Recipe, pk=pk, created_by=request.user)
+    recipe = get_object_or_404(Recipe.objects.with_ingredients(), pk=pk, created_by=request.user)
+    
+    # Get all ingredients (already prefetched)
+    grain_additions, hop_additions, yeast_additions = recipe.load_ingredients()
     
-    # Get all ingredients
-    grain_additions = recipe.grainaddition_set.all()
-    hop_additions = recipe.hopaddition_set.all()
-    yeast_additions = recipe.yeastaddition_set.all()
+    # Cost is stored on the recipe; fill it in if it was never calculated
+    if recipe.calculated_cost is None:
+        recipe.update_cost(PriceBook.for_user(request.user))
+        recipe.save(update_fields=['calculated_cost', 'calculated_cost_per_liter'])
     
     context = {
         'recipe': recipe,
         'grain_additions': grain_additions,
         'hop_additions': hop_additions,
         'yeast_additions': yeast_additions,
-        'total_cost': recipe.total_cost(),
-        'cost_per_liter': recipe.total_cost() / recipe.batch_size if recipe.batch_size > 0 else 0,
+        'total_cost': recipe.calculated_cost,
+        'cost_per_liter': recipe.calculated_cost_per_liter,
     }
     
     return render(request, 'recipes/recipe_detail.html', context)
@@ -97,8 +227,8 @@ def recipe_create(request):
             yeast_formset.instance = recipe
             yeast_formset.save()
             
-            # Calculate recipe values
-            recipe.calculate_all_values()
+            # Derive recipe values from the totals kept up to date by the additions
+            recipe.refresh_stats()
             
             messages.success(request, f'Recipe "{recipe.name}" created successfully!')
             return redirect('recipe_detail', pk=recipe.pk)
@@ -135,8 +265,12 @@ def recipe_edit(request, pk):
             hop_formset.save()
             yeast_formset.save()
             
-            # Recalculate recipe values
-            recipe.calculate_all_values()
+            if 'ibu_model' in form.changed_data:
+                # Every hop addition's IBU units depend on the model
+                recipe.calculate_all_values()
+            else:
+                # Only the changed additions were applied to the totals; re-derive the stats
+                recipe.refresh_stats()
             
             messages.success(request, f'Recipe "{recipe.name}" updated successfully!')
             return redirect('recipe_detail', pk=recipe.pk)
@@ -175,41 +309,8 @@ def recipe_clone(request, pk):
     """Clone an existing recipe"""
     original_recipe = get_object_or_404(Recipe, pk=pk, created_by=request.user)
     
-    # Create a copy of the recipe
-    cloned_recipe = Recipe.objects.get(pk=original_recipe.pk)
-    cloned_recipe.pk = None
-    cloned_recipe.name = f"{original_recipe.name} (Copy)"
-    cloned_recipe.save()
-    
-    # Clone grain additions
-    for grain_addition in original_recipe.grainaddition_set.all():
-        GrainAddition.objects.create(
-            recipe=cloned_recipe,
-            grain=grain_addition.grain,
-            weight=grain_addition.weight,
-            percentage=grain_addition.percentage
-        )
-    
-    # Clone hop additions
-    for hop_addition in original_recipe.hopaddition_set.all():
-        HopAddition.objects.create(
-            recipe=cloned_recipe,
-            hop=hop_addition.hop,
-            weight=hop_addition.weight,
-            boil_time=hop_addition.boil_time,
-            use=hop_addition.use
-        )
-    
-    # Clone yeast additions
-    for yeast_addition in original_recipe.yeastaddition_set.all():
-        YeastAddition.objects.create(
-            recipe=cloned_recipe,
-            yeast=yeast_addition.yeast,
-            amount=yeast_addition.amount
-        )
-    
-    # Recalculate values
-    cloned_recipe.calculate_all_values()
+    # Copy the recipe and its additions with bulk inserts; stats are copied
+    cloned_recipe = clone_recipe(original_recipe)
     
     messages.success(request, f'Recipe cloned successfully as "{cloned_recipe.name}"!')
     return redirect('recipe_detail', pk=cloned_recipe.pk)
@@ -232,15 +333,21 @@ def recipe_generator(request):
     return render(request, 'recipes/recipe_generator.html', {'form': form})
 
 def generate_recipe_from_form(form, user):
-    """Generate a recipe based on form data"""
+    """
+    Generate a recipe based on form data. The grain bill is solved to hit the
+    style's OG and SRM within max_cost; nothing is saved if no grain bill fits.
+    """
     style = form.cleaned_data['style']
     batch_size = form.cleaned_data['batch_size']
     max_cost = form.cleaned_data.get('max_cost')
     complexity = form.cleaned_data['complexity']
     use_inventory_only = form.cleaned_data['use_inventory_only']
+    candidates = form.cleaned_data.get('candidates') or 1
+    
+    price_book = PriceBook.for_user(user)
     
-    # Create base recipe
-    recipe = Recipe.objects.create(
+    # Base recipe (saved together with its additions)
+    recipe = Recipe(
         name=f"Generated {style.name}",
         description=f"Auto-generated recipe for {style.name}",
         style=style,
@@ -249,147 +356,202 @@ def generate_recipe_from_form(form, user):
         created_by=user
     )
     
-    try:
-        # Generate grain bill
-        generate_grain_bill(recipe, complexity, use_inventory_only, max_cost)
-        
-        # Generate hop schedule
-        generate_hop_schedule(recipe, complexity, use_inventory_only, max_cost)
-        
-        # Generate yeast selection
-        generate_yeast_selection(recipe, use_inventory_only)
+    if candidates > 1:
+        # Best of N: evaluate many candidates, save only the winner
+        additions = generate_best_candidate(recipe, complexity, use_inventory_only, max_cost, price_book, candidates)
+        if additions is None:
+            return None
+    else:
+        # Generate yeast selection and hop schedule; hops are budgeted at the
+        # style's highest OG, which needs the most bittering hops
+        yeast_additions = generate_yeast_selection(recipe, use_inventory_only)
+        target_ibu = random.uniform(style.ibu_min, style.ibu_max)
+        hop_additions = generate_hop_schedule(
+            recipe, complexity, use_inventory_only, max_cost, target_ibu, og=style.og_max
+        )
         
-        # Calculate final values
-        recipe.calculate_all_values()
+        # Generate grain bill with what is left of the budget
+        grain_budget = None
+        if max_cost is not None:
+            grain_budget = max_cost - sum(addition.cost(price_book) for addition in yeast_additions + hop_additions)
+        grain_additions = generate_grain_bill(recipe, complexity, use_inventory_only, grain_budget, price_book)
+        if grain_additions is None:
+            return None
         
-        return recipe
+        # Bittering for the OG of the grain bill
+        fit_hop_weights(hop_additions, target_ibu, batch_size, grain_bill_og(recipe, grain_additions))
+        additions = grain_additions + hop_additions + yeast_additions
     
-    except Exception as e:
-        recipe.delete()
-        return None
+    with transaction.atomic():
+        create_recipes([(recipe, additions)], {user.pk: price_book})
+    return recipe
 
-def generate_grain_bill(recipe, complexity, use_inventory_only, max_cost):
-    """Generate grain bill for recipe"""
-    style = recipe.style
+def generate_best_candidate(recipe, complexity, use_inventory_only, max_cost, price_book, candidates):
+    """
+    Build `candidates` recipes for the style (see recipes.candidates) and
+    return the unsaved additions of the best one, or None if none fits.
+    """
+    grain_stock = inventory_stock(recipe.created_by, 'grain') if use_inventory_only else None
+    grains = Grain.objects.filter(pk__in=grain_stock) if grain_stock is not None else Grain.objects.all()
     
-    # Get available grains
     if use_inventory_only:
-        # TODO: Filter by inventory
-        available_grains = Grain.objects.filter(grain_type='base')
+        hops = Hop.objects.filter(pk__in=inventory_stock(recipe.created_by, 'hop'))
+        yeasts = Yeast.objects.filter(pk__in=inventory_stock(recipe.created_by, 'yeast'))
     else:
-        available_grains = Grain.objects.all()
+        hops, yeasts = Hop.objects.all(), Yeast.objects.all()
     
-    # Base malt (70-85% of grain bill)
-    base_malts = available_grains.filter(grain_type='base')
-    if base_malts.exists():
-        base_malt = random.choice(base_malts)
-        base_percentage = random.uniform(70, 85)
-        
-        # Calculate base malt weight to hit target OG
-        target_og = random.uniform(style.og_min, style.og_max)
-        total_points_needed = (target_og - 1) * recipe.batch_size * 1000
-        base_points = total_points_needed * (base_percentage / 100)
-        base_weight = base_points / (base_malt.extract_potential * 0.75)  # 75% efficiency
-        
-        GrainAddition.objects.create(
-            recipe=recipe,
-            grain=base_malt,
-            weight=base_weight / 2.2,  # Convert to kg
-            percentage=base_percentage
-        )
+    # Same yeast types as generate_yeast_selection
+    style_name = recipe.style.name.lower()
+    if 'lager' in style_name:
+        yeasts = yeasts.filter(yeast_type='lager')
+    elif 'wheat' in style_name:
+        yeasts = yeasts.filter(yeast_type__in=['wheat', 'ale'])
+    else:
+        yeasts = yeasts.filter(yeast_type='ale')
     
-    # Add specialty malts based on complexity
-    if complexity in ['moderate', 'complex']:
-        specialty_count = 2 if complexity == 'moderate' else random.randint(3, 5)
-        specialty_grains = available_grains.exclude(grain_type='base')
-        
-        remaining_percentage = 100 - base_percentage
-        for i in range(min(specialty_count, specialty_grains.count())):
-            if remaining_percentage <= 0:
-                break
-                
-            specialty_grain = random.choice(specialty_grains)
-            specialty_percentage = min(random.uniform(2, 10), remaining_percentage)
-            specialty_weight = (base_weight * specialty_percentage) / base_percentage
-            
-            GrainAddition.objects.create(
-                recipe=recipe,
-                grain=specialty_grain,
-                weight=specialty_weight / 2.2,  # Convert to kg
-                percentage=specialty_percentage
-            )
-            
-            remaining_percentage -= specialty_percentage
+    best = best_recipe(
+        recipe.style, recipe.batch_size, grains.order_by('pk'), hops.order_by('pk'), yeasts.order_by('pk'),
+        efficiency=recipe.efficiency, complexity=complexity, price_book=price_book,
+        max_cost=max_cost, grain_stock=grain_stock, candidates=candidates, ibu_model=recipe.ibu_model
+    )
+    if best is None:
+        return None
+    
+    recipe.description += f" (best of {best['candidates']} candidates)"
+    additions = [
+        GrainAddition(recipe=recipe, grain=grain, weight=weight, percentage=percentage)
+        for grain, weight, percentage in best['grain_bill']
+    ]
+    additions += [
+        HopAddition(recipe=recipe, hop=hop, weight=weight, boil_time=boil_time, use=use)
+        for hop, weight, boil_time, use in best['hop_schedule']
+    ]
+    if best['yeast']:
+        additions.append(YeastAddition(recipe=recipe, yeast=best['yeast'], amount=1.0))
+    return additions
 
-def generate_hop_schedule(recipe, complexity, use_inventory_only, max_cost):
-    """Generate hop schedule for recipe"""
+def generate_grain_bill(recipe, complexity, use_inventory_only, max_cost, price_book=None):
+    """
+    Solve the grain bill for recipe (see recipes.grain_bill). max_cost is the
+    budget for the grains. Returns unsaved grain additions, or None when no
+    grain bill fits the style, budget and stock.
+    """
+    stock = inventory_stock(recipe.created_by, 'grain') if use_inventory_only else None
+    grains = Grain.objects.filter(pk__in=stock) if stock is not None else Grain.objects.all()
+    
+    grain_bill = optimize_grain_bill(
+        grains.order_by('pk'), recipe.style, recipe.batch_size, recipe.efficiency, complexity,
+        price_book=price_book, budget=max_cost, stock=stock
+    )
+    if grain_bill is None:
+        return None
+    
+    return [
+        GrainAddition(recipe=recipe, grain=grain, weight=weight, percentage=percentage)
+        for grain, weight, percentage in grain_bill
+    ]
+
+def generate_hop_schedule(recipe, complexity, use_inventory_only, max_cost, target_ibu=None, og=None):
+    """
+    Generate hop schedule for recipe; returns unsaved hop additions. The
+    bittering weight is solved for target_ibu (random within the style range
+    by default) at og (the middle of the style's OG range by default).
+    """
     style = recipe.style
+    additions = []
     
     # Get available hops
     if use_inventory_only:
-        # TODO: Filter by inventory
-        available_hops = Hop.objects.all()
+        available_hops = Hop.objects.filter(pk__in=inventory_stock(recipe.created_by, 'hop'))
     else:
         available_hops = Hop.objects.all()
+    available_hops = list(available_hops)
     
     # Target IBU
-    target_ibu = random.uniform(style.ibu_min, style.ibu_max)
-    
-    # Bittering hop (60 min)
-    bittering_hops = available_hops.filter(hop_type__in=['bittering', 'dual'])
-    if bittering_hops.exists():
-        bittering_hop = random.choice(bittering_hops)
-        # Calculate weight needed for ~80% of target IBU
-        bittering_ibu = target_ibu * 0.8
-        bittering_weight = calculate_hop_weight_for_ibu(
-            bittering_ibu, bittering_hop.alpha_acid, 60, recipe.batch_size, 1.050
-        )
-        
-        HopAddition.objects.create(
+    if target_ibu is None:
+        target_ibu = random.uniform(style.ibu_min, style.ibu_max)
+    
+    # Bittering hop (60 min), weight solved below
+    bittering_hops = [hop for hop in available_hops if hop.hop_type in ('bittering', 'dual')]
+    if bittering_hops:
+        additions.append(HopAddition(
             recipe=recipe,
-            hop=bittering_hop,
-            weight=bittering_weight / 1000,  # Convert to kg
-            boil_time=60,
+            hop=random.choice(bittering_hops),
+            weight=0,
+            boil_time=BITTERING_TIME,
             use='boil'
-        )
+        ))
     
     # Flavor/Aroma hops based on complexity
     if complexity in ['moderate', 'complex']:
-        aroma_hops = available_hops.filter(hop_type__in=['aroma', 'dual'])
-        if aroma_hops.exists():
+        aroma_hops = [hop for hop in available_hops if hop.hop_type in ('aroma', 'dual')]
+        if aroma_hops:
             # 15-20 min addition
             flavor_hop = random.choice(aroma_hops)
             flavor_weight = random.uniform(0.015, 0.030)  # 15-30g
             
-            HopAddition.objects.create(
+            additions.append(HopAddition(
                 recipe=recipe,
                 hop=flavor_hop,
                 weight=flavor_weight,
                 boil_time=random.randint(15, 20),
                 use='boil'
-            )
+            ))
             
             # Aroma addition (5 min or flameout)
             if complexity == 'complex':
                 aroma_hop = random.choice(aroma_hops)
                 aroma_weight = random.uniform(0.015, 0.040)  # 15-40g
                 
-                HopAddition.objects.create(
+                additions.append(HopAddition(
                     recipe=recipe,
                     hop=aroma_hop,
                     weight=aroma_weight,
                     boil_time=random.choice([5, 0]),
                     use='boil' if random.choice([True, False]) else 'flameout'
-                )
+                ))
+    
+    if og is None:
+        og = (style.og_min + style.og_max) / 2
+    fit_hop_weights(additions, target_ibu, recipe.batch_size, og)
+    return additions
+
+def fit_hop_weights(hop_additions, target_ibu, batch_size, og):
+    """
+    Set the weight of the bittering (60 minute) additions so the schedule
+    gives target_ibu at og. The later additions keep their weights and count
+    towards the target; bittering keeps at least half of it.
+    """
+    if not hop_additions:
+        return
+    
+    weights = calculations.hop_weights_for_ibu(
+        target_ibu,
+        [addition.hop.alpha_acid for addition in hop_additions],
+        [addition.boil_time for addition in hop_additions],
+        batch_size, og,
+        fixed_grams=[
+            float('nan') if addition.boil_time == BITTERING_TIME else addition.weight * 1000
+            for addition in hop_additions
+        ],
+        min_share=MIN_BITTERING_SHARE
+    )
+    for addition, weight in zip(hop_additions, weights):
+        if addition.boil_time == BITTERING_TIME:
+            addition.weight = round(float(weight) / 1000, 4)  # Convert to kg
+
+def grain_bill_og(recipe, grain_additions):
+    """OG of unsaved grain additions at the recipe's batch size and efficiency"""
+    extract_units = sum(addition.contribution()['extract_units'] for addition in grain_additions)
+    return float(calculations.gravity_from_points(extract_units * recipe.efficiency / 100, recipe.batch_size))
 
 def generate_yeast_selection(recipe, use_inventory_only):
-    """Generate yeast selection for recipe"""
+    """Generate yeast selection for recipe; returns unsaved yeast additions"""
     style = recipe.style
     
     # Get available yeast
     if use_inventory_only:
-        # TODO: Filter by inventory
-        available_yeast = Yeast.objects.all()
+        available_yeast = Yeast.objects.filter(pk__in=inventory_stock(recipe.created_by, 'yeast'))
     else:
         available_yeast = Yeast.objects.all()
     
@@ -401,21 +563,15 @@ def generate_yeast_selection(recipe, use_inventory_only):
     else:
         yeast_candidates = available_yeast.filter(yeast_type='ale')
     
-    if yeast_candidates.exists():
+    yeast_candidates = list(yeast_candidates)
+    if yeast_candidates:
         selected_yeast = random.choice(yeast_candidates)
-        YeastAddition.objects.create(
+        return [YeastAddition(
             recipe=recipe,
             yeast=selected_yeast,
             amount=1.0
-        )
-
-def calculate_hop_weight_for_ibu(target_ibu, alpha_acid, boil_time, batch_size, og):
-    """Calculate hop weight needed for target IBU"""
-    utilization = (1.65 * (0.000125 ** (og - 1))) * \
-                  ((1 - 2.718 ** (-0.04 * boil_time)) / 4.15)
-    
-    weight_grams = (target_ibu * batch_size * 100) / (alpha_acid * utilization * 1000)
-    return weight_grams
+        )]
+    return []
 
 @login_required
 def recipe_scale(request, pk):
@@ -423,50 +579,110 @@ def recipe_scale(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk, created_by=request.user)
     
     if request.method == 'POST':
-        new_batch_size = float(request.POST.get('new_batch_size', recipe.batch_size))
-        scale_factor = new_batch_size / recipe.batch_size
-        
-        # Create scaled recipe
-        scaled_recipe = Recipe.objects.get(pk=recipe.pk)
-        scaled_recipe.pk = None
-        scaled_recipe.name = f"{recipe.name} ({new_batch_size}L)"
-        scaled_recipe.batch_size = new_batch_size
-        scaled_recipe.save()
-        
-        # Scale grain additions
-        for grain_addition in recipe.grainaddition_set.all():
-            GrainAddition.objects.create(
-                recipe=scaled_recipe,
-                grain=grain_addition.grain,
-                weight=grain_addition.weight * scale_factor,
-                percentage=grain_addition.percentage
-            )
-        
-        # Scale hop additions
-        for hop_addition in recipe.hopaddition_set.all():
-            HopAddition.objects.create(
-                recipe=scaled_recipe,
-                hop=hop_addition.hop,
-                weight=hop_addition.weight * scale_factor,
-                boil_time=hop_addition.boil_time,
-                use=hop_addition.use
-            )
-        
-        # Copy yeast additions (usually don't scale linearly)
-        for yeast_addition in recipe.yeastaddition_set.all():
-            YeastAddition.objects.create(
-                recipe=scaled_recipe,
-                yeast=yeast_addition.yeast,
-                amount=yeast_addition.amount
-            )
+        try:
+            new_batch_size = float(request.POST.get('new_batch_size', recipe.batch_size))
+        except ValueError:
+            new_batch_size = math.nan
         
-        scaled_recipe.calculate_all_values()
+        try:
+            # Scaled copy with stats derived from the source recipe's totals
+            scaled_recipe = scale_recipe(recipe, new_batch_size)
+        except ValueError as e:
+            messages.error(request, f'{e}.')
+            return redirect('recipe_scale', pk=recipe.pk)
         
         messages.success(request, f'Recipe scaled to {new_batch_size}L successfully!')
         return redirect('recipe_detail', pk=scaled_recipe.pk)
     
     return render(request, 'recipes/recipe_scale.html', {'recipe': recipe})
 
+MAX_PREVIEW_SIZES = 20
+
+@login_required
+def recipe_scale_preview(request, pk):
+    """
+    JSON preview of the recipe scaled to one or more batch sizes
+    (?batch_size=10&batch_size=40 or ?batch_size=10,40). Nothing is saved;
+    POST to recipe_scale to create the chosen size.
+    """
+    recipe = get_object_or_404(Recipe.objects.with_ingredients(), pk=pk, created_by=request.user)
+    
+    try:
+        batch_sizes = [
+            float(value)
+            for param in request.GET.getlist('batch_size')
+            for value in param.split(',') if value.strip()
+        ]
+    except ValueError:
+        return JsonResponse({'error': 'batch_size must be a number'}, status=400)
+    if not all(math.isfinite(batch_size) for batch_size in batch_sizes):
+        return JsonResponse({'error': 'batch_size must be a number'}, status=400)
+    
+    if not batch_sizes:
+        return JsonResponse({'error': 'At least one batch_size is required'}, status=400)
+    if len(batch_sizes) > MAX_PREVIEW_SIZES:
+        return JsonResponse({'error': f'At most {MAX_PREVIEW_SIZES} batch sizes per request'}, status=400)
+    if min(batch_sizes) <= 0 or recipe.batch_size <= 0:
+        return JsonResponse({'error': 'Batch sizes must be positive'}, status=400)
+    
+    scale_hops = request.GET.get('scale_hops', 'true').lower() != 'false'
+    price_book = PriceBook.for_user(request.user)
+    stats = RecipeScaler.scale_stats(recipe, batch_sizes, scale_hops=scale_hops)
+    
+    previews = []
+    for batch_size, batch_stats in zip(batch_sizes, stats):
+        scaled = RecipeScaler.scale_recipe(recipe, batch_size, scale_hops=scale_hops)
+        grains = [
+            {
+                'name': item['grain'].name,
+                'weight': round(item['weight'], 3),
+                'percentage': item['percentage'],
+                'cost': round(item['weight'] * price_book.price('grain', item['grain'].pk), 2),
+            }
+            for item in scaled['grains']
+        ]
+        hops = [
+            {
+                'name': item['hop'].name,
+                'weight': round(item['weight'], 4),
+                'boil_time': item['boil_time'],
+                'use': item['use'],
+                'cost': round(item['weight'] * price_book.price('hop', item['hop'].pk), 2),
+            }
+            for item in scaled['hops']
+        ]
+        yeast = [
+            {
+                'name': item['yeast'].name,
+                'amount': round(item['amount'], 2),
+                'cost': round(item['amount'] * price_book.price('yeast', item['yeast'].pk), 2),
+            }
+            for item in scaled['yeast']
+        ]
+        total_cost = sum(item['cost'] for item in grains + hops + yeast)
+        
+        previews.append({
+            'batch_size': batch_size,
+            'scale_factor': scaled['scale_factor'],
+            'og': round(batch_stats['calculated_og'], 3),
+            'fg': round(batch_stats['calculated_fg'], 3),
+            'abv': round(batch_stats['calculated_abv'], 1),
+            'ibu': round(batch_stats['calculated_ibu'], 1),
+            'srm': round(batch_stats['calculated_srm'], 1),
+            'total_cost': round(total_cost, 2),
+            'cost_per_liter': round(total_cost / batch_size, 2),
+            'grains': grains,
+            'hops': hops,
+            'yeast': yeast,
+        })
+    
+    return JsonResponse({
+        'recipe_id': recipe.pk,
+        'name': recipe.name,
+        'batch_size': recipe.batch_size,
+        'previews': previews,
+    })
+
 # NEW AI RECIPE GENERATOR VIEWS
 
 @login_required
@@ -474,6 +690,50 @@ def ai_recipe_generator_django(request):
     """Pure Django AI recipe generator view"""
     return render(request, 'recipes/ai_recipe_generator_django.html')
 
+@login_required
+def ai_generation_job_create(request):
+    """
+    Queue an AI recipe generation job. Returns 202 with the job status; poll
+    ai_generation_job_status for the result.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Only POST method allowed'}, status=405)
+    
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+        batch_size = float(data.get('batch_size', 20))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid request data'}, status=400)
+    
+    method = data.get('method', 'openai')
+    if method not in dict(RecipeGenerationJob.METHODS):
+        return JsonResponse({'success': False, 'error': f'Unknown method: {method}'}, status=400)
+    if not 1 <= batch_size <= 1000:
+        return JsonResponse({'success': False, 'error': 'batch_size must be between 1 and 1000 liters'}, status=400)
+    
+    job = submit_generation_job(
+        request.user,
+        batch_size,
+        data.get('style_name') or 'American IPA',
+        constraints=data.get('constraints', ''),
+        method=method,
+        save_recipe=str(data.get('save', '')).lower() in ('1', 'true', 'yes', 'on')
+    )
+    payload = job_payload(job)
+    payload['status_url'] = reverse('ai_generation_job_status', args=[job.pk])
+    return JsonResponse(payload, status=202)
+
+@login_required
+def ai_generation_job_status(request, pk):
+    """
+    Current status of a generation job (poll until status is completed or
+    failed). Jobs that stopped making progress are reported as failed.
+    """
+    job = get_object_or_404(RecipeGenerationJob, pk=pk, user=request.user)
+    return JsonResponse(job_payload(expire_if_stale(job)))
+
+MAX_AI_BATCH_SIZE = 200
+
 @login_required
 @csrf_exempt
 def ai_save_recipe(request):
@@ -488,155 +748,14 @@ def ai_save_recipe(request):
         # Parse JSON data from request
         data = json.loads(request.body)
         
-        # Extract basic recipe data
-        recipe_name = data.get('name', 'AI Generated Recipe')
-        batch_size = float(data.get('batch_size', 20))
-        style_name = data.get('style_name', 'American IPA')
-        constraints = data.get('constraints', '')
-        
-        # Get or create beer style
-        style = None
-        try:
-            # Try to find exact match first
-            style = BeerStyle.objects.get(name__iexact=style_name)
-        except BeerStyle.DoesNotExist:
-            try:
-                # Try partial match
-                style = BeerStyle.objects.filter(name__icontains=style_name).first()
-            except:
-                pass
-        
-        # If no style found, create a default one or use first available
-        if not style:
-            style = BeerStyle.objects.first()
-            if not style:
-                # Create a default style if none exists
-                style = BeerStyle.objects.create(
-                    name=style_name,
-                    style_code='AI',
-                    description=f'AI generated style for {style_name}',
-                    og_min=1.040,
-                    og_max=1.070,
-                    fg_min=1.008,
-                    fg_max=1.020,
-                    ibu_min=20,
-                    ibu_max=60,
-                    srm_min=3,
-                    srm_max=30,
-                    abv_min=4.0,
-                    abv_max=7.0
-                )
-        
-        # Create the recipe
-        recipe = Recipe.objects.create(
-            name=recipe_name,
-            description=f"AI-generated recipe for {style_name}. Constraints: {constraints}",
-            style=style,
-            batch_size=batch_size,
-            efficiency=75.0,  # Default efficiency
-            created_by=request.user,
-            notes=data.get('brewing_instructions', ''),
-            is_public=False
-        )
-        
-        # Set expected calculated values if provided
-        expected_stats = data.get('expected_stats', {})
-        if expected_stats:
-            recipe.calculated_og = expected_stats.get('og')
-            recipe.calculated_fg = expected_stats.get('fg')
-            recipe.calculated_ibu = expected_stats.get('ibu')
-            recipe.calculated_abv = expected_stats.get('abv')
-            recipe.calculated_srm = expected_stats.get('srm')
-        
-        # Add grain additions
-        grain_bill = data.get('grain_bill', [])
-        grains_added = 0
-        for grain_data in grain_bill:
-            grain_name = grain_data.get('name', '')
-            weight_kg = float(grain_data.get('weight_kg', 0))
-            percentage = grain_data.get('percentage', 0)
-            
-            if weight_kg <= 0:
-                continue
-                
-            # Try to find matching grain in database
-            grain = find_or_create_grain(grain_name)
-            
-            if grain:
-                # Create grain addition
-                GrainAddition.objects.create(
-                    recipe=recipe,
-                    grain=grain,
-                    weight=weight_kg,
-                    percentage=percentage
-                )
-                grains_added += 1
-        
-        # Add hop additions
-        hop_schedule = data.get('hop_schedule', [])
-        hops_added = 0
-        for hop_data in hop_schedule:
-            hop_name = hop_data.get('name', '')
-            weight_g = hop_data.get('weight_g', 0)
-            boil_time = hop_data.get('boil_time', 60)
-            use = hop_data.get('use', 'boil')
-            
-            if weight_g <= 0:
-                continue
-            
-            # Convert grams to kg
-            weight_kg = weight_g / 1000.0
-            
-            # Try to find matching hop
-            hop = find_or_create_hop(hop_name)
-            
-            if hop:
-                # Create hop addition
-                HopAddition.objects.create(
-                    recipe=recipe,
-                    hop=hop,
-                    weight=weight_kg,
-                    boil_time=boil_time,
-                    use=use
-                )
-                hops_added += 1
-        
-        # Add yeast
-        yeast_data = data.get('yeast', {})
-        yeast_added = 0
-        if yeast_data:
-            yeast_name = yeast_data.get('name', 'US-05')
-            amount = float(yeast_data.get('amount', '1').split()[0])  # Extract number from "1 packet"
-            
-            # Try to find matching yeast
-            yeast = find_or_create_yeast(yeast_name)
-            
-            if yeast:
-                # Create yeast addition
-                YeastAddition.objects.create(
-                    recipe=recipe,
-                    yeast=yeast,
-                    amount=amount
-                )
-                yeast_added = 1
-        
-        # Save recipe with updated values
-        recipe.save()
-        
-        # Recalculate recipe values if ingredients were added
-        if grains_added > 0 or hops_added > 0:
-            recipe.calculate_all_values()
+        # Everything is written in one transaction
+        recipe, details = save_ai_recipes([data], request.user)[0]
         
         return JsonResponse({
             'success': True,
             'recipe_id': recipe.pk,
             'message': f'Recipe "{recipe.name}" saved successfully!',
-            'details': {
-                'grains_added': grains_added,
-                'hops_added': hops_added,
-                'yeast_added': yeast_added,
-                'recipe_url': f'/recipes/{recipe.pk}/'
-            }
+            'details': details
         })
         
     except json.JSONDecodeError:
@@ -645,147 +764,385 @@ def ai_save_recipe(request):
             'error': 'Invalid JSON data'
         })
     except Exception as e:
-        # Log the error for debugging
-        print(f"Error saving AI recipe: {str(e)}")
+        logger.exception("Error saving AI recipe: %s", e)
         return JsonResponse({
             'success': False,
             'error': f'Error saving recipe: {str(e)}'
         })
 
-# UTILITY FUNCTIONS FOR AI INGREDIENT MATCHING
-
-def find_or_create_grain(grain_name):
-    """Find or create grain based on name"""
-    # Try exact match first
+@login_required
+@csrf_exempt
+def ai_save_recipes_batch(request):
+    """
+    Save many AI-generated recipes in one request. Accepts a JSON array of
+    recipes (or {"recipes": [...]}) in the ai_save_recipe format. All
+    recipes are saved in one transaction, or none if any of them fails.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Only POST method allowed'}, status=405)
+    
     try:
-        return Grain.objects.get(name__iexact=grain_name)
-    except Grain.DoesNotExist:
-        pass
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'}, status=400)
+    
+    payloads = data.get('recipes') if isinstance(data, dict) else data
+    if not isinstance(payloads, list) or not payloads:
+        return JsonResponse({'success': False, 'error': 'Expected a non-empty list of recipes'}, status=400)
+    if len(payloads) > MAX_AI_BATCH_SIZE:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {MAX_AI_BATCH_SIZE} recipes per request'
+        }, status=400)
     
-    # Try partial match
     try:
-        return Grain.objects.filter(name__icontains=grain_name.split()[0]).first()
-    except:
-        pass
+        saved = save_ai_recipes(payloads, request.user)
+    except AIRecipeDataError as e:
+        return JsonResponse({'success': False, 'index': e.index, 'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'count': len(saved),
+        'recipes': [
+            {'recipe_id': recipe.pk, 'name': recipe.name, 'details': details}
+            for recipe, details in saved
+        ]
+    })
+
+class AIRecipeDataError(ValueError):
+    """Invalid recipe in an AI save request; index is its position in the batch"""
     
-    # Create new grain if not found
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+def resolve_style(style_name):
+    """Find the beer style for an AI recipe, creating a default one if the catalog is empty"""
+    # Try to find exact match first
+    style = BeerStyle.objects.filter(name__iexact=style_name).first()
+    if not style:
+        # Try partial match
+        style = BeerStyle.objects.filter(name__icontains=style_name).first()
+    
+    # If no style found, use first available or create a default one
+    if not style:
+        style = BeerStyle.objects.first()
+        if not style:
+            style = BeerStyle.objects.create(
+                name=style_name,
+                style_code='AI',
+                description=f'AI generated style for {style_name}',
+                og_min=1.040,
+                og_max=1.070,
+                fg_min=1.008,
+                fg_max=1.020,
+                ibu_min=20,
+                ibu_max=60,
+                srm_min=3,
+                srm_max=30,
+                abv_min=4.0,
+                abv_max=7.0
+            )
+    return style
+
+AI_HOP_USES = {use for use, _ in HopAddition.HOP_USES}
+
+def _ai_number(value, field, minimum=0.0, integer=False):
+    """A numeric AI recipe field as a finite number of at least minimum"""
+    if isinstance(value, bool):
+        raise ValueError(f'{field} must be a number')
     try:
-        # Determine grain type based on name
-        grain_type = 'base'
-        color = 2
-        extract_potential = 37
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number')
+    if not math.isfinite(number) or number < minimum:
+        raise ValueError(f'{field} must be a number of at least {minimum:g}')
+    return int(round(number)) if integer else number
+
+def _ai_text(value, field, default):
+    """A text AI recipe field; numbers are accepted, other types are not"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f'{field} must be a string')
+    return str(value).strip() or default
+
+def _ai_items(data, key):
+    """A list of objects from an AI recipe field"""
+    items = data.get(key) or []
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f'{key} must be a list of objects')
+    return items
+
+def parse_ai_recipe(data):
+    """
+    Validate one AI recipe payload and convert its numbers. Raises
+    ValueError naming the first invalid field.
+    """
+    grain_bill = []
+    for position, grain_data in enumerate(_ai_items(data, 'grain_bill')):
+        field = f'grain_bill[{position}]'
+        weight_kg = _ai_number(grain_data.get('weight_kg', 0), f'{field}.weight_kg')
+        percentage = grain_data.get('percentage')
+        if percentage is not None:
+            percentage = _ai_number(percentage, f'{field}.percentage')
+            if percentage > 100:
+                raise ValueError(f'{field}.percentage must be at most 100')
+        name = _ai_text(grain_data.get('name'), f'{field}.name', '')
+        if weight_kg > 0:
+            grain_bill.append((name, weight_kg, percentage))
+    
+    hop_schedule = []
+    for position, hop_data in enumerate(_ai_items(data, 'hop_schedule')):
+        field = f'hop_schedule[{position}]'
+        weight_g = _ai_number(hop_data.get('weight_g', 0), f'{field}.weight_g')
+        boil_time = _ai_number(hop_data.get('boil_time', 60), f'{field}.boil_time', integer=True)
+        use = _ai_text(hop_data.get('use'), f'{field}.use', 'boil').lower().replace(' ', '_')
+        if use not in AI_HOP_USES:
+            raise ValueError(f'{field}.use must be one of {", ".join(sorted(AI_HOP_USES))}')
+        name = _ai_text(hop_data.get('name'), f'{field}.name', '')
+        if weight_g > 0:
+            hop_schedule.append((
+                name,
+                weight_g / 1000.0,  # Convert grams to kg
+                boil_time,
+                use
+            ))
+    
+    yeast = None
+    yeast_data = data.get('yeast') or {}
+    if not isinstance(yeast_data, dict):
+        raise ValueError('yeast must be an object')
+    if yeast_data:
+        # Extract number from "1 packet"
+        amount = yeast_data.get('amount', 1)
+        if isinstance(amount, str):
+            amount = (amount.split() or [''])[0]
+        amount = _ai_number(amount, 'yeast.amount')
+        if amount <= 0:
+            raise ValueError('yeast.amount must be positive')
+        yeast = (_ai_text(yeast_data.get('name'), 'yeast.name', 'US-05'), amount)
+    
+    batch_size = _ai_number(data.get('batch_size', 20), 'batch_size')
+    if batch_size <= 0:
+        raise ValueError('batch_size must be positive')
+    
+    expected_stats = data.get('expected_stats') or {}
+    if not isinstance(expected_stats, dict):
+        raise ValueError('expected_stats must be an object')
+    expected_stats = {
+        key: _ai_number(expected_stats[key], f'expected_stats.{key}')
+        for key in ('og', 'fg', 'ibu', 'abv', 'srm') if expected_stats.get(key) is not None
+    }
+    
+    return {
+        'name': _ai_text(data.get('name'), 'name', 'AI Generated Recipe')[:200],
+        'batch_size': batch_size,
+        'style_name': _ai_text(data.get('style_name'), 'style_name', 'American IPA')[:100],
+        'constraints': _ai_text(data.get('constraints'), 'constraints', ''),
+        'notes': _ai_text(data.get('brewing_instructions'), 'brewing_instructions', ''),
+        'expected_stats': expected_stats,
+        'grain_bill': grain_bill,
+        'hop_schedule': hop_schedule,
+        'yeast': yeast,
+    }
+
+def save_ai_recipes(payloads, user):
+    """
+    Save AI-generated recipes in one transaction.
+    
+    The ingredient names of all recipes are resolved through the name index
+    at once, the recipes and their additions are written with
+    batch.create_recipes() (one insert per model) and the stats are derived
+    in memory. Returns [(recipe, details)]. Raises AIRecipeDataError for an
+    invalid payload, in which case nothing is saved.
+    """
+    parsed_recipes = []
+    for position, data in enumerate(payloads):
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('recipe must be an object')
+            parsed_recipes.append(parse_ai_recipe(data))
+        except ValueError as e:
+            raise AIRecipeDataError(position, f'Recipe {position}: {e}')
+    
+    with transaction.atomic():
+        grains, hops, yeasts = resolve_ingredients(
+            [name for parsed in parsed_recipes for name, _, _ in parsed['grain_bill']],
+            [name for parsed in parsed_recipes for name, _, _, _ in parsed['hop_schedule']],
+            [parsed['yeast'][0] for parsed in parsed_recipes if parsed['yeast']]
+        )
         
-        grain_lower = grain_name.lower()
-        if any(word in grain_lower for word in ['crystal', 'caramel']):
-            grain_type = 'crystal'
-            color = 40
-            extract_potential = 34
-        elif any(word in grain_lower for word in ['chocolate', 'roasted', 'black']):
-            grain_type = 'roasted'
-            color = 300
-            extract_potential = 32
-        elif 'munich' in grain_lower:
-            grain_type = 'base'
-            color = 9
-            extract_potential = 37
+        styles = {}
+        rows = []
+        for parsed in parsed_recipes:
+            if parsed['style_name'] not in styles:
+                styles[parsed['style_name']] = resolve_style(parsed['style_name'])
+            
+            recipe = Recipe(
+                name=parsed['name'],
+                description=f"AI-generated recipe for {parsed['style_name']}. Constraints: {parsed['constraints']}",
+                style=styles[parsed['style_name']],
+                batch_size=parsed['batch_size'],
+                efficiency=75.0,  # Default efficiency
+                created_by=user,
+                notes=parsed['notes'],
+                is_public=False
+            )
+            
+            additions = []
+            for name, weight_kg, percentage in parsed['grain_bill']:
+                if grains.get(name):
+                    additions.append(GrainAddition(recipe=recipe, grain=grains[name], weight=weight_kg, percentage=percentage))
+            for name, weight_kg, boil_time, use in parsed['hop_schedule']:
+                if hops.get(name):
+                    additions.append(HopAddition(recipe=recipe, hop=hops[name], weight=weight_kg, boil_time=boil_time, use=use))
+            if parsed['yeast'] and yeasts.get(parsed['yeast'][0]):
+                additions.append(YeastAddition(recipe=recipe, yeast=yeasts[parsed['yeast'][0]], amount=parsed['yeast'][1]))
+            
+            rows.append((recipe, additions))
         
-        return Grain.objects.create(
-            name=grain_name,
-            grain_type=grain_type,
-            color=color,
-            extract_potential=extract_potential,
-            description=f'AI generated grain: {grain_name}'
-        )
-    except:
-        return None
+        recipes = create_recipes(rows)
+        
+        saved = []
+        for (recipe, additions), parsed in zip(rows, parsed_recipes):
+            grains_added = sum(isinstance(addition, GrainAddition) for addition in additions)
+            hops_added = sum(isinstance(addition, HopAddition) for addition in additions)
+            
+            # Without grains or hops the expected stats from the generator are kept
+            expected_stats = parsed['expected_stats']
+            if not grains_added and not hops_added and expected_stats:
+                for field, key in [('calculated_og', 'og'), ('calculated_fg', 'fg'), ('calculated_ibu', 'ibu'),
+                                   ('calculated_abv', 'abv'), ('calculated_srm', 'srm')]:
+                    setattr(recipe, field, expected_stats.get(key))
+                recipe.save(update_fields=CALCULATED_FIELDS)
+            
+            saved.append((recipe, {
+                'grains_added': grains_added,
+                'hops_added': hops_added,
+                'yeast_added': sum(isinstance(addition, YeastAddition) for addition in additions),
+                'recipe_url': f'/recipes/{recipe.pk}/'
+            }))
+    
+    return saved
 
-def find_or_create_hop(hop_name):
-    """Find or create hop based on name"""
-    # Try exact match first
-    try:
-        return Hop.objects.get(name__iexact=hop_name)
-    except Hop.DoesNotExist:
-        pass
+# UTILITY FUNCTIONS FOR AI INGREDIENT MATCHING
+
+def build_grain(grain_name):
+    """Unsaved grain for a name that is not in the catalog"""
+    # Determine grain type based on name
+    grain_type = 'base'
+    color = 2
+    extract_potential = 37
     
-    # Try partial match
-    try:
-        return Hop.objects.filter(name__icontains=hop_name.split()[0]).first()
-    except:
-        pass
+    grain_lower = grain_name.lower()
+    if any(word in grain_lower for word in ['crystal', 'caramel']):
+        grain_type = 'crystal'
+        color = 40
+        extract_potential = 34
+    elif any(word in grain_lower for word in ['chocolate', 'roasted', 'black']):
+        grain_type = 'roasted'
+        color = 300
+        extract_potential = 32
+    elif 'munich' in grain_lower:
+        grain_type = 'base'
+        color = 9
+        extract_potential = 37
     
-    # Create new hop if not found
-    try:
-        # Determine hop type and alpha acid based on name
+    return Grain(
+        name=grain_name[:100],
+        grain_type=grain_type,
+        color=color,
+        extract_potential=extract_potential,
+        description=f'AI generated grain: {grain_name}'
+    )
+
+def build_hop(hop_name):
+    """Unsaved hop for a name that is not in the catalog"""
+    # Determine hop type and alpha acid based on name
+    hop_type = 'dual'
+    alpha_acid = 5.0
+    
+    hop_lower = hop_name.lower()
+    if any(word in hop_lower for word in ['chinook', 'magnum', 'warrior']):
+        hop_type = 'bittering'
+        alpha_acid = 12.0
+    elif any(word in hop_lower for word in ['citra', 'mosaic', 'amarillo']):
+        hop_type = 'aroma'
+        alpha_acid = 8.0
+    elif any(word in hop_lower for word in ['cascade', 'centennial']):
         hop_type = 'dual'
-        alpha_acid = 5.0
-        
-        hop_lower = hop_name.lower()
-        if any(word in hop_lower for word in ['chinook', 'magnum', 'warrior']):
-            hop_type = 'bittering'
-            alpha_acid = 12.0
-        elif any(word in hop_lower for word in ['citra', 'mosaic', 'amarillo']):
-            hop_type = 'aroma'
-            alpha_acid = 8.0
-        elif any(word in hop_lower for word in ['cascade', 'centennial']):
-            hop_type = 'dual'
-            alpha_acid = 6.0
-        
-        return Hop.objects.create(
-            name=hop_name,
-            hop_type=hop_type,
-            alpha_acid=alpha_acid,
-            description=f'AI generated hop: {hop_name}'
-        )
-    except:
-        return None
+        alpha_acid = 6.0
+    
+    return Hop(
+        name=hop_name[:100],
+        hop_type=hop_type,
+        alpha_acid=alpha_acid,
+        description=f'AI generated hop: {hop_name}'
+    )
+
+def build_yeast(yeast_name):
+    """Unsaved yeast for a name that is not in the catalog"""
+    # Determine yeast properties based on name
+    yeast_type = 'ale'
+    attenuation = 75.0
+    temp_min = 18
+    temp_max = 24
+    laboratory = 'Generic'
+    strain_number = 'AI-001'
+    
+    yeast_lower = yeast_name.lower()
+    if 'lager' in yeast_lower:
+        yeast_type = 'lager'
+        attenuation = 80.0
+        temp_min = 10
+        temp_max = 15
+    elif 'wheat' in yeast_lower:
+        yeast_type = 'wheat'
+        attenuation = 72.0
+    elif 'us-05' in yeast_lower:
+        laboratory = 'Safale'
+        strain_number = 'US-05'
+    elif 's-04' in yeast_lower:
+        laboratory = 'Safale'
+        strain_number = 'S-04'
+        attenuation = 78.0
+    
+    return Yeast(
+        name=yeast_name[:100],
+        laboratory=laboratory,
+        strain_number=strain_number,
+        yeast_type=yeast_type,
+        attenuation=attenuation,
+        temp_range_min=temp_min,
+        temp_range_max=temp_max,
+        description=f'AI generated yeast: {yeast_name}'
+    )
+
+def resolve_ingredients(grain_names, hop_names, yeast_names):
+    """
+    Resolve all ingredient names of a recipe through the in-memory name
+    index, creating missing ones with one bulk insert per type. Returns
+    ({name: Grain}, {name: Hop}, {name: Yeast}).
+    """
+    index = ingredient_index()
+    return (
+        index.resolve_or_create('grain', grain_names, build_grain),
+        index.resolve_or_create('hop', hop_names, build_hop),
+        index.resolve_or_create('yeast', yeast_names, build_yeast),
+    )
+
+def find_or_create_grain(grain_name):
+    """Find or create grain based on name"""
+    return ingredient_index().resolve_or_create('grain', [grain_name], build_grain)[grain_name]
+
+def find_or_create_hop(hop_name):
+    """Find or create hop based on name"""
+    return ingredient_index().resolve_or_create('hop', [hop_name], build_hop)[hop_name]
 
 def find_or_create_yeast(yeast_name):
     """Find or create yeast based on name"""
-    # Try partial match first
-    try:
-        return Yeast.objects.filter(name__icontains=yeast_name.split()[0]).first()
-    except:
-        pass
-    
-    # Create new yeast if not found
-    try:
-        # Determine yeast properties based on name
-        yeast_type = 'ale'
-        attenuation = 75.0
-        temp_min = 18
-        temp_max = 24
-        laboratory = 'Generic'
-        strain_number = 'AI-001'
-        
-        yeast_lower = yeast_name.lower()
-        if 'lager' in yeast_lower:
-            yeast_type = 'lager'
-            attenuation = 80.0
-            temp_min = 10
-            temp_max = 15
-        elif 'wheat' in yeast_lower:
-            yeast_type = 'wheat'
-            attenuation = 72.0
-        elif 'us-05' in yeast_lower:
-            laboratory = 'Safale'
-            strain_number = 'US-05'
-        elif 's-04' in yeast_lower:
-            laboratory = 'Safale'
-            strain_number = 'S-04'
-            attenuation = 78.0
-        
-        return Yeast.objects.create(
-            name=yeast_name,
-            laboratory=laboratory,
-            strain_number=strain_number,
-            yeast_type=yeast_type,
-            attenuation=attenuation,
-            temp_range_min=temp_min,
-            temp_range_max=temp_max,
-            description=f'AI generated yeast: {yeast_name}'
-        )
-    except:
-        return None
+    return ingredient_index().resolve_or_create('yeast', [yeast_name], build_yeast)[yeast_name]
     
 @login_required
 def save_generated_recipe(request):
@@ -824,60 +1181,62 @@ def save_generated_recipe(request):
                 notes="\n".join(data['instructions'])
             )
             
+            # Resolve all ingredients through the name index, creating missing ones
+            index = ingredient_index()
+            grains = index.resolve_or_create(
+                'grain', [grain_data['name'] for grain_data in data['grain_bill']],
+                lambda name: Grain(
+                    name=name,
+                    grain_type=get_grain_type(name),
+                    color=get_grain_color(name),
+                    extract_potential=37,  # Default
+                    description=f"Generated grain: {name}"
+                )
+            )
+            hops = index.resolve_or_create(
+                'hop', [hop_data['name'] for hop_data in data['hop_schedule']],
+                lambda name: Hop(
+                    name=name,
+                    hop_type=get_hop_type(name),
+                    alpha_acid=get_hop_alpha(name),
+                    description=f"Generated hop: {name}"
+                )
+            )
+            yeast_name = data['yeast'].split()[0] + ' ' + data['yeast'].split()[1]
+            yeast = index.resolve_or_create(
+                'yeast', [yeast_name],
+                lambda name: Yeast(
+                    name=name,
+                    laboratory='Safale',
+                    strain_number=name.split()[-1],
+                    yeast_type='ale',
+                    attenuation=75.0,
+                    temp_range_min=18,
+                    temp_range_max=24,
+                    description=f"Generated yeast: {name}"
+                )
+            )[yeast_name]
+            
             # Add grain additions
             for grain_data in data['grain_bill']:
-                # Try to find existing grain or create new one
-                grain, created = Grain.objects.get_or_create(
-                    name=grain_data['name'],
-                    defaults={
-                        'grain_type': get_grain_type(grain_data['name']),
-                        'color': get_grain_color(grain_data['name']),
-                        'extract_potential': 37,  # Default
-                        'description': f"Generated grain: {grain_data['name']}"
-                    }
-                )
-                
                 GrainAddition.objects.create(
                     recipe=recipe,
-                    grain=grain,
+                    grain=grains[grain_data['name']],
                     weight=grain_data['weight'],
                     percentage=grain_data['percentage']
                 )
             
             # Add hop additions
             for hop_data in data['hop_schedule']:
-                hop, created = Hop.objects.get_or_create(
-                    name=hop_data['name'],
-                    defaults={
-                        'hop_type': get_hop_type(hop_data['name']),
-                        'alpha_acid': get_hop_alpha(hop_data['name']),
-                        'description': f"Generated hop: {hop_data['name']}"
-                    }
-                )
-                
                 HopAddition.objects.create(
                     recipe=recipe,
-                    hop=hop,
+                    hop=hops[hop_data['name']],
                     weight=hop_data['weight'] / 1000,  # Convert g to kg
                     boil_time=hop_data['time'],
                     use='boil' if hop_data['time'] > 0 else 'dry_hop'
                 )
             
             # Add yeast
-            yeast_name = data['yeast'].split()[0] + ' ' + data['yeast'].split()[1]
-            yeast, created = Yeast.objects.get_or_create(
-                name=yeast_name,
-                defaults={
-                    'laboratory': 'Safale',
-                    'strain_number': yeast_name.split()[-1],
-                    'yeast_type': 'ale',
-                    'attenuation': 75.0,
-                    'temp_range_min': 18,
-                    'temp_range_max': 24,
-                    'description': f"Generated yeast: {yeast_name}"
-                }
-            )
-            
             YeastAddition.objects.create(
                 recipe=recipe,
                 yeast=yeast,